@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+手机文件传输: 原来每个文件、每条命令启动一个adb进程的实现与 device_io.AdbDevice 的耗时和adb进程数对比
+使用 fake_adb.py 模拟adb(本地目录作为手机存储, FAKE_ADB_LAUNCH_SECONDS 模拟每次启动adb进程的开销);
+每个任务: 拉取视频、推送结果图片、清理视频目录(目录中积累了 --files 个视频); 最后再拉取一次相同的视频(任务重试)
+
+用法(在仓库根目录运行):
+    python -m benchmarks.bench_adb_transfer --jobs 3 --files 50 --video-mb 8 --launch-ms 50
+"""
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+from device_io import AdbDevice
+
+FAKE_ADB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_adb.py')
+VIDEO_DIR = '/sdcard/DCIM/WeiXin'
+IMAGE_DIR = '/storage/emulated/0/Pictures/WeiXin'
+
+
+def clear_mp4_files_in_directory_legacy(directory_path):
+    """
+    原实现: 列出文件后逐个rm, 再单独广播媒体扫描
+    """
+    list_result = subprocess.run(['adb', 'shell', 'ls', f'{directory_path}/*.mp4'], capture_output=True, text=True)
+    if list_result.returncode != 0:
+        return
+    file_list = list_result.stdout.strip().split('\n')
+    if file_list == ['']:
+        return
+    for file in file_list:
+        if file.strip():
+            subprocess.run(['adb', 'shell', 'rm', f'"{file}"'], capture_output=True, text=True)
+    subprocess.run(['adb', 'shell', 'am', 'broadcast', '-a', 'android.intent.action.MEDIA_SCANNER_SCAN_FILE', '-d',
+                    f'file://{directory_path}'], capture_output=True, text=True)
+
+
+def pull_file_from_device_legacy(device_path, local_path):
+    subprocess.run(['adb', 'pull', device_path, local_path], capture_output=True, text=True)
+
+
+def push_file_to_device_legacy(local_path, device_path):
+    result = subprocess.run(['adb', 'push', local_path, device_path], capture_output=True, text=True)
+    if result.returncode == 0:
+        subprocess.run(['adb', 'shell', 'am', 'broadcast', '-a', 'android.intent.action.MEDIA_SCANNER_SCAN_FILE',
+                        '-d', f'file://{device_path}'], capture_output=True, text=True)
+
+
+class LegacyTransfer:
+    def pull(self, device_path, local_path):
+        pull_file_from_device_legacy(device_path, local_path)
+
+    def push(self, local_path, device_path):
+        push_file_to_device_legacy(local_path, device_path)
+
+    def clear_files(self, directory_path):
+        clear_mp4_files_in_directory_legacy(directory_path)
+
+    def close(self):
+        pass
+
+
+class BatchedTransfer:
+    def __init__(self):
+        self.adb = AdbDevice(adb_path=FAKE_ADB_PATH)
+
+    def pull(self, device_path, local_path):
+        self.adb.pull(device_path, local_path)
+
+    def push(self, local_path, device_path):
+        self.adb.push(local_path, device_path)
+
+    def clear_files(self, directory_path):
+        self.adb.clear_files(directory_path, '*.mp4')
+
+    def close(self):
+        self.adb.close()
+
+
+def fill_device(root, args, job):
+    video_dir = root + VIDEO_DIR
+    os.makedirs(video_dir, exist_ok=True)
+    for i in range(args.files):
+        with open(os.path.join(video_dir, f"old_{job}_{i}.mp4"), 'wb') as f:
+            f.write(b'\0' * 1024)
+    video_name = f"job_{job}.mp4"
+    with open(os.path.join(video_dir, video_name), 'wb') as f:
+        f.write(os.urandom(int(args.video_mb * 1024 * 1024)))
+    return f"{VIDEO_DIR}/{video_name}"
+
+
+def measure(args, make_transfer):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = os.path.join(tmp_dir, 'device')
+        local_dir = os.path.join(tmp_dir, 'local')
+        os.makedirs(local_dir)
+        log_path = os.path.join(tmp_dir, 'adb.log')
+        # 原实现直接调用PATH中的adb
+        bin_dir = os.path.join(tmp_dir, 'bin')
+        os.makedirs(bin_dir)
+        os.symlink(FAKE_ADB_PATH, os.path.join(bin_dir, 'adb'))
+        env_backup = dict(os.environ)
+        os.environ.update({'FAKE_ADB_ROOT': root, 'FAKE_ADB_LOG': log_path,
+                           'FAKE_ADB_LAUNCH_SECONDS': str(args.launch_ms / 1000),
+                           'PATH': bin_dir + os.pathsep + os.environ.get('PATH', '')})
+        image_path = os.path.join(local_dir, 'result.jpg')
+        with open(image_path, 'wb') as f:
+            f.write(os.urandom(800 * 1024))
+
+        transfer = make_transfer()
+        job_seconds = []
+        try:
+            for job in range(args.jobs):
+                video_path = fill_device(root, args, job)
+                local_video_path = os.path.join(local_dir, video_path.split('/')[-1])
+                start_time = time.perf_counter()
+                transfer.pull(video_path, local_video_path)
+                transfer.push(image_path, f"{IMAGE_DIR}/result_{job}.jpg")
+                # 重试的任务再次拉取同一个视频
+                transfer.pull(video_path, local_video_path)
+                transfer.clear_files(VIDEO_DIR)
+                job_seconds.append(time.perf_counter() - start_time)
+            left_files = len(os.listdir(root + VIDEO_DIR))
+        finally:
+            transfer.close()
+            os.environ.clear()
+            os.environ.update(env_backup)
+        with open(log_path) as f:
+            lines = f.read().splitlines()
+    processes = sum(line.startswith('adb ') for line in lines)
+    broadcasts = sum(line.startswith('am ') for line in lines)
+    return job_seconds, processes, broadcasts, left_files
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=3)
+    parser.add_argument('--files', type=int, default=50, help='每个任务开始时视频目录中已有的视频数')
+    parser.add_argument('--video-mb', type=float, default=8, help='拉取的视频大小')
+    parser.add_argument('--launch-ms', type=float, default=50, help='每次启动adb进程的额外耗时')
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'job mean':>10}{'adb processes':>15}{'media scans':>13}{'files left':>12}")
+    for name, make_transfer in [('legacy', LegacyTransfer), ('batched', BatchedTransfer)]:
+        job_seconds, processes, broadcasts, left_files = measure(args, make_transfer)
+        print(f"{name:<10}{sum(job_seconds) / len(job_seconds):>9.2f}s{processes:>15}{broadcasts:>13}"
+              f"{left_files:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Appium会话: 每次手机操作新建WXAppOperator(原实现, 每次都重新启动微信)与WXSessionManager复用同一个会话的每个任务耗时
+使用 fake_webdriver_server 中的本地WebDriver替身, 每个任务依次: 回复排队位置、保存并下载视频、发送结果和图片;
+不传输文件(NullAdb); --expire-after-commands 让会话定期失效, 用于检查自动重新连接
+
+用法(在仓库根目录运行, 需要安装 Appium-Python-Client):
+    python -m benchmarks.bench_appium_session --jobs 5 --launch-seconds 3 --transition-seconds 0.3
+    python -m benchmarks.bench_appium_session --jobs 5 --expire-after-commands 40
+"""
+import argparse
+import time
+
+from wx_watcher import WXAppOperator, WXSessionManager, WXDevice
+from benchmarks.fake_webdriver_server import FakeWebDriverServer
+
+
+class NullAdb:
+    """
+    不传输文件, 只测量Appium会话的开销
+    """
+    def pull(self, device_path, local_path):
+        return False
+
+    def push(self, local_path, device_path, scan=True):
+        return False
+
+    def clear_files(self, directory_path, pattern='*.mp4'):
+        return []
+
+    def close(self):
+        pass
+
+
+class PerOperationSessions:
+    """
+    原实现: 每次操作新建会话(启动微信), 操作完成后关闭
+    """
+    def __init__(self, appium_server_url):
+        self.appium_server_url = appium_server_url
+
+    def run(self, func):
+        wx_operator = WXAppOperator(self.appium_server_url)
+        try:
+            return func(wx_operator)
+        finally:
+            wx_operator.close()
+
+    def close(self):
+        pass
+
+
+def run_job(device, chat_room_name):
+    """
+    一个任务中的手机操作, 与 JobService 中的顺序相同
+    """
+    device.send_text(chat_room_name, "收到, 当前排在第1位, 请稍等")
+    video = device.fetch_video(chat_room_name)
+    if video is None:
+        device.send_text(chat_room_name, "请发送30秒左右的网球视频")
+    else:
+        device.send_result(chat_room_name, "【动作】:正手\n【评分】:80分", "/tmp/result.jpg")
+
+
+def measure(args, make_sessions):
+    chats = {f"user{i}": i % 4 != 3 for i in range(args.jobs)}
+    server = FakeWebDriverServer(chats, launch_seconds=args.launch_seconds,
+                                 transition_seconds=args.transition_seconds, command_seconds=args.command_seconds,
+                                 expire_after_commands=args.expire_after_commands).start()
+    sessions = make_sessions(server.url)
+    device = WXDevice(local_video_dir="/tmp", sessions=sessions, adb=NullAdb())
+    job_seconds = []
+    failed = 0
+    try:
+        for chat_room_name in chats:
+            start_time = time.perf_counter()
+            try:
+                run_job(device, chat_room_name)
+            except Exception as error:
+                # 重新连接后仍然失败的任务
+                print(f"{chat_room_name} failed: {type(error).__name__}")
+                failed += 1
+            job_seconds.append(time.perf_counter() - start_time)
+    finally:
+        device.close()
+        server.stop()
+    return job_seconds, failed, server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=5)
+    parser.add_argument('--launch-seconds', type=float, default=3.0, help='创建会话(启动微信)的耗时')
+    parser.add_argument('--transition-seconds', type=float, default=0.3, help='页面切换的耗时')
+    parser.add_argument('--command-seconds', type=float, default=0.02, help='每个WebDriver命令的往返耗时')
+    parser.add_argument('--expire-after-commands', type=int, default=0, help='大于0时会话执行这么多命令后失效')
+    args = parser.parse_args()
+
+    modes = [
+        ('per_operation', PerOperationSessions),
+        ('session_manager', lambda url: WXSessionManager(url)),
+    ]
+    results = []
+    for name, make_sessions in modes:
+        job_seconds, failed, server = measure(args, make_sessions)
+        results.append((name, job_seconds, failed, server))
+    print(f"{'mode':<18}{'job mean':>10}{'first job':>11}{'later mean':>12}{'sessions':>10}{'commands':>10}"
+          f"{'failed':>8}{'messages':>10}")
+    for name, job_seconds, failed, server in results:
+        later = job_seconds[1:] or job_seconds
+        print(f"{name:<18}{sum(job_seconds) / len(job_seconds):>9.2f}s{job_seconds[0]:>10.2f}s"
+              f"{sum(later) / len(later):>11.2f}s{server.sessions_created:>10}{server.commands:>10}"
+              f"{failed:>8}{len(server.messages):>10}")
+
+
+if __name__ == "__main__":
+    main()
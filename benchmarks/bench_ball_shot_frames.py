@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+击球帧检测: 原逐帧 .iloc 循环实现与数组实现的耗时对比, 使用合成的球轨迹
+
+用法(在仓库根目录运行):
+    python -m benchmarks.bench_ball_shot_frames --frames 1000 10000 100000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from trackers import BallTracker
+from utils import DetectionTable
+
+
+def make_synthetic_ball_positions(num_frames, seed=0):
+    """
+    生成在两名球员之间来回飞行的球轨迹, 每个回合的时长随机, 纵坐标带少量噪声
+    :return: DetectionTable
+    """
+    rng = np.random.default_rng(seed)
+    mid_y = np.empty(num_frames)
+    frame_num = 0
+    going_down = True
+    while frame_num < num_frames:
+        rally_frames = int(rng.integers(40, 90))
+        start_y, end_y = (150.0, 850.0) if going_down else (850.0, 150.0)
+        segment = np.linspace(start_y, end_y, rally_frames)
+        end_frame = min(num_frames, frame_num + rally_frames)
+        mid_y[frame_num:end_frame] = segment[:end_frame - frame_num]
+        frame_num = end_frame
+        going_down = not going_down
+    mid_y += rng.normal(0, 2.0, num_frames)
+    mid_x = 960 + rng.normal(0, 50.0, num_frames)
+    bbox = np.stack([mid_x - 5, mid_y - 5, mid_x + 5, mid_y + 5], axis=1)
+    return DetectionTable(np.arange(num_frames), np.ones(num_frames), bbox)
+
+
+def get_ball_shot_frames_legacy(ball_positions):
+    """
+    原实现: 逐帧嵌套循环 + pandas .iloc 标量访问
+    :param ball_positions: [{1: [x1, y1, x2, y2]}, ...]
+    """
+    ball_positions = [x.get(1, []) for x in ball_positions]
+    df_ball_positions = pd.DataFrame(ball_positions, columns=['x1', 'y1', 'x2', 'y2'])
+
+    df_ball_positions['ball_hit'] = 0
+
+    df_ball_positions['mid_y'] = (df_ball_positions['y1'] + df_ball_positions['y2']) / 2
+    df_ball_positions['mid_y_rolling_mean'] = df_ball_positions['mid_y'].rolling(window=5, min_periods=1,
+                                                                                 center=False).mean()
+    df_ball_positions['delta_y'] = df_ball_positions['mid_y_rolling_mean'].diff()
+    ball_hit_column = df_ball_positions.columns.get_loc('ball_hit')
+    minimum_change_frames_for_hit = 25
+    for i in range(1, len(df_ball_positions) - int(minimum_change_frames_for_hit * 1.2)):
+        negative_position_change = df_ball_positions['delta_y'].iloc[i] > 0 and df_ball_positions['delta_y'].iloc[i + 1] < 0
+        positive_position_change = df_ball_positions['delta_y'].iloc[i] < 0 and df_ball_positions['delta_y'].iloc[i + 1] > 0
+
+        if negative_position_change or positive_position_change:
+            change_count = 0
+            for change_frame in range(i + 1, i + int(minimum_change_frames_for_hit * 1.2) + 1):
+                negative_position_change_following_frame = df_ball_positions['delta_y'].iloc[i] > 0 and \
+                                                           df_ball_positions['delta_y'].iloc[change_frame] < 0
+                positive_position_change_following_frame = df_ball_positions['delta_y'].iloc[i] < 0 and \
+                                                           df_ball_positions['delta_y'].iloc[change_frame] > 0
+
+                if negative_position_change and negative_position_change_following_frame:
+                    change_count += 1
+                elif positive_position_change and positive_position_change_following_frame:
+                    change_count += 1
+
+            if change_count > minimum_change_frames_for_hit - 1:
+                # 原实现使用链式赋值, 这里改为 iloc 赋值以便在新版 pandas 下得到同样的结果
+                df_ball_positions.iloc[i, ball_hit_column] = 1
+
+    return df_ball_positions[df_ball_positions['ball_hit'] == 1].index.tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--legacy-max-frames', type=int, default=10000,
+                        help='超过该帧数时跳过原实现, 避免运行数分钟')
+    args = parser.parse_args()
+
+    ball_tracker = BallTracker(model_path=None)
+    for num_frames in args.frames:
+        ball_positions = make_synthetic_ball_positions(num_frames)
+
+        start_time = time.perf_counter()
+        shot_frames = ball_tracker.get_ball_shot_frames(ball_positions)
+        vectorized_seconds = time.perf_counter() - start_time
+        line = f"frames={num_frames:>7}: vectorized {vectorized_seconds * 1000:9.1f} ms, hits={len(shot_frames)}"
+
+        if num_frames <= args.legacy_max_frames:
+            start_time = time.perf_counter()
+            legacy_shot_frames = get_ball_shot_frames_legacy(ball_positions.to_dicts())
+            legacy_seconds = time.perf_counter() - start_time
+            line += f" | legacy {legacy_seconds * 1000:9.1f} ms ({legacy_seconds / vectorized_seconds:.0f}x), " \
+                    f"identical={legacy_shot_frames == shot_frames}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
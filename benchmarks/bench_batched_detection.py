@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+逐帧推理与批量推理的吞吐量对比
+
+用法(在仓库根目录运行):
+    python -m benchmarks.bench_batched_detection --video input_videos/input_video.mp4 --frames 120
+"""
+import argparse
+import time
+from itertools import islice
+
+from utils import VideoFrameReader
+from trackers import PlayerTracker
+from trackers import BallTracker
+
+
+def run_detection(tracker, frames, batch_size):
+    """
+    运行一次检测并计时
+    :return: (检测结果, 耗时秒数)
+    """
+    start_time = time.perf_counter()
+    detections = tracker.detect_frames(frames, batch_size=batch_size)
+    return detections, time.perf_counter() - start_time
+
+
+def count_track_id_switches(per_frame_detections, batched_detections):
+    """
+    统计批量模式下与逐帧模式track id集合不一致的帧数
+    """
+    return sum(1 for frame_num in range(per_frame_detections.num_frames)
+               if set(per_frame_detections.get_frame(frame_num).track_id.tolist()) !=
+               set(batched_detections.get_frame(frame_num).track_id.tolist()))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--video', default='input_videos/input_video.mp4')
+    parser.add_argument('--frames', type=int, default=120, help='参与测试的帧数')
+    parser.add_argument('--player-model', default='yolov8x.pt')
+    parser.add_argument('--ball-model', default='models/yolov5_tennis_ball_best.pt')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    frames = list(islice(VideoFrameReader(args.video), args.frames))
+    print(f"frames: {len(frames)}, shape: {frames[0].shape}")
+
+    for name, tracker_cls, model_path in [("player", PlayerTracker, args.player_model),
+                                          ("ball", BallTracker, args.ball_model)]:
+        tracker = tracker_cls(model_path=model_path)
+        # 预热一次, 排除模型首次推理的初始化开销
+        tracker.detect_frame(frames[0])
+
+        baseline = None
+        for batch_size in args.batch_sizes:
+            # 每种batch大小都从干净的跟踪状态开始, 避免track id互相影响
+            if hasattr(tracker, 'reset_tracking'):
+                tracker.reset_tracking()
+
+            detections, elapsed = run_detection(tracker, frames, batch_size)
+            fps = len(frames) / elapsed
+            if baseline is None:
+                baseline = (detections, fps)
+                print(f"[{name}] batch_size={batch_size}: {fps:.2f} fps")
+            else:
+                mismatched = count_track_id_switches(baseline[0], detections)
+                print(f"[{name}] batch_size={batch_size}: {fps:.2f} fps "
+                      f"({fps / baseline[1]:.2f}x), track id mismatched frames: {mismatched}")
+
+
+if __name__ == "__main__":
+    main()
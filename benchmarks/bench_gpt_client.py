@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+GPT请求: 原来每次新建连接、没有超时和重试的requests.post与AzureOpenAIClient(连接池、并发上限、退避重试、异步接口)
+在并发请求下的延迟和吞吐量对比; 使用 mock_gpt_server 中的本地接口替身, 不需要网络和API key
+--max-in-flight 让模拟服务在并发超过上限时返回429, 用于观察按retry-after等待的重试
+
+用法(在仓库根目录运行, 需要安装 requests):
+    python -m benchmarks.bench_gpt_client --requests 32 --concurrency 8 --latency-ms 300 --connect-ms 100
+    python -m benchmarks.bench_gpt_client --requests 32 --concurrency 8 --max-in-flight 4 --error-rate 0.1
+"""
+import argparse
+import asyncio
+import base64
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from openai.azure_openai import AzureOpenAIClient, SYSTEM_PROMPT
+from benchmarks.mock_gpt_server import MockGPTServer
+
+
+def send_image_and_text_to_gpt_legacy(endpoint, image_path, text):
+    """
+    原实现: 整张图片读入内存编码, 每次请求新建连接, 没有超时和重试
+    """
+    encoded_image = base64.b64encode(open(image_path, 'rb').read()).decode('ascii')
+    payload = {
+        "messages": [
+            {"role": "system", "content": [{"type": "text", "text": SYSTEM_PROMPT}]},
+            {"role": "user", "content": [{"type": "text", "text": text},
+                                         {"type": "image_url",
+                                          "image_url": {"url": f"data:image/jpeg;base64,{encoded_image}"}}]}
+        ],
+        "temperature": 0.7, "top_p": 0.95, "max_tokens": 800
+    }
+    response = requests.post(endpoint, headers={"Content-Type": "application/json", "api-key": "xxxxx"},
+                             json=payload)
+    response.raise_for_status()
+    return str(response.json()['choices'][0]['message']['content'])
+
+
+def timed(func, *args):
+    start_time = time.perf_counter()
+    try:
+        func(*args)
+        return time.perf_counter() - start_time, True
+    except Exception:
+        return time.perf_counter() - start_time, False
+
+
+def run_threads(func, args, num_requests, concurrency):
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(lambda _: timed(func, *args), range(num_requests)))
+
+
+async def run_async(client, image_path, text, num_requests):
+    async def timed_async():
+        start_time = time.perf_counter()
+        try:
+            await client.send_image_and_text_async(image_path, text)
+            return time.perf_counter() - start_time, True
+        except Exception:
+            return time.perf_counter() - start_time, False
+    return await asyncio.gather(*[timed_async() for _ in range(num_requests)])
+
+
+def measure(args, mode, image_path):
+    server = MockGPTServer(latency_seconds=args.latency_ms / 1000, connect_seconds=args.connect_ms / 1000,
+                           max_in_flight=args.max_in_flight, retry_after_ms=args.retry_after_ms,
+                           error_rate=args.error_rate).start()
+    text = "提供了一组网球运动员的动作照片"
+    client = AzureOpenAIClient(base_url=server.url, max_concurrency=args.concurrency, backoff_seconds=0.1)
+    start_time = time.perf_counter()
+    try:
+        if mode == 'legacy':
+            results = run_threads(send_image_and_text_to_gpt_legacy, (client.endpoint, image_path, text),
+                                  args.requests, args.concurrency)
+        elif mode == 'client':
+            results = run_threads(client.send_image_and_text, (image_path, text), args.requests, args.concurrency)
+        else:
+            results = asyncio.run(run_async(client, image_path, text, args.requests))
+        total_seconds = time.perf_counter() - start_time
+    finally:
+        client.close()
+        server.stop()
+    return total_seconds, results, server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=32)
+    parser.add_argument('--concurrency', type=int, default=8, help='同时发出的请求数')
+    parser.add_argument('--image-kb', type=int, default=800, help='图片大小, 与save_frames_to_grid_image的目标大小一致')
+    parser.add_argument('--latency-ms', type=float, default=300, help='模拟服务处理每个请求的耗时')
+    parser.add_argument('--connect-ms', type=float, default=100, help='模拟服务建立每个新连接的耗时')
+    parser.add_argument('--max-in-flight', type=int, default=0, help='大于0时并发超过该数量返回429')
+    parser.add_argument('--retry-after-ms', type=int, default=200)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回500的比例')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_path = os.path.join(tmp_dir, 'grid.jpg')
+        with open(image_path, 'wb') as f:
+            f.write(os.urandom(args.image_kb * 1024))
+
+        print(f"{'mode':<14}{'total':>8}{'req/s':>8}{'p50':>8}{'p95':>8}{'ok':>6}{'connections':>13}"
+              f"{'429s':>6}{'500s':>6}")
+        for mode in ['legacy', 'client', 'client_async']:
+            total_seconds, results, server = measure(args, mode, image_path)
+            latencies = sorted(seconds for seconds, ok in results)
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            num_ok = sum(ok for _, ok in results)
+            print(f"{mode:<14}{total_seconds:>7.2f}s{num_ok / total_seconds:>8.1f}"
+                  f"{statistics.median(latencies):>7.2f}s{p95:>7.2f}s{num_ok:>6}{server.connections:>13}"
+                  f"{server.rate_limited:>6}{server.errors:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+任务服务: 多个用户先后触发分析时, 逐个处理(原wx_watcher的轮询循环)与JobService按资源并发处理的对比
+触发接口、手机、推理和GPT请求都使用 job_service.local_stand_ins 中的本地替身, 各步骤的耗时由参数指定;
+统计每个用户从触发到收到排队回复、到收到分析结果的时间, 以及手机同时进行的最大操作数(应为1)
+
+用法(在仓库根目录运行):
+    python -m benchmarks.bench_job_service --users 8 --interval 0.5 --render-seconds 1.0 --review-seconds 1.5
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from job_service import JobService, JobStore
+from job_service.job_service import ACK_MSG
+from job_service.local_stand_ins import LocalTrigger, LocalDevice, LocalAnalyzer
+
+
+async def run_service(service, trigger):
+    """
+    运行服务直到所有用户都已触发, 任务和后台回复全部完成
+    """
+    run_task = asyncio.create_task(service.run())
+    while service.stop_event is None or not trigger.is_exhausted():
+        await asyncio.sleep(0.02)
+    await service.wait_idle()
+    while service.background_tasks:
+        await asyncio.sleep(0.02)
+    service.stop()
+    await run_task
+
+
+def measure(args, max_active_jobs, resource_limits):
+    arrivals = [(i * args.interval, f"user{i}") for i in range(args.users)]
+    trigger = LocalTrigger(arrivals)
+    device = LocalDevice(fetch_seconds=args.fetch_seconds, send_seconds=args.send_seconds)
+    analyzer = LocalAnalyzer(render_seconds=args.render_seconds, review_seconds=args.review_seconds)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = JobStore(os.path.join(tmp_dir, 'job_queue.json'), max_pending=args.max_pending)
+        service = JobService(trigger, device, analyzer.render, analyzer.review, store=store,
+                             resource_limits=resource_limits, max_active_jobs=max_active_jobs,
+                             poll_interval=0.05)
+        start_time = time.time()
+        asyncio.run(run_service(service, trigger))
+        total_seconds = time.time() - start_time
+
+    ack_prefix = ACK_MSG.split('{')[0]
+    ack_latencies, result_latencies = [], []
+    for chat_room_name, arrival_time in trigger.arrival_times.items():
+        messages = [(t, msg) for t, name, msg in device.messages if name == chat_room_name]
+        acks = [t for t, msg in messages if msg.startswith(ack_prefix)]
+        results = [t for t, msg in messages if not msg.startswith(ack_prefix)]
+        if acks:
+            ack_latencies.append(acks[0] - arrival_time)
+        if results:
+            result_latencies.append(results[-1] - arrival_time)
+    return total_seconds, ack_latencies, result_latencies, device.max_in_flight, service.get_stats()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--interval', type=float, default=0.5, help='相邻两个用户触发的间隔(秒)')
+    parser.add_argument('--fetch-seconds', type=float, default=0.3, help='在手机上保存并下载视频的耗时')
+    parser.add_argument('--send-seconds', type=float, default=0.1, help='在手机上发送一条消息的耗时')
+    parser.add_argument('--render-seconds', type=float, default=1.0, help='本地推理的耗时')
+    parser.add_argument('--review-seconds', type=float, default=1.5, help='GPT请求的耗时')
+    parser.add_argument('--max-pending', type=int, default=20, help='队列长度上限, 超过时拒绝新任务')
+    args = parser.parse_args()
+
+    modes = [
+        ('sequential', 1, {'device': 1, 'inference': 1, 'remote_api': 1}),
+        ('job_service', 4, None),
+    ]
+    print(f"{'mode':<14}{'total':>9}{'ack mean':>10}{'ack max':>9}{'result mean':>13}{'result max':>12}"
+          f"{'device max':>12}  completed/failed/rejected")
+    for name, max_active_jobs, resource_limits in modes:
+        total_seconds, ack_latencies, result_latencies, device_max, stats = measure(args, max_active_jobs,
+                                                                                    resource_limits)
+
+        def mean(values):
+            return sum(values) / len(values) if values else 0.0
+
+        print(f"{name:<14}{total_seconds:>8.2f}s{mean(ack_latencies):>9.2f}s{max(ack_latencies, default=0):>8.2f}s"
+              f"{mean(result_latencies):>12.2f}s{max(result_latencies, default=0):>11.2f}s{device_max:>12}"
+              f"  {stats['completed']}/{stats['failed']}/{stats['rejected']}")
+
+
+if __name__ == "__main__":
+    main()
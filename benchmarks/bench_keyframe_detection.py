@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+球员稀疏关键帧检测: 不同关键帧间隔下的速度与精度
+以逐帧检测的结果为基准, 每个基准框取同一帧中IoU最大的框, 统计平均IoU和IoU>=0.5的召回率
+
+用法(在仓库根目录运行):
+    python -m benchmarks.bench_keyframe_detection --video input_videos/input_video.mp4 --frames 300 --intervals 1 3 5 10
+"""
+import argparse
+import time
+from itertools import islice
+
+import numpy as np
+
+from utils import VideoFrameReader, get_iou_matrix
+from trackers import PlayerTracker
+from trackers.keyframe_propagator import KeyframePropagator
+
+
+def compare_detections(reference, detections):
+    """
+    :return: (平均IoU, IoU>=0.5的召回率)
+    """
+    best_ious = []
+    for frame_num in range(reference.num_frames):
+        reference_boxes = reference.get_frame(frame_num).bbox
+        if len(reference_boxes) == 0:
+            continue
+        boxes = detections.get_frame(frame_num).bbox
+        if len(boxes) == 0:
+            best_ious.append(np.zeros(len(reference_boxes)))
+        else:
+            best_ious.append(get_iou_matrix(reference_boxes, boxes).max(axis=1))
+    if not best_ious:
+        return float('nan'), float('nan')
+    best_ious = np.concatenate(best_ious)
+    return float(best_ious.mean()), float((best_ious >= 0.5).mean())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--video', default='input_videos/input_video.mp4')
+    parser.add_argument('--frames', type=int, default=300, help='参与测试的帧数')
+    parser.add_argument('--player-model', default='yolov8x.pt')
+    parser.add_argument('--intervals', type=int, nargs='+', default=[1, 3, 5, 10])
+    parser.add_argument('--batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    frames = list(islice(VideoFrameReader(args.video), args.frames))
+    print(f"frames: {len(frames)}, shape: {frames[0].shape}")
+
+    tracker = PlayerTracker(model_path=args.player_model)
+    # 预热一次, 排除模型首次推理的初始化开销
+    tracker.detect_frame(frames[0])
+
+    baseline = None
+    for interval in sorted(set(args.intervals) | {1}):
+        tracker.keyframe_propagator = KeyframePropagator(tracker.detect_frame, interval) if interval > 1 else None
+        tracker.reset_tracking()
+
+        start_time = time.perf_counter()
+        detections = tracker.detect_frames(frames, batch_size=args.batch_size)
+        fps = len(frames) / (time.perf_counter() - start_time)
+        if baseline is None:
+            baseline = (detections, fps)
+            print(f"keyframe_interval=1: {fps:.2f} fps, {len(detections)} boxes")
+            continue
+
+        mean_iou, recall = compare_detections(baseline[0], detections)
+        stats = tracker.keyframe_propagator.get_stats()
+        print(f"keyframe_interval={interval}: {fps:.2f} fps ({fps / baseline[1]:.2f}x), "
+              f"keyframes {stats['keyframes']}/{len(frames)}, mean IoU {mean_iou:.3f}, recall@0.5 {recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+迷你球场坐标映射: 原逐帧逐点实现与数组实现的耗时对比, 使用合成的球员和网球轨迹
+同时给出homography映射方式的耗时(结果与player_height方式不同, 不参与比较)
+
+用法(在仓库根目录运行):
+    python -m benchmarks.bench_mini_court_projection --frames 1000 10000 100000
+"""
+import argparse
+import time
+
+import numpy as np
+
+import constants
+from mini_court import MiniCourt
+from utils import (DetectionTable,
+                   get_center_of_bbox,
+                   get_closest_keypoint_index,
+                   get_foot_position,
+                   get_height_of_bbox,
+                   measure_distance)
+
+
+def make_synthetic_detections(num_frames, seed=0):
+    """
+    生成两名在底线附近移动的球员和来回飞行的网球, 球员2偶尔没有检测结果
+    :return: (球员DetectionTable, 网球DetectionTable, 球场关键点)
+    """
+    rng = np.random.default_rng(seed)
+    frame_nums = []
+    track_ids = []
+    bboxes = []
+    for player_id, base_y, height in [(1, 250.0, 120.0), (2, 800.0, 260.0)]:
+        x = 960 + np.cumsum(rng.normal(0, 4.0, num_frames))
+        y = base_y + np.cumsum(rng.normal(0, 2.0, num_frames))
+        h = height + rng.normal(0, 8.0, num_frames)
+        visible = np.ones(num_frames, dtype=bool) if player_id == 1 else rng.random(num_frames) > 0.05
+        frames = np.flatnonzero(visible)
+        frame_nums.append(frames)
+        track_ids.append(np.full(len(frames), player_id))
+        bboxes.append(np.stack([x - 30, y - h, x + 30, y], axis=1)[frames])
+    order = np.argsort(np.concatenate(frame_nums), kind='stable')
+    player_boxes = DetectionTable(np.concatenate(frame_nums)[order], np.concatenate(track_ids)[order],
+                                  np.concatenate(bboxes)[order], num_frames=num_frames)
+
+    ball_y = 500 + 300 * np.sin(np.arange(num_frames) / 30)
+    ball_x = 960 + rng.normal(0, 80.0, num_frames)
+    ball_boxes = DetectionTable(np.arange(num_frames), np.ones(num_frames),
+                                np.stack([ball_x - 5, ball_y - 5, ball_x + 5, ball_y + 5], axis=1))
+
+    # CourtLineDetector输出float32
+    court_keypoints = np.array([500, 150, 1420, 150, 300, 950, 1620, 950, 600, 150, 420, 950, 1320, 150,
+                                1500, 950, 620, 300, 1300, 300, 450, 800, 1470, 800, 960, 300, 960, 800],
+                               dtype=np.float32)
+    return player_boxes, ball_boxes, court_keypoints
+
+
+def convert_bounding_boxes_to_mini_court_coordinates_legacy(mini_court, player_boxes, ball_boxes,
+                                                             original_court_key_points):
+    """
+    原实现: 每名球员每一帧重新收集前后70帧的检测框高度取最大值, 再逐点调用标量的坐标换算
+    :param player_boxes: [{player_id: [x1, y1, x2, y2]}, ...]
+    :param ball_boxes: [{1: [x1, y1, x2, y2]}, ...]
+    """
+    player_heights = {
+        1: constants.PLAYER_1_HEIGHT_METERS,
+        2: constants.PLAYER_2_HEIGHT_METERS
+    }
+
+    output_player_boxes = []
+    output_ball_boxes = []
+
+    for frame_num, player_bbox in enumerate(player_boxes):
+        ball_box = ball_boxes[frame_num][1]
+        ball_position = get_center_of_bbox(ball_box)
+        closest_player_id_to_ball = min(player_bbox.keys(),
+                                        key=lambda x: measure_distance(ball_position, get_center_of_bbox(player_bbox[x])))
+
+        output_player_bboxes_dict = {}
+        for player_id, bbox in player_bbox.items():
+            foot_position = get_foot_position(bbox)
+
+            closest_key_point_index = get_closest_keypoint_index(foot_position, original_court_key_points, [0, 2, 12, 13])
+            closest_key_point = (original_court_key_points[closest_key_point_index * 2],
+                                 original_court_key_points[closest_key_point_index * 2 + 1])
+
+            frame_index_min = max(0, frame_num - 20)
+            frame_index_max = min(len(player_boxes), frame_num + 50)
+            bboxes_heights_in_pixels = []
+            for i in range(frame_index_min, frame_index_max):
+                other_bbox = player_boxes[i].get(player_id)
+                if other_bbox is not None:
+                    bboxes_heights_in_pixels.append(get_height_of_bbox(other_bbox))
+            if bboxes_heights_in_pixels:
+                max_player_height_in_pixels = max(bboxes_heights_in_pixels)
+            else:
+                max_player_height_in_pixels = 0
+
+            output_player_bboxes_dict[player_id] = mini_court.get_mini_court_coordinates(
+                foot_position, closest_key_point, closest_key_point_index, max_player_height_in_pixels,
+                player_heights[player_id])
+
+            if closest_player_id_to_ball == player_id:
+                closest_key_point_index = get_closest_keypoint_index(ball_position, original_court_key_points,
+                                                                     [0, 2, 12, 13])
+                closest_key_point = (original_court_key_points[closest_key_point_index * 2],
+                                     original_court_key_points[closest_key_point_index * 2 + 1])
+                output_ball_boxes.append({1: mini_court.get_mini_court_coordinates(
+                    ball_position, closest_key_point, closest_key_point_index, max_player_height_in_pixels,
+                    player_heights[player_id])})
+        output_player_boxes.append(output_player_bboxes_dict)
+
+    return output_player_boxes, output_ball_boxes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--legacy-max-frames', type=int, default=10000,
+                        help='超过该帧数时跳过原实现, 避免运行数分钟')
+    args = parser.parse_args()
+
+    mini_court = MiniCourt(np.zeros((1080, 1920, 3), dtype=np.uint8))
+    homography_mini_court = MiniCourt(np.zeros((1080, 1920, 3), dtype=np.uint8), projection='homography')
+    for num_frames in args.frames:
+        player_boxes, ball_boxes, court_keypoints = make_synthetic_detections(num_frames)
+
+        start_time = time.perf_counter()
+        player_positions, ball_positions = mini_court.convert_bounding_boxes_to_mini_court_coordinates(
+            player_boxes, ball_boxes, court_keypoints)
+        vectorized_seconds = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        mini_court.project_to_mini_court(player_boxes, ball_boxes, court_keypoints)
+        array_seconds = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        homography_mini_court.project_to_mini_court(player_boxes, ball_boxes, court_keypoints)
+        homography_seconds = time.perf_counter() - start_time
+        line = f"frames={num_frames:>7}: vectorized {vectorized_seconds * 1000:9.1f} ms " \
+               f"(arrays only {array_seconds * 1000:7.1f} ms, homography {homography_seconds * 1000:7.1f} ms)"
+
+        if num_frames <= args.legacy_max_frames:
+            start_time = time.perf_counter()
+            legacy_positions = convert_bounding_boxes_to_mini_court_coordinates_legacy(
+                mini_court, player_boxes.to_dicts(), ball_boxes.to_dicts(), court_keypoints)
+            legacy_seconds = time.perf_counter() - start_time
+            line += f" | legacy {legacy_seconds * 1000:9.1f} ms ({legacy_seconds / vectorized_seconds:.0f}x), " \
+                    f"identical={legacy_positions == (player_positions, ball_positions)}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
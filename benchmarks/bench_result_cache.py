@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+结果缓存: 用户反复转发同一批视频时, 每次都重新分析与使用 result_cache.ResultCache 的耗时对比
+本地推理和GPT请求用sleep模拟(耗时由参数指定), 视频是随机内容的文件; 命中时的耗时主要是计算视频哈希,
+视频由adb拉取时哈希已经在传输中算好(utils.remember_file_hash), 这里分别统计两种情况
+
+用法(在仓库根目录运行):
+    python -m benchmarks.bench_result_cache --videos 5 --requests 20 --video-mb 20 --render-seconds 3 --review-seconds 5
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from result_cache import ResultCache
+from utils import new_file_hasher, remember_file_hash
+
+
+class SimulatedAnalysis:
+    """
+    模拟 render_action_image / review_action_image, 生成的图片写到临时目录
+    """
+    def __init__(self, image_dir, render_seconds, review_seconds, image_kb=800):
+        self.image_dir = image_dir
+        self.render_seconds = render_seconds
+        self.review_seconds = review_seconds
+        self.image_kb = image_kb
+        self.calls = 0
+
+    def render(self, video_path):
+        self.calls += 1
+        time.sleep(self.render_seconds)
+        image_path = os.path.join(self.image_dir, os.path.basename(video_path) + '.jpg')
+        with open(image_path, 'wb') as f:
+            f.write(os.urandom(self.image_kb * 1024))
+        return image_path
+
+    def review(self, image_path):
+        time.sleep(self.review_seconds)
+        return f"【动作】:正手\n【评分】:80分 ({os.path.basename(image_path)})"
+
+
+def process_video(analysis, video_path, result_cache=None):
+    """
+    与 video_to_images_demo.process_video_by_ai 相同的流程
+    """
+    if result_cache is not None:
+        cached_result = result_cache.get(video_path)
+        if cached_result is not None:
+            return cached_result
+    image_path = analysis.render(video_path)
+    response_msg = analysis.review(image_path)
+    if result_cache is not None:
+        return result_cache.put(video_path, response_msg, image_path)
+    return response_msg, image_path
+
+
+def pull_video(source_path, local_path):
+    """
+    模拟 AdbDevice.pull: 复制文件的同时计算哈希
+    """
+    hasher = new_file_hasher()
+    with open(source_path, 'rb') as src, open(local_path, 'wb') as dst:
+        for chunk in iter(lambda: src.read(1024 * 1024), b''):
+            hasher.update(chunk)
+            dst.write(chunk)
+    remember_file_hash(local_path, hasher.hexdigest())
+
+
+def measure(args, tmp_dir, use_cache, pulled):
+    device_dir = os.path.join(tmp_dir, 'device')
+    run_dir = os.path.join(tmp_dir, f"run_{int(use_cache)}_{int(pulled)}")
+    image_dir = os.path.join(run_dir, 'images')
+    os.makedirs(image_dir)
+    analysis = SimulatedAnalysis(image_dir, args.render_seconds, args.review_seconds)
+    result_cache = ResultCache(os.path.join(run_dir, 'cache'), {'prompt': 'bench'}) if use_cache else None
+
+    random_generator = random.Random(0)
+    latencies = []
+    for i in range(args.requests):
+        video_name = f"video_{random_generator.randrange(args.videos)}.mp4"
+        # 每次任务都重新拉取到本地(新的文件), 缓存只能按内容识别
+        local_path = os.path.join(run_dir, f"{i}_{video_name}")
+        if pulled:
+            pull_video(os.path.join(device_dir, video_name), local_path)
+        else:
+            with open(os.path.join(device_dir, video_name), 'rb') as src, open(local_path, 'wb') as dst:
+                dst.write(src.read())
+        start_time = time.perf_counter()
+        process_video(analysis, local_path, result_cache)
+        latencies.append(time.perf_counter() - start_time)
+    stats = result_cache.get_stats() if result_cache is not None else {'hits': 0}
+    return latencies, analysis.calls, stats['hits']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--videos', type=int, default=5, help='不同视频的数量')
+    parser.add_argument('--requests', type=int, default=20, help='分析请求数, 从这些视频中随机选择')
+    parser.add_argument('--video-mb', type=float, default=20)
+    parser.add_argument('--render-seconds', type=float, default=3.0, help='本地推理的耗时')
+    parser.add_argument('--review-seconds', type=float, default=5.0, help='GPT请求的耗时')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        device_dir = os.path.join(tmp_dir, 'device')
+        os.makedirs(device_dir)
+        for i in range(args.videos):
+            with open(os.path.join(device_dir, f"video_{i}.mp4"), 'wb') as f:
+                f.write(os.urandom(int(args.video_mb * 1024 * 1024)))
+
+        print(f"{'mode':<18}{'total':>9}{'mean':>9}{'hit mean':>11}{'analyses':>10}{'hits':>6}")
+        for name, use_cache, pulled in [('no_cache', False, False), ('cache', True, False),
+                                        ('cache_adb_pulled', True, True)]:
+            latencies, calls, hits = measure(args, tmp_dir, use_cache, pulled)
+            fast = [seconds for seconds in latencies if seconds < args.render_seconds]
+            hit_mean = f"{statistics.mean(fast) * 1000:>9.1f}ms" if fast else f"{'-':>11}"
+            print(f"{name:<18}{sum(latencies):>8.2f}s{statistics.mean(latencies):>8.2f}s{hit_mean}"
+                  f"{calls:>10}{hits:>6}")
+
+
+if __name__ == "__main__":
+    main()
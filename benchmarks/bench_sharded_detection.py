@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+多进程分段检测的扩展性: 不同进程数下的吞吐量, 以及与单进程结果的一致性
+检测框应与单进程完全相同, track id经过接续后应与单进程的track id一一对应
+
+用法(在仓库根目录运行):
+    python -m benchmarks.bench_sharded_detection --video input_videos/input_video.mp4 --workers 1 2 4 8
+"""
+import argparse
+import time
+
+import numpy as np
+
+from utils import VideoFrameReader
+from trackers import PlayerTracker, BallTracker, detect_players_and_ball_sharded
+
+
+def count_id_pairs(reference, detections):
+    """
+    :return: 检测框相同时 (单进程track id, 分段track id) 不同组合的个数, 完全一致时等于单进程的track数
+    """
+    if not np.array_equal(reference.bbox, detections.bbox):
+        return None
+    return len(set(zip(reference.track_id.tolist(), detections.track_id.tolist())))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--video', default='input_videos/input_video.mp4')
+    parser.add_argument('--player-model', default='yolov8x.pt')
+    parser.add_argument('--ball-model', default='models/yolo5_last.pt')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--overlap-frames', type=int, default=30)
+    parser.add_argument('--batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    num_frames = len(VideoFrameReader(args.video))
+    player_tracker = PlayerTracker(model_path=args.player_model)
+    ball_tracker = BallTracker(model_path=args.ball_model)
+
+    start_time = time.perf_counter()
+    reference_players = player_tracker.detect_frames(VideoFrameReader(args.video), batch_size=args.batch_size)
+    reference_balls = ball_tracker.detect_frames(VideoFrameReader(args.video), batch_size=args.batch_size)
+    baseline = num_frames / (time.perf_counter() - start_time)
+    print(f"single process: {baseline:.2f} fps, {len(np.unique(reference_players.track_id))} player tracks")
+
+    for workers in args.workers:
+        start_time = time.perf_counter()
+        players, balls = detect_players_and_ball_sharded(args.video, player_tracker, ball_tracker, workers=workers,
+                                                         overlap_frames=args.overlap_frames,
+                                                         batch_size=args.batch_size)
+        fps = num_frames / (time.perf_counter() - start_time)
+        same_balls = np.array_equal(reference_balls.frame, balls.frame) and \
+            np.array_equal(reference_balls.bbox, balls.bbox)
+        print(f"workers={workers}: {fps:.2f} fps ({fps / baseline:.2f}x), same ball boxes: {same_balls}, "
+              f"player id pairs: {count_id_pairs(reference_players, players)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+整个处理流程分阶段的耗时和峰值内存, 使用合成的球场视频和确定性的模型替身(见 synthetic_court), 不需要模型文件和GPU
+结果与保存的基线比较, 耗时或内存超过基线 tolerance 以上的阶段标记为回退, 有回退时退出码为1
+
+用法(在仓库根目录运行):
+    python -m benchmarks.bench_stages --frames 240 --width 1280 --height 720 --save-baseline   # 记录基线
+    python -m benchmarks.bench_stages --frames 240 --width 1280 --height 720                   # 与基线比较
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from utils import save_video, draw_player_stats, LazyModule
+from court_line_detector import CourtKeypointTracker
+from mini_court import MiniCourt
+from match_stats import MatchStatsEngine
+from benchmarks.synthetic_court import write_synthetic_video, create_mock_trackers
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baselines', 'stages.json')
+
+cv2 = LazyModule('cv2')
+
+
+def read_video(video_path):
+    """
+    原实现: 把整个视频解码进内存, 只用于测量read_video阶段的耗时和内存, 不要用在完整的比赛视频上
+    """
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def get_stages(video_path, output_path, fps, batch_size, codec):
+    """
+    按main.py的顺序列出各阶段, 每个阶段读取前面阶段的结果并把自己的结果写入context
+    :return: [(阶段名, 函数(context)), ...]
+    """
+    def read(context):
+        context['frames'] = read_video(video_path)
+
+    def create_models(context):
+        context['player_tracker'], context['ball_tracker'], context['court_line_detector'] = create_mock_trackers()
+
+    def detect_players(context):
+        context['player_detections'] = context['player_tracker'].detect_frames(context['frames'], batch_size)
+
+    def detect_ball(context):
+        context['ball_detections'] = context['ball_tracker'].detect_frames(context['frames'], batch_size)
+
+    def detect_court_keypoints(context):
+        court_keypoint_tracker = CourtKeypointTracker(context['court_line_detector'], batch_size=batch_size)
+        context['court_keypoints'] = court_keypoint_tracker.detect_frames(context['frames'])
+
+    def choose_players(context):
+        context['player_detections'] = context['player_tracker'].choose_and_filter_players(
+            context['court_keypoints'][0], context['player_detections'])
+
+    def interpolate_ball_positions(context):
+        context['ball_detections'] = context['ball_tracker'].interpolate_ball_positions(context['ball_detections'])
+
+    def get_ball_shot_frames(context):
+        context['ball_shot_frames'] = context['ball_tracker'].get_ball_shot_frames(context['ball_detections'], fps=fps)
+
+    def convert_to_mini_court(context):
+        context['mini_court'] = MiniCourt(context['frames'][0])
+        context['player_mini_court'], context['ball_mini_court'] = \
+            context['mini_court'].convert_bounding_boxes_to_mini_court_coordinates(
+                context['player_detections'], context['ball_detections'], context['court_keypoints'])
+
+    def match_stats(context):
+        engine = MatchStatsEngine(fps, context['mini_court'].get_width_of_mini_court())
+        engine.add_shots(context['ball_shot_frames'], context['player_mini_court'], context['ball_mini_court'])
+        context['player_stats'] = engine.to_dataframe(len(context['frames']))
+
+    def draw_player_bboxes(context):
+        context['frames'] = context['player_tracker'].draw_bboxes(context['frames'], context['player_detections'])
+
+    def draw_ball_bboxes(context):
+        context['frames'] = context['ball_tracker'].draw_bboxes(context['frames'], context['ball_detections'])
+
+    def draw_court_keypoints(context):
+        context['frames'] = context['court_line_detector'].draw_keypoints_on_video(context['frames'],
+                                                                                   context['court_keypoints'])
+
+    def draw_mini_court(context):
+        mini_court = context['mini_court']
+        frames = mini_court.draw_mini_court(context['frames'])
+        frames = mini_court.draw_points_on_mini_court(frames, context['player_mini_court'])
+        context['frames'] = mini_court.draw_points_on_mini_court(frames, context['ball_mini_court'],
+                                                                 color=(0, 255, 255))
+
+    def draw_stats(context):
+        context['frames'] = draw_player_stats(context['frames'], context['player_stats'])
+
+    def save(context):
+        save_video(context['frames'], output_path, fps=fps, codec=codec)
+
+    return [
+        ('read_video', read),
+        ('create_models', create_models),
+        ('detect_players', detect_players),
+        ('detect_ball', detect_ball),
+        ('detect_court_keypoints', detect_court_keypoints),
+        ('choose_players', choose_players),
+        ('interpolate_ball_positions', interpolate_ball_positions),
+        ('get_ball_shot_frames', get_ball_shot_frames),
+        ('convert_to_mini_court', convert_to_mini_court),
+        ('match_stats', match_stats),
+        ('draw_player_bboxes', draw_player_bboxes),
+        ('draw_ball_bboxes', draw_ball_bboxes),
+        ('draw_court_keypoints', draw_court_keypoints),
+        ('draw_mini_court', draw_mini_court),
+        ('draw_player_stats', draw_stats),
+        ('save_video', save),
+    ]
+
+
+def run_stages(stages, trace_memory=False):
+    """
+    依次运行所有阶段
+    :param trace_memory: 为True时用tracemalloc统计每个阶段新增的峰值内存(numpy数组也计入), 耗时会变长, 只取内存
+    :return: {阶段名: 秒数或峰值MB}
+    """
+    context = {}
+    results = {}
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        for name, stage in stages:
+            if trace_memory:
+                tracemalloc.reset_peak()
+                start_memory = tracemalloc.get_traced_memory()[0]
+                stage(context)
+                results[name] = (tracemalloc.get_traced_memory()[1] - start_memory) / 1024 ** 2
+            else:
+                start_time = time.perf_counter()
+                stage(context)
+                results[name] = time.perf_counter() - start_time
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return results
+
+
+def measure_stages(stages, repeat=3, trace_memory=True):
+    """
+    :return: {阶段名: {'seconds': 多次运行中的最短耗时, 'peak_mb': 峰值内存}}
+    """
+    runs = [run_stages(stages) for _ in range(repeat)]
+    memory = run_stages(stages, trace_memory=True) if trace_memory else {}
+    return {name: {'seconds': min(run[name] for run in runs), 'peak_mb': memory.get(name)}
+            for name, _ in stages}
+
+
+def is_regression(value, baseline, tolerance, min_difference):
+    # 相对变化超过tolerance且绝对变化超过min_difference才算回退, 避免很快的阶段因噪声误报
+    if value is None or baseline is None:
+        return False
+    return value > baseline * (1 + tolerance) and value - baseline > min_difference
+
+
+def compare_with_baseline(results, baseline, tolerance, min_seconds, min_mb):
+    """
+    打印每个阶段的结果和基线
+    :return: 回退的阶段名列表
+    """
+    regressions = []
+    print(f"{'stage':<28}{'seconds':>10}{'baseline':>10}{'change':>9}{'peak MB':>10}{'baseline':>10}")
+    for name, result in results.items():
+        base = baseline.get(name, {})
+        seconds, base_seconds = result['seconds'], base.get('seconds')
+        peak_mb, base_peak_mb = result['peak_mb'], base.get('peak_mb')
+        flags = []
+        if is_regression(seconds, base_seconds, tolerance, min_seconds):
+            flags.append('SLOWER')
+        if is_regression(peak_mb, base_peak_mb, tolerance, min_mb):
+            flags.append('MORE MEMORY')
+        if flags:
+            regressions.append(name)
+        change = f"{(seconds / base_seconds - 1) * 100:+.0f}%" if base_seconds else ''
+        print(f"{name:<28}{seconds:>10.3f}{format_value(base_seconds, '.3f'):>10}{change:>9}"
+              f"{format_value(peak_mb, '.1f'):>10}{format_value(base_peak_mb, '.1f'):>10}  {' '.join(flags)}")
+    total = sum(result['seconds'] for result in results.values())
+    print(f"{'total':<28}{total:>10.3f}")
+    return regressions
+
+
+def format_value(value, spec):
+    return '-' if value is None else format(value, spec)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=240)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--fps', type=int, default=24)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--codec', default=None, help='save_video的编码方式, 为None时按扩展名(.mp4)选择')
+    parser.add_argument('--repeat', type=int, default=3, help='计时的运行次数, 取每个阶段的最短耗时')
+    parser.add_argument('--no-memory', action='store_true', help='不统计峰值内存')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为当前配置的基线')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='允许的相对变化')
+    parser.add_argument('--min-seconds', type=float, default=0.01, help='小于该耗时变化不算回退')
+    parser.add_argument('--min-mb', type=float, default=1.0, help='小于该内存变化不算回退')
+    args = parser.parse_args()
+
+    # 基线按视频配置区分
+    config = f"{args.frames}x{args.width}x{args.height}@{args.fps},batch={args.batch_size},codec={args.codec}"
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video_path = os.path.join(temp_dir, 'synthetic.avi')
+        rally = write_synthetic_video(video_path, args.frames, args.width, args.height, args.fps)
+        print(f"{config}: {len(rally.shot_frames)} synthetic shots")
+        stages = get_stages(video_path, os.path.join(temp_dir, 'output.mp4'), args.fps, args.batch_size, args.codec)
+        results = measure_stages(stages, repeat=args.repeat, trace_memory=not args.no_memory)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+    regressions = compare_with_baseline(results, baselines.get(config, {}), args.tolerance, args.min_seconds,
+                                        args.min_mb)
+
+    if args.save_baseline:
+        baselines[config] = results
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"baseline saved to {args.baseline}")
+    elif config not in baselines:
+        print(f"no baseline for this configuration in {args.baseline}, run with --save-baseline first")
+    elif regressions:
+        print(f"regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+入口脚本的启动耗时: 在新的解释器中导入 main / demo / wx_watcher 等模块, 统计导入耗时和进程总耗时,
+并列出导入后已经加载的重型库(cv2、pandas、torch、ultralytics等); 重型库应在真正使用模型或编解码时才导入
+
+用法(在仓库根目录运行):
+    python -m benchmarks.bench_startup --modules main demo wx_watcher --repeat 5
+    python -m benchmarks.bench_startup --modules main --top 15    # 同时列出 -X importtime 中最慢的导入
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ['cv2', 'pandas', 'torch', 'torchvision', 'ultralytics', 'requests', 'appium', 'selenium']
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start_time = time.perf_counter()
+error = None
+try:
+    import {module}
+except Exception as e:
+    error = f"{{type(e).__name__}}: {{e}}"
+seconds = time.perf_counter() - start_time
+print(json.dumps({{'seconds': seconds, 'error': error,
+                  'heavy': [name for name in {heavy} if name in sys.modules]}}))
+"""
+
+
+def measure_import(module, python=sys.executable):
+    """
+    在新的进程中导入模块
+    :return: (进程总耗时, 导入结果 {'seconds', 'error', 'heavy'})
+    """
+    script = IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES)
+    start_time = time.perf_counter()
+    output = subprocess.run([python, '-c', script], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    wall_seconds = time.perf_counter() - start_time
+    return wall_seconds, json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def get_slowest_imports(module, top, python=sys.executable):
+    """
+    :return: -X importtime 中累计耗时最长的导入 [(毫秒, 模块名), ...]
+    """
+    output = subprocess.run([python, '-X', 'importtime', '-c', f"import {module}"], cwd=REPO_ROOT,
+                            capture_output=True, text=True)
+    imports = []
+    for line in output.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative) / 1000, name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modules', nargs='+', default=['main', 'demo', 'wx_watcher'])
+    parser.add_argument('--repeat', type=int, default=5, help='每个模块导入的次数, 取中位数')
+    parser.add_argument('--top', type=int, default=0, help='大于0时列出最慢的导入')
+    args = parser.parse_args()
+
+    # 空解释器的启动耗时, 作为参照
+    baseline = statistics.median(measure_import('sys')[0] for _ in range(args.repeat))
+    print(f"{'interpreter':<24}{'':>12}{baseline * 1000:>12.0f} ms")
+    print(f"{'module':<24}{'import':>12}{'process':>12}  heavy modules loaded")
+    for module in args.modules:
+        runs = [measure_import(module) for _ in range(args.repeat)]
+        import_seconds = statistics.median(result['seconds'] for _, result in runs)
+        wall_seconds = statistics.median(wall for wall, _ in runs)
+        result = runs[-1][1]
+        heavy = ', '.join(result['heavy']) or '-'
+        line = f"{module:<24}{import_seconds * 1000:>9.0f} ms{wall_seconds * 1000:>9.0f} ms  {heavy}"
+        if result['error']:
+            line += f"  (import failed: {result['error']})"
+        print(line)
+        for milliseconds, name in get_slowest_imports(module, args.top) if args.top > 0 else []:
+            print(f"    {milliseconds:>9.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+视频编码: 原同步MJPG写入与后台VideoEncoder各编码方式的耗时和文件大小对比
+使用合成的球场画面(静止背景 + 移动的球员和网球), --render-ms 模拟每帧绘制的耗时,
+用来观察编码与绘制重叠后的总耗时
+
+用法(在仓库根目录运行):
+    python -m benchmarks.bench_video_encoder --frames 300 --size 1280 720 --render-ms 10
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from utils import VIDEO_CODECS, VideoEncoder
+from utils.video_writer import get_ffmpeg_path
+
+
+def make_synthetic_frames(num_frames, width, height, seed=0):
+    """
+    生成带噪点的绿色场地、白色球场线和移动的色块, 噪点避免编码器把画面压缩得过于理想
+    """
+    rng = np.random.default_rng(seed)
+    background = np.empty((height, width, 3), dtype=np.uint8)
+    background[:] = (60, 140, 70)
+    background = cv2.add(background, rng.integers(0, 12, background.shape, dtype=np.uint8))
+    cv2.rectangle(background, (width // 8, height // 8), (width * 7 // 8, height * 7 // 8), (255, 255, 255), 3)
+    cv2.line(background, (width // 8, height // 2), (width * 7 // 8, height // 2), (255, 255, 255), 3)
+
+    frames = []
+    for frame_num in range(num_frames):
+        frame = background.copy()
+        player_x = int(width / 2 + width / 4 * np.sin(frame_num / 40))
+        ball_x = int(width / 2 + width / 3 * np.sin(frame_num / 15))
+        ball_y = int(height / 2 + height / 3 * np.cos(frame_num / 15))
+        cv2.rectangle(frame, (player_x - 30, height // 8), (player_x + 30, height // 8 + 120), (30, 30, 200), -1)
+        cv2.rectangle(frame, (player_x - 40, height * 3 // 4), (player_x + 40, height * 3 // 4 + 160),
+                      (200, 60, 30), -1)
+        cv2.circle(frame, (ball_x, ball_y), 8, (0, 255, 255), -1)
+        cv2.putText(frame, f"Frame: {frame_num}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        frames.append(frame)
+    return frames
+
+
+def render_frames(frames, render_ms):
+    # 模拟绘制阶段, sleep与OpenCV绘制一样会释放GIL
+    for frame in frames:
+        if render_ms:
+            time.sleep(render_ms / 1000)
+        yield frame
+
+
+def save_video_legacy(frames, output_path):
+    """
+    原实现: 在调用线程中同步写入MJPG, 帧率固定为24
+    """
+    frames = iter(frames)
+    first_frame = next(frames)
+    out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'MJPG'), 24,
+                          (first_frame.shape[1], first_frame.shape[0]))
+    out.write(first_frame)
+    for frame in frames:
+        out.write(frame)
+    out.release()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--size", type=int, nargs=2, default=[1280, 720], metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--render-ms", type=float, default=0.0, help="每帧模拟的绘制耗时")
+    parser.add_argument("--codecs", nargs="+", default=list(VIDEO_CODECS))
+    args = parser.parse_args()
+
+    frames = make_synthetic_frames(args.frames, *args.size)
+    print(f"{args.frames} frames {args.size[0]}x{args.size[1]}, render {args.render_ms}ms/frame, "
+          f"ffmpeg: {get_ffmpeg_path() or 'not found'}")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        output_path = os.path.join(output_dir, "legacy.avi")
+        start_time = time.perf_counter()
+        save_video_legacy(render_frames(frames, args.render_ms), output_path)
+        baseline = time.perf_counter() - start_time
+        baseline_size = os.path.getsize(output_path)
+        print(f"[legacy mjpg sync] {baseline:.2f}s, {baseline_size / 1e6:.2f} MB")
+
+        for codec in args.codecs:
+            extension = ".avi" if codec == "mjpg" else ".mp4"
+            output_path = os.path.join(output_dir, codec + extension)
+            start_time = time.perf_counter()
+            with VideoEncoder(output_path, fps=args.fps, codec=codec) as encoder:
+                for frame in render_frames(frames, args.render_ms):
+                    encoder.write(frame)
+            elapsed = time.perf_counter() - start_time
+            size = os.path.getsize(output_path)
+            stats = encoder.get_stats()
+            print(f"[{codec} -> {stats['codec']} background] {elapsed:.2f}s ({baseline / elapsed:.2f}x), "
+                  f"encode {stats['encode_seconds']:.2f}s, blocked {stats['blocked_seconds']:.2f}s, "
+                  f"{size / 1e6:.2f} MB ({size / baseline_size:.1%} of legacy)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+adb的本地替身, 用本地目录模拟手机存储, 用于在没有手机时测试和测量 device_io.AdbDevice 与原来的adb调用
+支持: pull / push / exec-out / shell(带命令或从标准输入读取命令的常驻shell), 忽略 -s SERIAL 和 -T
+命令中以 /sdcard 或 /storage 开头的路径映射到 FAKE_ADB_ROOT 下, 输出中再映射回设备路径; am 只记录广播不做任何事
+
+环境变量:
+    FAKE_ADB_ROOT            模拟手机存储的本地目录
+    FAKE_ADB_LOG             每次启动adb进程和每次媒体扫描广播都追加一行到该文件, 用于统计
+    FAKE_ADB_LAUNCH_SECONDS  每次启动adb进程的额外耗时, 模拟adb连接设备的开销, 默认0.05
+
+用法: AdbDevice(adb_path='benchmarks/fake_adb.py')
+"""
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.abspath(os.environ.get('FAKE_ADB_ROOT', '/tmp/fake_adb_root'))
+LOG_PATH = os.environ.get('FAKE_ADB_LOG')
+DEVICE_PATH_PATTERN = re.compile(r'''(?<![^\s"'=])(/sdcard|/storage)''')
+SHELL_PRELUDE = 'am() { [ -n "$FAKE_ADB_LOG" ] && echo "am $*" >> "$FAKE_ADB_LOG"; return 0; }\n'
+
+
+def log(line):
+    if LOG_PATH:
+        with open(LOG_PATH, 'a') as f:
+            f.write(line + "\n")
+
+
+def to_local(text):
+    return DEVICE_PATH_PATTERN.sub(lambda match: ROOT + match.group(1), text)
+
+
+def to_device(text):
+    return text.replace(ROOT, '')
+
+
+def run_shell_command(command, binary_output=False):
+    result = subprocess.run(['sh', '-c', SHELL_PRELUDE + to_local(command)], capture_output=True)
+    if binary_output:
+        sys.stdout.buffer.write(result.stdout)
+    else:
+        sys.stdout.write(to_device(result.stdout.decode('utf-8', errors='replace')))
+    sys.stderr.write(to_device(result.stderr.decode('utf-8', errors='replace')))
+    return result.returncode
+
+
+def run_persistent_shell():
+    """
+    从标准输入逐行读取命令交给同一个sh执行, 与 adb shell -T 的行为一致
+    """
+    process = subprocess.Popen(['sh'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    process.stdin.write(SHELL_PRELUDE.encode('utf-8'))
+
+    def forward_output():
+        for line in process.stdout:
+            sys.stdout.write(to_device(line.decode('utf-8', errors='replace')))
+            sys.stdout.flush()
+    output_thread = threading.Thread(target=forward_output, daemon=True)
+    output_thread.start()
+    for line in sys.stdin:
+        process.stdin.write(to_local(line).encode('utf-8'))
+        process.stdin.flush()
+    process.stdin.close()
+    process.wait()
+    output_thread.join()
+    return process.returncode
+
+
+def main(args):
+    log('adb ' + ' '.join(args))
+    time.sleep(float(os.environ.get('FAKE_ADB_LAUNCH_SECONDS', '0.05')))
+    if args[:1] == ['-s']:
+        args = args[2:]
+    command, args = args[0], args[1:]
+
+    if command == 'pull':
+        device_path, local_path = args
+        if not os.path.isfile(to_local(device_path)):
+            sys.stderr.write(f"adb: error: failed to stat remote object '{device_path}': No such file or directory\n")
+            return 1
+        shutil.copyfile(to_local(device_path), local_path)
+        print(f"{device_path}: 1 file pulled.")
+        return 0
+    if command == 'push':
+        local_path, device_path = args
+        os.makedirs(os.path.dirname(to_local(device_path)), exist_ok=True)
+        shutil.copyfile(local_path, to_local(device_path))
+        print(f"{local_path}: 1 file pushed.")
+        return 0
+    if command == 'exec-out':
+        return run_shell_command(' '.join(args), binary_output=True)
+    if command == 'shell':
+        args = [arg for arg in args if arg != '-T']
+        if not args:
+            return run_persistent_shell()
+        return run_shell_command(' '.join(args))
+    sys.stderr.write(f"fake adb: unsupported command {command}\n")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,268 @@
+"""
+本地的WebDriver(Appium)服务替身, 模拟微信中 wx_watcher 用到的几个页面, 用于在没有手机和Appium时测量会话开销
+实现W3C WebDriver协议中用到的命令: 创建/删除会话、查找元素、点击、输入、读取文本、页面源码、返回键和 mobile: 脚本
+创建会话模拟启动微信(launch_seconds), 页面切换模拟动画(transition_seconds), 其他命令有固定的往返耗时(command_seconds)
+"""
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ELEMENT_KEY = 'element-6066-11e4-a52e-4f735466cecf'
+WX_PACKAGE = 'com.tencent.mm'
+
+
+class NoSuchElement(Exception):
+    pass
+
+
+class FakeWXSession:
+    """
+    一个会话中的微信页面状态, 页面保存在栈中, 返回键出栈
+    """
+    def __init__(self, chats):
+        self.chats = chats
+        self.stack = [('chat_list', None)]
+        self.package = WX_PACKAGE
+        self.elements = {}
+        self.draft = ""
+        self.saved_video = None
+        self.commands = 0
+
+    @property
+    def screen(self):
+        return self.stack[-1][0]
+
+    @property
+    def chat_name(self):
+        for screen, chat_name in reversed(self.stack):
+            if screen == 'chat':
+                return chat_name
+        return None
+
+    def visible_locators(self):
+        """
+        :return: 当前页面可以找到的元素 [(using, value), ...]
+        """
+        screen = self.screen
+        if screen == 'chat_list':
+            return [('text', '微信')] + [('text', name) for name in self.chats]
+        if screen == 'chat':
+            locators = [('id', 'com.tencent.mm:id/bkk'), ('id', 'com.tencent.mm:id/bjz'), ('text', '发送')]
+            if self.chats.get(self.chat_name):
+                locators.append(('id', 'com.tencent.mm:id/boy'))
+            return locators
+        if screen == 'player':
+            locators = [('accessibility id', '更多信息')]
+            if self.saved_video:
+                locators.append(('accessibility id', '关闭'))
+            return locators
+        if screen == 'menu':
+            return [('text', '保存视频')]
+        if screen == 'panel':
+            return [('text', '相册')]
+        if screen == 'album':
+            return [('id', 'com.tencent.mm:id/jdh'), ('text', '发送(1)')]
+        return []
+
+    def find(self, using, value):
+        if using == 'xpath':
+            match = re.fullmatch(r'//\*\[@text="(.*)"\]', value)
+            if match is None:
+                raise NoSuchElement(value)
+            using, value = 'text', match.group(1)
+        locator = (using, value)
+        if locator not in self.visible_locators():
+            raise NoSuchElement(value)
+        element_id = uuid.uuid4().hex
+        self.elements[element_id] = locator
+        return element_id
+
+    def click(self, element_id, messages):
+        """
+        :return: 是否切换了页面
+        """
+        using, value = self.elements[element_id]
+        screen = self.screen
+        if screen == 'chat_list' and value in self.chats:
+            self.stack.append(('chat', value))
+        elif value == 'com.tencent.mm:id/boy':
+            self.saved_video = None
+            self.stack.append(('player', None))
+        elif value == '更多信息':
+            self.stack.append(('menu', None))
+        elif value == '保存视频':
+            self.stack.pop()
+            self.saved_video = f"/sdcard/DCIM/WeiXin/{self.chat_name}.mp4"
+        elif value == '关闭':
+            self.stack.pop()
+        elif value == '发送':
+            messages.append((time.time(), self.chat_name, self.draft))
+            self.draft = ""
+            return False
+        elif value == 'com.tencent.mm:id/bjz':
+            self.stack.append(('panel', None))
+        elif value == '相册':
+            self.stack[-1] = ('album', None)
+        elif value == '发送(1)':
+            self.stack.pop()
+            messages.append((time.time(), self.chat_name, '[image]'))
+        else:
+            return False
+        return True
+
+    def text(self, element_id):
+        using, value = self.elements[element_id]
+        return '00:10' if value == 'com.tencent.mm:id/boy' else ''
+
+    def page_source(self):
+        texts = [value for using, value in self.visible_locators() if using == 'text']
+        if self.screen == 'player' and self.saved_video:
+            texts.append(f"视频已保存至{self.saved_video}")
+        nodes = ''.join(f'<node text="{text}" clickable="true"/>' for text in texts)
+        return f'<?xml version="1.0" encoding="UTF-8"?><hierarchy>{nodes}</hierarchy>'
+
+
+class FakeWebDriverServer:
+    """
+    用法:
+        server = FakeWebDriverServer(chats={'user0': True}).start()
+        WXAppOperator(server.url) ...
+        server.stop()
+    :param chats: 聊天名称 -> 聊天中是否有视频
+    :param launch_seconds: 创建会话(启动微信)的耗时
+    :param transition_seconds: 页面切换的耗时
+    :param command_seconds: 每个命令的往返耗时
+    :param expire_after_commands: 大于0时每个会话执行这么多命令后失效, 用于模拟Appium重启或手机断开
+    """
+    def __init__(self, chats, launch_seconds=3.0, transition_seconds=0.3, command_seconds=0.02,
+                 expire_after_commands=0):
+        self.chats = chats
+        self.launch_seconds = launch_seconds
+        self.transition_seconds = transition_seconds
+        self.command_seconds = command_seconds
+        self.expire_after_commands = expire_after_commands
+        self.lock = threading.Lock()
+        self.sessions = {}
+        # [(发送时间, 聊天名称, 消息), ...]
+        self.messages = []
+
+        # 统计信息
+        self.sessions_created = 0
+        self.commands = 0
+        self.server = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        handler = type('Handler', (FakeWebDriverHandler,), {'fake_server': self})
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, method, path, body):
+        """
+        :return: (HTTP状态码, value)
+        """
+        time.sleep(self.command_seconds)
+        parts = path.strip('/').split('/')
+        if method == 'POST' and parts == ['session']:
+            time.sleep(self.launch_seconds)
+            session_id = uuid.uuid4().hex
+            with self.lock:
+                self.sessions[session_id] = FakeWXSession(self.chats)
+                self.sessions_created += 1
+            return 200, {'sessionId': session_id, 'capabilities': body.get('capabilities', {}).get('alwaysMatch', {})}
+        if not parts or parts[0] != 'session':
+            return 200, {'ready': True, 'message': 'fake webdriver'}
+
+        session_id, command = parts[1], parts[2:]
+        with self.lock:
+            self.commands += 1
+            session = self.sessions.get(session_id)
+            if session is not None:
+                session.commands += 1
+                if self.expire_after_commands and session.commands > self.expire_after_commands:
+                    del self.sessions[session_id]
+                    session = None
+        if session is None:
+            return 404, {'error': 'invalid session id', 'message': 'session is either terminated or not started'}
+        if method == 'DELETE' and not command:
+            with self.lock:
+                del self.sessions[session_id]
+            return 200, None
+
+        try:
+            with self.lock:
+                return 200, self.run_command(session, method, command, body)
+        except NoSuchElement as error:
+            return 404, {'error': 'no such element', 'message': f"element not found: {error}"}
+
+    def run_command(self, session, method, command, body):
+        if command in (['element'], ['elements']):
+            if command == ['element']:
+                return {ELEMENT_KEY: session.find(body['using'], body['value'])}
+            try:
+                return [{ELEMENT_KEY: session.find(body['using'], body['value'])}]
+            except NoSuchElement:
+                return []
+        if command[0] == 'element' and command[2:] == ['click']:
+            if session.click(command[1], self.messages):
+                time.sleep(self.transition_seconds)
+            return None
+        if command[0] == 'element' and command[2:] == ['value']:
+            session.draft += body.get('text', '')
+            return None
+        if command[0] == 'element' and command[2:] == ['text']:
+            return session.text(command[1])
+        if command == ['source']:
+            return session.page_source()
+        if command == ['back']:
+            if len(session.stack) > 1:
+                session.stack.pop()
+                time.sleep(self.transition_seconds)
+            return None
+        if command == ['execute', 'sync']:
+            script = body.get('script')
+            if script == 'mobile: getCurrentPackage':
+                return session.package
+            if script == 'mobile: activateApp':
+                session.package = WX_PACKAGE
+                return None
+        return None
+
+
+class FakeWebDriverHandler(BaseHTTPRequestHandler):
+    fake_server = None
+
+    def _respond(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+        status, value = self.fake_server.handle(method, self.path, body)
+        data = json.dumps({'value': value}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._respond('GET')
+
+    def do_POST(self):
+        self._respond('POST')
+
+    def do_DELETE(self):
+        self._respond('DELETE')
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,119 @@
+"""
+本地的Azure OpenAI接口替身, 用于在没有网络和API key时测试 openai.azure_openai 的客户端
+可以模拟: 每个请求的处理耗时、建立新连接的耗时(TLS握手)、同时处理的请求数超过上限时返回429和retry-after-ms、按比例返回500
+回复内容中带有收到的图片的md5, 用于检查图片编码是否正确
+"""
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockGPTServer:
+    """
+    用法:
+        server = MockGPTServer(latency_seconds=0.5).start()
+        AzureOpenAIClient(base_url=server.url) ...
+        server.stop()
+    :param latency_seconds: 每个请求的处理耗时
+    :param connect_seconds: 每个新连接的额外耗时, 模拟TLS握手
+    :param max_in_flight: 大于0时同时处理的请求超过该数量返回429
+    :param retry_after_ms: 429时要求客户端等待的毫秒数
+    :param error_rate: 返回500的比例
+    """
+    def __init__(self, latency_seconds=0.5, connect_seconds=0.1, max_in_flight=0, retry_after_ms=200,
+                 error_rate=0.0, seed=0):
+        self.latency_seconds = latency_seconds
+        self.connect_seconds = connect_seconds
+        self.max_in_flight = max_in_flight
+        self.retry_after_ms = retry_after_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+
+        # 统计信息
+        self.connections = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.max_body_bytes = 0
+        self.server = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        handler = type('Handler', (MockGPTHandler,), {'mock_server': self})
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def on_connect(self):
+        with self.lock:
+            self.connections += 1
+        time.sleep(self.connect_seconds)
+
+    def handle(self, body):
+        """
+        :return: (HTTP状态码, 额外的响应头, 响应JSON)
+        """
+        with self.lock:
+            self.requests += 1
+            self.max_body_bytes = max(self.max_body_bytes, len(body))
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                self.rate_limited += 1
+                return 429, {'retry-after-ms': str(self.retry_after_ms)}, {'error': {'code': '429'}}
+            if self.random.random() < self.error_rate:
+                self.errors += 1
+                return 500, {}, {'error': {'code': 'InternalServerError'}}
+            self.in_flight += 1
+        try:
+            time.sleep(self.latency_seconds)
+            payload = json.loads(body)
+            image_url = payload['messages'][1]['content'][1]['image_url']['url']
+            image_md5 = hashlib.md5(base64.b64decode(image_url.split(',', 1)[1])).hexdigest()
+            content = f"【动作】:正手\n【评分】:80分\n(image md5 {image_md5})"
+            return 200, {}, {'choices': [{'message': {'role': 'assistant', 'content': content}}]}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class MockGPTHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 才能保持连接
+    protocol_version = 'HTTP/1.1'
+    mock_server = None
+
+    def setup(self):
+        super().setup()
+        self.mock_server.on_connect()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        status, headers, value = self.mock_server.handle(body)
+        data = json.dumps(value, ensure_ascii=False).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            for key, header_value in headers.items():
+                self.send_header(key, header_value)
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端已经超时断开
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
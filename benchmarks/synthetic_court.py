@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试用的合成球场视频和模型替身
+视频按透视投影画出球场线、两名球员、场边的裁判和来回飞行的网球(偶尔被遮挡);
+YOLO和ResNet替换为按颜色找目标的确定性实现, 不需要模型文件和GPU, 结果只取决于画面
+"""
+from unittest import mock
+
+import cv2
+import numpy as np
+
+import constants
+from trackers import PlayerTracker, BallTracker
+from trackers import player_tracker as player_tracker_module
+from trackers import ball_tracker as ball_tracker_module
+from court_line_detector import CourtLineDetector
+
+# BGR颜色, 球员和网球用容易按阈值区分的饱和色
+BACKGROUND_COLOR = (60, 120, 40)
+COURT_COLOR = (150, 100, 50)
+LINE_COLOR = (255, 255, 255)
+PERSON_COLOR = (30, 30, 220)
+BALL_COLOR = (0, 255, 255)
+
+# 14个关键点在球场上的位置(米), 顺序与 MiniCourt.set_court_drawing_key_points 相同, 纵坐标从远端底线开始
+COURT_LENGTH = constants.HALF_COURT_LINE_HEIGHT * 2
+_SINGLE_START = constants.DOUBLE_ALLY_DIFFERENCE
+_SINGLE_END = constants.DOUBLE_ALLY_DIFFERENCE + constants.SINGLE_LINE_WIDTH
+COURT_KEYPOINTS_METERS = np.array([
+    [0, 0], [constants.DOUBLE_LINE_WIDTH, 0],
+    [0, COURT_LENGTH], [constants.DOUBLE_LINE_WIDTH, COURT_LENGTH],
+    [_SINGLE_START, 0], [_SINGLE_START, COURT_LENGTH],
+    [_SINGLE_END, 0], [_SINGLE_END, COURT_LENGTH],
+    [_SINGLE_START, constants.NO_MANS_LAND_HEIGHT], [_SINGLE_END, constants.NO_MANS_LAND_HEIGHT],
+    [_SINGLE_START, COURT_LENGTH - constants.NO_MANS_LAND_HEIGHT],
+    [_SINGLE_END, COURT_LENGTH - constants.NO_MANS_LAND_HEIGHT],
+    [(_SINGLE_START + _SINGLE_END) / 2, constants.NO_MANS_LAND_HEIGHT],
+    [(_SINGLE_START + _SINGLE_END) / 2, COURT_LENGTH - constants.NO_MANS_LAND_HEIGHT],
+], dtype=np.float32)
+
+# 画出的球场线: 关键点编号对
+COURT_LINES = [(0, 1), (2, 3), (0, 2), (1, 3), (4, 5), (6, 7), (8, 9), (10, 11), (12, 13)]
+
+
+def get_court_homography(width, height):
+    """
+    :return: 球场坐标(米)到画面坐标(像素)的透视变换, 远端底线在画面上方且较窄
+    """
+    corners = COURT_KEYPOINTS_METERS[[0, 1, 2, 3]]
+    image_corners = np.array([[0.32 * width, 0.25 * height], [0.68 * width, 0.25 * height],
+                              [0.14 * width, 0.88 * height], [0.86 * width, 0.88 * height]], dtype=np.float32)
+    return cv2.getPerspectiveTransform(corners, image_corners)
+
+
+def project(points, homography):
+    return cv2.perspectiveTransform(np.asarray(points, dtype=np.float32).reshape(-1, 1, 2), homography).reshape(-1, 2)
+
+
+def get_court_keypoints(width, height):
+    """
+    :return: 画面中的球场关键点, 与CourtLineDetector的输出格式相同 (28,) float32
+    """
+    return project(COURT_KEYPOINTS_METERS, get_court_homography(width, height)).reshape(-1)
+
+
+def get_pixels_per_meter(positions, homography):
+    # 每个位置附近横向1米对应的像素数, 用来按透视缩放人和球的大小
+    positions = np.asarray(positions, dtype=np.float32)
+    left = project(positions - [0.5, 0], homography)
+    right = project(positions + [0.5, 0], homography)
+    return np.linalg.norm(right - left, axis=1)
+
+
+class SyntheticRally:
+    """
+    合成的一段对打, 所有位置按帧预先生成
+    球员1在远端底线附近、球员2在近端底线附近左右移动, 1秒后裁判出现在球网旁的场外
+    (离线流程要求选出的两名球员track id为1和2, 第0帧只有两名球员);
+    网球在两名球员之间来回, 每拍1.4~2.4秒, 偶尔有几帧被遮挡
+    """
+    def __init__(self, num_frames, width=1280, height=720, fps=24, seed=0):
+        rng = np.random.default_rng(seed)
+        self.num_frames = num_frames
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.homography = get_court_homography(width, height)
+        self.court_keypoints = get_court_keypoints(width, height)
+
+        t = np.arange(num_frames) / fps
+        phases = rng.uniform(0, 2 * np.pi, 4)
+        center_x = constants.DOUBLE_LINE_WIDTH / 2
+        player_1 = np.stack([center_x + 3.0 * np.sin(0.7 * t + phases[0]),
+                             -0.5 + 0.8 * np.sin(0.3 * t + phases[1])], axis=1)
+        player_2 = np.stack([center_x + 3.0 * np.sin(0.6 * t + phases[2]),
+                             COURT_LENGTH + 0.5 + 0.8 * np.sin(0.4 * t + phases[3])], axis=1)
+        umpire = np.tile([[-2.5, COURT_LENGTH / 2]], (num_frames, 1))
+        # 人的脚在画面中的位置、身高(像素)和开始出现的帧
+        self.people = []
+        for positions, height_meters, first_frame in [(player_1, constants.PLAYER_1_HEIGHT_METERS, 0),
+                                                      (player_2, constants.PLAYER_2_HEIGHT_METERS, 0),
+                                                      (umpire, 1.8, fps)]:
+            feet = project(positions, self.homography)
+            heights = height_meters * get_pixels_per_meter(positions, self.homography)
+            self.people.append((feet, heights, first_frame))
+
+        # 击球帧, 击球者轮流为球员1和球员2
+        self.shot_frames = [0]
+        while self.shot_frames[-1] < num_frames:
+            self.shot_frames.append(self.shot_frames[-1] + int(fps * rng.uniform(1.4, 2.4)))
+        ball_ground = np.empty((num_frames, 2), dtype=np.float32)
+        ball_height = np.empty(num_frames, dtype=np.float32)
+        for shot_num, (start, end) in enumerate(zip(self.shot_frames[:-1], self.shot_frames[1:])):
+            shooter, receiver = (player_1, player_2) if shot_num % 2 == 0 else (player_2, player_1)
+            last = min(end, num_frames - 1)
+            progress = (np.arange(start, min(end, num_frames)) - start)[:, None] / (end - start)
+            # 击球点在球员身体右侧, 避免被球员挡住
+            ball_ground[start:end] = shooter[start] + [0.6, 0] + (receiver[last] - shooter[start]) * progress
+            ball_height[start:end] = 1.0 + 4.0 * progress[:, 0] * (1 - progress[:, 0])
+        self.shot_frames = self.shot_frames[:-1]
+        pixels_per_meter = get_pixels_per_meter(ball_ground, self.homography)
+        self.ball_centers = project(ball_ground, self.homography) - np.stack(
+            [np.zeros(num_frames), ball_height * pixels_per_meter], axis=1)
+        self.ball_radius = np.maximum(3, 0.12 * pixels_per_meter)
+
+        # 网球偶尔被遮挡1~6帧
+        self.ball_visible = np.ones(num_frames, dtype=bool)
+        for start in np.flatnonzero(rng.random(num_frames) < 0.02):
+            self.ball_visible[start:start + rng.integers(1, 7)] = False
+
+        self.background = np.full((height, width, 3), BACKGROUND_COLOR, dtype=np.uint8)
+        cv2.fillPoly(self.background, [self.court_keypoints.reshape(-1, 2)[[0, 1, 3, 2]].astype(np.int32)],
+                     COURT_COLOR)
+        keypoints = self.court_keypoints.reshape(-1, 2)
+        for start, end in COURT_LINES:
+            cv2.line(self.background, tuple(map(int, keypoints[start])), tuple(map(int, keypoints[end])),
+                     LINE_COLOR, 2)
+
+    def draw_frame(self, frame_num):
+        frame = self.background.copy()
+        if self.ball_visible[frame_num]:
+            center = tuple(map(int, self.ball_centers[frame_num]))
+            cv2.circle(frame, center, int(self.ball_radius[frame_num]), BALL_COLOR, -1)
+        # 人画在球之后, 球经过人身后时被挡住
+        for feet, heights, first_frame in self.people:
+            if frame_num < first_frame:
+                continue
+            (x, y), person_height = feet[frame_num], heights[frame_num]
+            half_width = person_height * 0.2
+            cv2.rectangle(frame, (int(x - half_width), int(y - person_height)), (int(x + half_width), int(y)),
+                          PERSON_COLOR, -1)
+        return frame
+
+    def __iter__(self):
+        for frame_num in range(self.num_frames):
+            yield self.draw_frame(frame_num)
+
+
+def write_synthetic_video(video_path, num_frames, width=1280, height=720, fps=24, seed=0):
+    """
+    生成合成球场视频, 使用MJPG编码(.avi), 颜色失真小, 解码快
+    :return: SyntheticRally, 包含真实的击球帧和关键点
+    """
+    rally = SyntheticRally(num_frames, width, height, fps, seed)
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    for frame in rally:
+        writer.write(frame)
+    writer.release()
+    return rally
+
+
+class MockTensor:
+    """
+    代替torch.Tensor, 只提供检测结果解析时用到的 .cpu().numpy() 和切片
+    """
+    def __init__(self, array):
+        self.array = np.asarray(array)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+    def __getitem__(self, item):
+        return MockTensor(self.array[item])
+
+    def __len__(self):
+        return len(self.array)
+
+
+class MockBoxes:
+    def __init__(self, xyxy, conf, cls, track_ids=None):
+        self.xyxy = MockTensor(np.asarray(xyxy, dtype=np.float32).reshape(-1, 4))
+        self.conf = MockTensor(np.asarray(conf, dtype=np.float32))
+        self.cls = MockTensor(np.asarray(cls, dtype=np.float32))
+        self.id = None if track_ids is None else MockTensor(np.asarray(track_ids, dtype=np.float32))
+
+    def __len__(self):
+        return len(self.xyxy)
+
+
+class MockResults:
+    def __init__(self, boxes, names):
+        self.boxes = boxes
+        self.names = names
+
+
+def find_color_boxes(frame, lower, upper, min_area):
+    """
+    :return: 颜色在[lower, upper]范围内的连通区域的检测框 (N, 4), 按(y, x)排序
+    """
+    mask = cv2.inRange(frame, np.array(lower, dtype=np.uint8), np.array(upper, dtype=np.uint8))
+    num_labels, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+    stats = stats[1:]
+    stats = stats[stats[:, cv2.CC_STAT_AREA] >= min_area]
+    boxes = np.stack([stats[:, 0], stats[:, 1], stats[:, 0] + stats[:, 2], stats[:, 1] + stats[:, 3]],
+                     axis=1).astype(np.float32)
+    return boxes[np.lexsort((boxes[:, 0], boxes[:, 1]))]
+
+
+class MockYOLO:
+    """
+    代替ultralytics.YOLO的确定性检测器: 按颜色找人和网球, track时按中心点最近匹配上一帧的track id
+    接口与PlayerTracker/BallTracker中用到的 predict/track 相同
+    """
+    # 类别名 -> (BGR下限, BGR上限, 最小面积, 置信度)
+    CLASS_COLORS = {
+        'person': ((0, 0, 150), (100, 100, 255), 30, 0.9),
+        'sports ball': ((0, 170, 170), (120, 255, 255), 4, 0.6),
+    }
+
+    def __init__(self, model_path, class_names=('person', 'sports ball'), max_match_distance=80.0, max_age=30):
+        self.model_path = model_path
+        self.names = dict(enumerate(class_names))
+        self.max_match_distance = max_match_distance
+        self.max_age = max_age
+        self.predictor = None
+        # track id -> (类别, 中心点, 最后出现的帧序号)
+        self.tracks = {}
+        self.next_track_id = 1
+        self.frame_count = 0
+
+    def detect(self, frame):
+        boxes = []
+        confs = []
+        classes = []
+        for class_id, class_name in self.names.items():
+            lower, upper, min_area, conf = self.CLASS_COLORS[class_name]
+            class_boxes = find_color_boxes(frame, lower, upper, min_area)
+            boxes.append(class_boxes)
+            confs.append(np.full(len(class_boxes), conf))
+            classes.append(np.full(len(class_boxes), class_id))
+        return np.concatenate(boxes), np.concatenate(confs), np.concatenate(classes)
+
+    def assign_track_ids(self, boxes, classes):
+        """
+        按中心点距离从近到远匹配同一类别的track, 没有匹配上的检测框分配新的track id, 连续max_age帧没有出现的track删除
+        """
+        self.frame_count += 1
+        centers = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=1)
+        track_ids = list(self.tracks)
+        pairs = []
+        for box_index, (center, class_id) in enumerate(zip(centers, classes)):
+            for track_id in track_ids:
+                track_class, track_center, _ = self.tracks[track_id]
+                distance = np.linalg.norm(center - track_center)
+                if track_class == class_id and distance <= self.max_match_distance:
+                    pairs.append((distance, box_index, track_id))
+
+        assigned = [None] * len(boxes)
+        used_tracks = set()
+        for _, box_index, track_id in sorted(pairs):
+            if assigned[box_index] is None and track_id not in used_tracks:
+                assigned[box_index] = track_id
+                used_tracks.add(track_id)
+        for box_index, class_id in enumerate(classes):
+            if assigned[box_index] is None:
+                assigned[box_index] = self.next_track_id
+                self.next_track_id += 1
+            self.tracks[assigned[box_index]] = (class_id, centers[box_index], self.frame_count)
+        self.tracks = {track_id: track for track_id, track in self.tracks.items()
+                       if self.frame_count - track[2] <= self.max_age}
+        return assigned
+
+    def predict(self, source, **kwargs):
+        frames = source if isinstance(source, list) else [source]
+        return [MockResults(MockBoxes(*self.detect(frame)), self.names) for frame in frames]
+
+    def track(self, source, persist=False, **kwargs):
+        if not persist:
+            self.tracks = {}
+        results = []
+        for frame in source if isinstance(source, list) else [source]:
+            boxes, confs, classes = self.detect(frame)
+            track_ids = self.assign_track_ids(boxes, classes)
+            results.append(MockResults(MockBoxes(boxes, confs, classes, track_ids), self.names))
+        return results
+
+
+class MockCourtLineDetector(CourtLineDetector):
+    """
+    代替ResNet关键点模型, 直接返回合成视频中球场关键点的真实位置, 绘制等方法沿用CourtLineDetector
+    """
+    def __init__(self, model_path='mock_keypoints_model'):
+        self.model_path = model_path
+
+    def predict(self, image):
+        return get_court_keypoints(image.shape[1], image.shape[0])
+
+    def predict_batch(self, images):
+        return np.stack([self.predict(image) for image in images])
+
+
+def create_mock_trackers(player_model_path='mock_yolov8x', ball_model_path='mock_ball_model'):
+    """
+    创建使用MockYOLO的PlayerTracker和BallTracker, 以及MockCourtLineDetector
+    :return: (PlayerTracker, BallTracker, MockCourtLineDetector)
+    """
+    with mock.patch.object(player_tracker_module, 'load_yolo', MockYOLO):
+        player_tracker = PlayerTracker(model_path=player_model_path)
+    with mock.patch.object(ball_tracker_module, 'load_yolo',
+                           lambda path: MockYOLO(path, class_names=('sports ball',))):
+        ball_tracker = BallTracker(model_path=ball_model_path)
+    return player_tracker, ball_tracker, MockCourtLineDetector()
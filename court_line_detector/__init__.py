@@ -1 +1,2 @@
-from .court_line_detector import CourtLineDetector
\ No newline at end of file
+from .court_line_detector import CourtLineDetector
+from .court_keypoint_tracker import CourtKeypointTracker, CourtKeypoints
\ No newline at end of file
@@ -0,0 +1,157 @@
+import os
+import numpy as np
+import sys
+sys.path.append('../')
+from utils import hash_file, hash_file_or_name, hash_params, LazyModule
+
+cv2 = LazyModule('cv2')
+
+CACHE_FORMAT_VERSION = 1
+
+
+class CourtKeypoints:
+    """
+    按段存储的逐帧球场关键点, 同一段内镜头没有明显变化, 所有帧共用一组关键点
+        segment_starts  int64    (S,)      每段的第一帧
+        keypoints       float32  (S, 28)   每段的关键点 [x0, y0, x1, y1, ...]
+    keypoints[frame_num] 返回该帧的关键点
+    """
+    def __init__(self, segment_starts, keypoints, num_frames):
+        self.segment_starts = np.asarray(segment_starts, dtype=np.int64)
+        self.keypoints = np.asarray(keypoints, dtype=np.float32).reshape(-1, 14*2)
+        self.num_frames = num_frames
+
+    def __len__(self):
+        return self.num_frames
+
+    def __getitem__(self, frame_num):
+        if not 0 <= frame_num < self.num_frames:
+            raise IndexError(f"Frame {frame_num} out of range for {self.num_frames} frames")
+        return self.keypoints[self.get_segment_index(frame_num)]
+
+    def get_segment_index(self, frame_nums):
+        return np.searchsorted(self.segment_starts, frame_nums, side='right') - 1
+
+    def get_segments(self):
+        """
+        :return: [(起始帧, 结束帧(不含), 关键点), ...]
+        """
+        segment_ends = np.append(self.segment_starts[1:], self.num_frames)
+        return list(zip(self.segment_starts.tolist(), segment_ends.tolist(), self.keypoints))
+
+    def to_array(self):
+        """
+        :return: (num_frames, 28) 每一帧的关键点
+        """
+        segment_lengths = np.diff(np.append(self.segment_starts, self.num_frames))
+        return np.repeat(self.keypoints, segment_lengths, axis=0)
+
+
+class CourtKeypointTracker:
+    """
+    按需重新检测球场关键点
+    每一帧缩小成灰度小图, 与当前段第一帧的小图比较平均像素差, 镜头平移、缩放或切换使差值超过阈值时开始新的一段;
+    只有每段的第一帧运行关键点模型, 多段攒够batch_size后批量推理
+    """
+    def __init__(self, court_line_detector, change_threshold=12.0, thumbnail_size=(64, 36), batch_size=8):
+        self.court_line_detector = court_line_detector
+        self.change_threshold = change_threshold
+        self.thumbnail_size = thumbnail_size
+        self.batch_size = batch_size
+        self.start()
+
+    def get_params(self):
+        # 影响分段和关键点结果的所有参数, 作为缓存键的一部分
+        return {
+            'change_threshold': self.change_threshold,
+            'thumbnail_size': list(self.thumbnail_size),
+        }
+
+    def start(self):
+        """
+        清空状态, 开始处理新的视频
+        """
+        self.num_frames = 0
+        self.reference_thumbnail = None
+        self.pending_frames = []
+        self.segment_starts = []
+        self.segment_keypoints = []
+
+    def get_thumbnail(self, frame):
+        thumbnail = cv2.resize(frame, self.thumbnail_size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+    def is_scene_changed(self, thumbnail):
+        if self.reference_thumbnail is None:
+            return True
+        return float(np.abs(thumbnail - self.reference_thumbnail).mean()) > self.change_threshold
+
+    def update(self, frames):
+        """
+        按顺序送入若干帧
+        :param frames: 紧接在上一次送入的帧之后的帧列表
+        """
+        for frame in frames:
+            thumbnail = self.get_thumbnail(frame)
+            if self.is_scene_changed(thumbnail):
+                self.reference_thumbnail = thumbnail
+                self.segment_starts.append(self.num_frames)
+                self.pending_frames.append(frame)
+                if len(self.pending_frames) >= self.batch_size:
+                    self.flush()
+            self.num_frames += 1
+
+    def flush(self):
+        # 对还没有关键点的段批量推理
+        if self.pending_frames:
+            self.segment_keypoints.extend(self.court_line_detector.predict_batch(self.pending_frames))
+            self.pending_frames = []
+
+    def finish(self):
+        """
+        :return: CourtKeypoints
+        """
+        self.flush()
+        print(f"court keypoints: {len(self.segment_starts)} segments in {self.num_frames} frames")
+        return CourtKeypoints(self.segment_starts, self.segment_keypoints, self.num_frames)
+
+    def get_cache_path(self, cache_dir, video_path):
+        key = hash_params({
+            'version': CACHE_FORMAT_VERSION,
+            'video': hash_file(video_path),
+            'model': hash_file_or_name(self.court_line_detector.model_path),
+            'params': self.get_params(),
+        })
+        return os.path.join(cache_dir, f"court_{key}.npz")
+
+    def detect_frames(self, frames, cache_dir=None, video_path=None):
+        """
+        检测整段视频每一帧的球场关键点
+        :param frames: 帧列表或VideoFrameReader
+        :param cache_dir: 缓存目录, 为None时不使用缓存
+        :param video_path: 视频路径, 用于计算缓存键, frames为VideoFrameReader时可省略
+        :return: CourtKeypoints
+        """
+        cache_path = None
+        if cache_dir is not None:
+            video_path = video_path or getattr(frames, 'video_path', None)
+            if video_path is None:
+                raise ValueError("video_path is required when cache_dir is set")
+            cache_path = self.get_cache_path(cache_dir, video_path)
+            if os.path.exists(cache_path):
+                with np.load(cache_path) as data:
+                    print(f"loaded cached court keypoints from {cache_path}")
+                    return CourtKeypoints(data['segment_starts'], data['keypoints'], int(data['num_frames']))
+
+        self.start()
+        self.update(frames)
+        court_keypoints = self.finish()
+
+        if cache_path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            # 先写临时文件再替换, 中途退出不会留下损坏的缓存
+            tmp_path = cache_path + ".tmp.npz"
+            np.savez(tmp_path, segment_starts=court_keypoints.segment_starts, keypoints=court_keypoints.keypoints,
+                     num_frames=court_keypoints.num_frames)
+            os.replace(tmp_path, cache_path)
+        return court_keypoints
@@ -1,14 +1,23 @@
-import torch
-import torchvision.transforms as transforms
-import cv2
-from torchvision import models
 import numpy as np
+import sys
+sys.path.append('../')
+from utils import LazyModule
+from telemetry import profiler
+from .court_keypoint_tracker import CourtKeypoints
+
+# torch和torchvision导入较慢, 创建模型时才导入; 只绘制关键点或读取关键点缓存时不需要
+torch = LazyModule('torch')
+cv2 = LazyModule('cv2')
 
 class CourtLineDetector:
     def __init__(self, model_path):
+        from torchvision import models, transforms
+        self.model_path = model_path
         self.model = models.resnet50(pretrained=True)
         self.model.fc = torch.nn.Linear(self.model.fc.in_features, 14*2) 
         self.model.load_state_dict(torch.load(model_path, map_location='cpu'))
+        # 推理模式: BatchNorm使用训练时的统计量, 批量推理时各图片的结果互不影响
+        self.model.eval()
         self.transform = transforms.Compose([
             transforms.ToPILImage(),
             transforms.Resize((224, 224)),
@@ -21,7 +30,7 @@ class CourtLineDetector:
     
         image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         image_tensor = self.transform(image_rgb).unsqueeze(0)
-        with torch.no_grad():
+        with torch.no_grad(), profiler.model_call(self.model_path):
             outputs = self.model(image_tensor)
         keypoints = outputs.squeeze().cpu().numpy()
         original_h, original_w = image.shape[:2]
@@ -30,6 +39,23 @@ class CourtLineDetector:
 
         return keypoints
 
+    def predict_batch(self, images):
+        """
+        一次前向推理检测多张图片的球场关键点
+        :param images: BGR图片列表
+        :return: (N, 28) 数组, 每行为 [x0, y0, x1, y1, ...]
+        """
+        image_tensors = torch.stack([self.transform(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)) for image in images])
+        with torch.no_grad(), profiler.model_call(self.model_path, len(images)):
+            outputs = self.model(image_tensors)
+        keypoints = outputs.cpu().numpy().reshape(len(images), -1)
+        for i, image in enumerate(images):
+            original_h, original_w = image.shape[:2]
+            keypoints[i, ::2] *= original_w / 224.0
+            keypoints[i, 1::2] *= original_h / 224.0
+
+        return keypoints
+
     def draw_keypoints(self, image, keypoints):
         # Plot keypoints on the image
         for i in range(0, len(keypoints), 2):
@@ -40,8 +66,12 @@ class CourtLineDetector:
         return image
     
     def draw_keypoints_on_video(self, video_frames, keypoints):
+        """
+        :param keypoints: 所有帧共用的关键点, 或按帧索引的关键点(CourtKeypoints / (num_frames, 28)数组)
+        """
+        per_frame = isinstance(keypoints, CourtKeypoints) or np.ndim(keypoints) == 2
         output_video_frames = []
-        for frame in video_frames:
-            frame = self.draw_keypoints(frame, keypoints)
+        for frame_num, frame in enumerate(video_frames):
+            frame = self.draw_keypoints(frame, keypoints[frame_num] if per_frame else keypoints)
             output_video_frames.append(frame)
         return output_video_frames
\ No newline at end of file
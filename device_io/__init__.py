@@ -0,0 +1 @@
+from .adb_device import AdbDevice, AdbError, get_local_md5
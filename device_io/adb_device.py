@@ -0,0 +1,243 @@
+import hashlib
+import os
+import queue
+import shlex
+import subprocess
+import threading
+import time
+import uuid
+import sys
+sys.path.append('../')
+from utils import new_file_hasher, remember_file_hash
+
+MEDIA_SCAN_ACTION = 'android.intent.action.MEDIA_SCANNER_SCAN_FILE'
+
+
+class AdbError(IOError):
+    pass
+
+
+class AdbDevice:
+    """
+    通过adb读写手机上的文件
+    校验、删除和媒体扫描等shell命令都发给一个常驻的 adb shell 进程, 不再每个文件、每条命令启动一个adb进程;
+    删除一个目录下的文件和触发媒体扫描合并为一条命令; 拉取和推送前先比较md5, 两边内容相同时跳过传输;
+    拉取的视频通过 exec-out 直接写入分析时读取的文件, 写入的同时计算内容哈希, 检测缓存不用再读一遍视频
+    """
+    def __init__(self, adb_path='adb', serial=None, chunk_size=1024 * 1024, command_timeout=60.0):
+        """
+        :param adb_path: adb可执行文件, 可以换成测试用的替身(见 benchmarks/fake_adb.py)
+        :param serial: 设备序列号, 连接了多台设备时需要指定
+        :param chunk_size: 拉取文件时每次读取的字节数
+        :param command_timeout: 每条shell命令的超时(秒), 超时后结束常驻shell, 下一条命令重新启动
+        """
+        self.adb_path = adb_path
+        self.serial = serial
+        self.chunk_size = chunk_size
+        self.command_timeout = command_timeout
+        self.lock = threading.Lock()
+        self.shell_process = None
+        # 常驻shell的输出由后台线程逐行读取, shell()按超时等待
+        self.shell_output = None
+        # 每条命令输出结束的标记
+        self.end_marker = f"__adb_done_{uuid.uuid4().hex}__"
+
+        # 统计信息
+        self.processes = 0
+        self.shell_commands = 0
+        self.transferred = 0
+        self.skipped = 0
+        self.bytes_pulled = 0
+
+    def _command(self, *args):
+        command = [self.adb_path]
+        if self.serial:
+            command += ['-s', self.serial]
+        return command + list(args)
+
+    def _run(self, *args):
+        self.processes += 1
+        result = subprocess.run(self._command(*args), capture_output=True, text=True)
+        if result.returncode != 0:
+            raise AdbError(f"adb {args[0]} failed: {(result.stderr or result.stdout).strip()}")
+        return result.stdout
+
+    def _start_shell(self):
+        self.processes += 1
+        self.shell_process = subprocess.Popen(self._command('shell', '-T'), stdin=subprocess.PIPE,
+                                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        # 每个shell进程一个队列, 超时后关闭的shell剩下的输出不会混入下一条命令
+        self.shell_output = queue.Queue()
+        threading.Thread(target=read_lines, args=(self.shell_process.stdout, self.shell_output), daemon=True).start()
+
+    def shell(self, script, timeout=None):
+        """
+        在常驻的shell中执行命令(在子shell中运行, cd等不会影响之后的命令)
+        :param timeout: 超时(秒), 默认为command_timeout; 超时后结束常驻shell并抛出AdbError, 不会一直占着锁
+        :return: (退出码, 输出)
+        """
+        timeout = self.command_timeout if timeout is None else timeout
+        with self.lock:
+            if self.shell_process is None or self.shell_process.poll() is not None:
+                self._start_shell()
+            self.shell_commands += 1
+            line = f"( {script} ) 2>&1; status=$?; echo; echo {self.end_marker} $status\n"
+            deadline = time.monotonic() + timeout
+            try:
+                self.shell_process.stdin.write(line.encode('utf-8'))
+                self.shell_process.stdin.flush()
+                output = []
+                while True:
+                    try:
+                        out_line = self.shell_output.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        raise AdbError(f"adb shell command timed out after {timeout}s: {script}")
+                    if not out_line:
+                        raise AdbError("adb shell exited, device disconnected?")
+                    out_line = out_line.decode('utf-8', errors='replace')
+                    if out_line.startswith(self.end_marker):
+                        return_code = int(out_line.split()[-1])
+                        break
+                    output.append(out_line)
+            except (OSError, AdbError):
+                self._close_shell()
+                raise
+        # 去掉为了让结束标记单独成行而多输出的换行
+        return return_code, ''.join(output)[:-1]
+
+    def get_md5(self, device_path):
+        """
+        :return: 设备上文件的md5, 文件不存在时返回None
+        """
+        return_code, output = self.shell(f"md5sum {shlex.quote(device_path)}")
+        if return_code != 0:
+            return None
+        return output.split()[0]
+
+    def pull(self, device_path, local_path):
+        """
+        拉取文件到本地, 本地已有内容相同的文件时跳过
+        :return: 是否进行了传输
+        """
+        device_md5 = self.get_md5(device_path)
+        if device_md5 is None:
+            raise AdbError(f"File not found on device: {device_path}")
+        if os.path.exists(local_path) and get_local_md5(local_path) == device_md5:
+            self.skipped += 1
+            print(f"{local_path} is up to date, skip pulling")
+            return False
+
+        md5_hasher, content_hasher = hashlib.md5(), new_file_hasher()
+        tmp_path = f"{local_path}.part"
+        self.processes += 1
+        process = subprocess.Popen(self._command('exec-out', 'cat', shlex.quote(device_path)), stdout=subprocess.PIPE)
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in iter(lambda: process.stdout.read(self.chunk_size), b''):
+                    f.write(chunk)
+                    md5_hasher.update(chunk)
+                    content_hasher.update(chunk)
+                    self.bytes_pulled += len(chunk)
+        finally:
+            process.stdout.close()
+            process.wait()
+        if process.returncode != 0 or md5_hasher.hexdigest() != device_md5:
+            os.remove(tmp_path)
+            raise AdbError(f"Failed to pull {device_path}: checksum mismatch")
+        os.replace(tmp_path, local_path)
+        remember_file_hash(local_path, content_hasher.hexdigest())
+        self.transferred += 1
+        print(f"File pulled successfully from {device_path} to {local_path}")
+        return True
+
+    def push(self, local_path, device_path, scan=True):
+        """
+        推送文件到设备, 设备上已有内容相同的文件时跳过
+        :param scan: 推送后触发媒体扫描, 相册中才能看到
+        :return: 是否进行了传输
+        """
+        local_md5 = get_local_md5(local_path)
+        if local_md5 is None:
+            raise AdbError(f"File not found: {local_path}")
+        if self.get_md5(device_path) == local_md5:
+            self.skipped += 1
+            print(f"{device_path} is up to date, skip pushing")
+            return False
+        self._run('push', local_path, device_path)
+        self.transferred += 1
+        print(f"File pushed successfully from {local_path} to {device_path}")
+        if scan:
+            self.scan_media(device_path)
+        return True
+
+    def scan_media(self, *device_paths):
+        """
+        触发媒体扫描, 多个路径在同一条命令中广播
+        """
+        script = '; '.join(f"am broadcast -a {MEDIA_SCAN_ACTION} -d {shlex.quote('file://' + path)} > /dev/null"
+                           for path in device_paths)
+        return_code, output = self.shell(script)
+        if return_code != 0:
+            raise AdbError(f"Failed to trigger media scan: {output.strip()}")
+
+    def clear_files(self, directory_path, pattern='*.mp4'):
+        """
+        删除目录下匹配的文件, 有文件被删除时触发媒体扫描, 全部在一条命令中完成
+        :return: 删除的文件名列表
+        """
+        script = (f"cd {shlex.quote(directory_path)} || exit 1; deleted=; "
+                  f"for f in {pattern}; do [ -e \"$f\" ] || continue; rm -f \"$f\" && echo \"$f\" && deleted=1; done; "
+                  f"if [ -n \"$deleted\" ]; then am broadcast -a {MEDIA_SCAN_ACTION} "
+                  f"-d {shlex.quote('file://' + directory_path)} > /dev/null; fi")
+        return_code, output = self.shell(script)
+        if return_code != 0:
+            raise AdbError(f"Failed to clear {directory_path}: {output.strip()}")
+        return [name for name in output.splitlines() if name]
+
+    def _close_shell(self):
+        if self.shell_process is not None:
+            self.shell_process.kill()
+            self.shell_process.wait()
+            self.shell_process = None
+            self.shell_output = None
+
+    def close(self):
+        with self.lock:
+            if self.shell_process is not None and self.shell_process.poll() is None:
+                self.shell_process.stdin.close()
+                self.shell_process.wait()
+            self.shell_process = None
+            self.shell_output = None
+
+    def get_stats(self):
+        """
+        启动的adb进程数、在常驻shell中执行的命令数、传输和跳过的文件数
+        """
+        return {'processes': self.processes, 'shell_commands': self.shell_commands,
+                'transferred': self.transferred, 'skipped': self.skipped, 'bytes_pulled': self.bytes_pulled}
+
+
+def read_lines(stream, output_queue):
+    """
+    在后台线程中逐行读取stream放入队列, 读到结尾时放入b''
+    """
+    try:
+        for line in iter(stream.readline, b''):
+            output_queue.put(line)
+    except (OSError, ValueError):
+        # 进程被结束后stream已关闭
+        pass
+    output_queue.put(b'')
+
+
+def get_local_md5(local_path, chunk_size=1024 * 1024):
+    """
+    :return: 本地文件的md5, 文件不存在时返回None
+    """
+    if not os.path.exists(local_path):
+        return None
+    hasher = hashlib.md5()
+    with open(local_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
@@ -0,0 +1,2 @@
+from .job_store import JobStore
+from .job_service import JobService, DEFAULT_RESOURCE_LIMITS
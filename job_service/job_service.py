@@ -0,0 +1,250 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .job_store import JobStore
+
+# 每种资源同时进行的操作数: 手机只有一台, 界面操作只能串行; 本地推理占满GPU/CPU; 远程接口可以并发
+DEFAULT_RESOURCE_LIMITS = {'device': 1, 'inference': 1, 'remote_api': 4}
+
+ACK_MSG = "收到, 当前排在第{position}位, 请稍等"
+BUSY_MSG = "排队的人太多了, 晚点再试下😭"
+NO_VIDEO_MSG = "请发送30秒左右的网球视频"
+ERROR_MSG = "Ops，出错了，晚点再试下😭"
+
+
+class ResourceStats:
+    def __init__(self, limit):
+        self.limit = limit
+        self.calls = 0
+        self.wait_seconds = 0.0
+        self.busy_seconds = 0.0
+
+
+class JobService:
+    """
+    基于asyncio的视频分析任务服务
+    触发接口收到请求后立即入队(持久化)并回复排队位置, 不等待前面的任务; 任务分为设备操作、本地推理和远程接口几个步骤,
+    每一步只占用对应的资源, 资源各自限制并发数(阻塞操作在线程中运行), 所以一个用户的推理可以和下一个用户的下载视频、
+    上一个用户的GPT请求同时进行; 队列满时直接回复稍后再试(背压)
+    trigger / device 是接口对象, 可以换成本地替身(见 local_stand_ins)在没有手机和服务器时运行:
+        trigger.fetch() -> 触发任务的聊天名称, 没有时返回空字符串
+        trigger.acknowledge(chat_room_name, status) 把任务状态写回触发接口
+        trigger.clear() 清除触发标记, 让下一个用户可以触发
+        device.fetch_video(chat_room_name) -> (视频时长文本, 本地视频路径), 聊天中没有视频时返回None
+        device.send_text(chat_room_name, msg)
+        device.send_result(chat_room_name, msg, image_path)
+    """
+    def __init__(self, trigger, device, render_func, review_func, store=None, resource_limits=None,
+                 max_active_jobs=4, poll_interval=5.0, result_cache=None):
+        """
+        :param render_func: 本地推理, 输入本地视频路径, 返回图片路径(如 render_action_image)
+        :param review_func: 远程接口, 输入图片路径, 返回回复内容(如 review_action_image)
+        :param store: JobStore, 默认保存在 job_queue.json
+        :param resource_limits: 各资源的并发数, 未指定的使用 DEFAULT_RESOURCE_LIMITS
+        :param max_active_jobs: 同时进行中的任务数上限
+        :param poll_interval: 触发接口没有新任务时的轮询间隔(秒), 有新任务时立即再次查询
+        :param result_cache: ResultCache, 分析过的视频直接使用上次的结果, 不占用推理和远程接口
+        """
+        self.trigger = trigger
+        self.device = device
+        self.render_func = render_func
+        self.review_func = review_func
+        self.store = store if store is not None else JobStore()
+        self.resource_limits = dict(DEFAULT_RESOURCE_LIMITS, **(resource_limits or {}))
+        self.max_active_jobs = max_active_jobs
+        self.poll_interval = poll_interval
+        self.result_cache = result_cache
+
+        # asyncio对象在run()中创建, 绑定到运行的事件循环
+        self.queue = None
+        self.semaphores = None
+        self.wake_event = None
+        self.stop_event = None
+        self.executor = None
+        self.background_tasks = set()
+
+        # 统计信息
+        self.resource_stats = {name: ResourceStats(limit) for name, limit in self.resource_limits.items()}
+        self.submitted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.cache_hits = 0
+        self.queue_wait_seconds = 0.0
+        self.job_seconds = 0.0
+
+    async def run(self):
+        """
+        运行服务直到调用stop(); 上次退出时未完成的任务先重新入队
+        """
+        self.queue = asyncio.Queue()
+        self.semaphores = {name: asyncio.Semaphore(limit) for name, limit in self.resource_limits.items()}
+        self.wake_event = asyncio.Event()
+        self.stop_event = asyncio.Event()
+        # 每个资源并发数之外再留两个线程给触发接口, 默认线程池在核数少的机器上可能不够
+        self.executor = ThreadPoolExecutor(max_workers=sum(self.resource_limits.values()) + 2)
+        for job in self.store.queued_jobs():
+            print(f"{job['chat_room_name']} 恢复未完成的任务")
+            self.queue.put_nowait(job)
+
+        tasks = [asyncio.create_task(self._watch_trigger())]
+        tasks += [asyncio.create_task(self._work()) for _ in range(self.max_active_jobs)]
+        await self.stop_event.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, *self.background_tasks, return_exceptions=True)
+        self.executor.shutdown(wait=False)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def wake(self):
+        """
+        通知服务立即查询触发接口(用于有推送通知的触发方式), 不必等到下一个轮询间隔
+        """
+        self.wake_event.set()
+
+    async def wait_idle(self):
+        """
+        等待队列中的任务全部完成
+        """
+        await self.queue.join()
+
+    async def submit(self, chat_room_name):
+        """
+        添加任务并立即回复排队位置
+        :return: (任务, 排队位置), 队列已满时任务为None
+        """
+        job, position, is_new = self.store.submit(chat_room_name)
+        if job is None:
+            self.rejected += 1
+            print(f"{chat_room_name} 队列已满, 拒绝任务")
+            await self._to_thread(self.trigger.acknowledge, chat_room_name, "REJECTED")
+            self._in_background(self._use('device', self.device.send_text, chat_room_name, BUSY_MSG))
+            return None, 0
+        if is_new:
+            self.submitted += 1
+            self.queue.put_nowait(job)
+        else:
+            self.duplicates += 1
+        print(f"{chat_room_name} 触发任务, 排在第{position}位")
+        await self._to_thread(self.trigger.acknowledge, chat_room_name, f"QUEUED {position}")
+        # 回复消息需要操作手机, 在后台发送, 不耽误接收下一个请求
+        self._in_background(self._use('device', self.device.send_text, chat_room_name,
+                                      ACK_MSG.format(position=position)))
+        return job, position
+
+    def get_stats(self):
+        """
+        任务数、平均排队和处理时间, 以及每种资源的调用次数、等待时间和占用时间
+        """
+        finished = self.completed + self.failed
+        return {
+            'submitted': self.submitted,
+            'duplicates': self.duplicates,
+            'rejected': self.rejected,
+            'completed': self.completed,
+            'failed': self.failed,
+            'cache_hits': self.cache_hits,
+            'pending': len(self.store),
+            'mean_queue_wait_seconds': self.queue_wait_seconds / finished if finished else 0.0,
+            'mean_job_seconds': self.job_seconds / finished if finished else 0.0,
+            'resources': {name: {'limit': stats.limit, 'calls': stats.calls, 'wait_seconds': stats.wait_seconds,
+                                 'busy_seconds': stats.busy_seconds}
+                          for name, stats in self.resource_stats.items()},
+        }
+
+    async def _watch_trigger(self):
+        while True:
+            # 查询之前清除, 查询期间收到的通知不会丢失
+            self.wake_event.clear()
+            chat_room_name = await self._to_thread(self.trigger.fetch)
+            if chat_room_name:
+                await self.submit(chat_room_name)
+                # 任务已经入队, 清除触发标记后马上查询下一个
+                await self._to_thread(self.trigger.clear)
+                continue
+            try:
+                await asyncio.wait_for(self.wake_event.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _work(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._run_job(job)
+            finally:
+                self.queue.task_done()
+
+    async def _run_job(self, job):
+        chat_room_name = job['chat_room_name']
+        start_time = time.time()
+        self.queue_wait_seconds += max(0.0, start_time - job['submitted_at'])
+        self.store.start(job['id'])
+        print(f"{chat_room_name} 开始任务")
+        try:
+            video = await self._use('device', self.device.fetch_video, chat_room_name)
+            if video is None:
+                # 未找到视频文件
+                await self._use('device', self.device.send_text, chat_room_name, NO_VIDEO_MSG)
+            else:
+                _, local_video_path = video
+                response_msg, image_path = await self._analyze(local_video_path)
+                await self._use('device', self.device.send_result, chat_room_name, response_msg, image_path)
+            self.completed += 1
+        except Exception as error:
+            print(f"{chat_room_name} 任务失败: {error!r}")
+            self.failed += 1
+            try:
+                await self._use('device', self.device.send_text, chat_room_name, ERROR_MSG)
+            except Exception as send_error:
+                print(send_error)
+        finally:
+            self.job_seconds += time.time() - start_time
+            self.store.finish(job['id'])
+
+    async def _analyze(self, local_video_path):
+        """
+        :return: (回复内容, 图片路径)
+        """
+        if self.result_cache is not None:
+            cached_result = await self._to_thread(self.result_cache.get, local_video_path)
+            if cached_result is not None:
+                self.cache_hits += 1
+                return cached_result
+        image_path = await self._use('inference', self.render_func, local_video_path)
+        response_msg = await self._use('remote_api', self.review_func, image_path)
+        if self.result_cache is not None:
+            return await self._to_thread(self.result_cache.put, local_video_path, response_msg, image_path)
+        return response_msg, image_path
+
+    async def _use(self, resource, func, *args):
+        """
+        占用一个资源运行阻塞函数, 资源的并发数达到上限时等待
+        """
+        stats = self.resource_stats[resource]
+        wait_start = time.perf_counter()
+        async with self.semaphores[resource]:
+            busy_start = time.perf_counter()
+            stats.calls += 1
+            stats.wait_seconds += busy_start - wait_start
+            try:
+                return await self._to_thread(func, *args)
+            finally:
+                stats.busy_seconds += time.perf_counter() - busy_start
+
+    async def _to_thread(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def _in_background(self, coroutine):
+        async def run():
+            try:
+                await coroutine
+            except Exception as error:
+                print(error)
+        task = asyncio.create_task(run())
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+QUEUED = 'queued'
+RUNNING = 'running'
+
+
+class JobStore:
+    """
+    持久化的任务队列, 保存在一个JSON文件中, 每次变化后整体写入(先写临时文件再替换, 写到一半退出也不会损坏)
+    只保存还没有完成的任务; 进程重启后, 上次正在运行的任务重新排队, 排队中的用户不会丢失
+    同一个聊天已经在队列中时不重复添加; 队列满时拒绝新任务(背压), 由调用方回复用户稍后再试
+    """
+    def __init__(self, path='job_queue.json', max_pending=20):
+        """
+        :param path: 队列文件路径
+        :param max_pending: 最多同时保存的未完成任务数(包括运行中的)
+        """
+        self.path = path
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        # 按提交顺序排列的未完成任务
+        self.jobs = []
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.jobs = json.load(f)
+            for job in self.jobs:
+                job['status'] = QUEUED
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.jobs, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _position(self, job_id):
+        for i, job in enumerate(self.jobs):
+            if job['id'] == job_id:
+                return i + 1
+        return 0
+
+    def submit(self, chat_room_name):
+        """
+        添加任务
+        :return: (任务, 排队位置, 是否新添加); 队列已满时返回 (None, 0, False)
+        """
+        with self.lock:
+            for job in self.jobs:
+                if job['chat_room_name'] == chat_room_name:
+                    return job, self._position(job['id']), False
+            if len(self.jobs) >= self.max_pending:
+                return None, 0, False
+            job = {'id': uuid.uuid4().hex[:12], 'chat_room_name': chat_room_name, 'status': QUEUED,
+                   'submitted_at': time.time()}
+            self.jobs.append(job)
+            self._save()
+            return job, len(self.jobs), True
+
+    def position(self, job_id):
+        """
+        :return: 任务在队列中的位置(1开始, 运行中的任务也算在前面), 已完成时返回0
+        """
+        with self.lock:
+            return self._position(job_id)
+
+    def queued_jobs(self):
+        """
+        :return: 还没有开始运行的任务, 按提交顺序
+        """
+        with self.lock:
+            return [dict(job) for job in self.jobs if job['status'] == QUEUED]
+
+    def start(self, job_id):
+        with self.lock:
+            for job in self.jobs:
+                if job['id'] == job_id:
+                    job['status'] = RUNNING
+                    job['started_at'] = time.time()
+            self._save()
+
+    def finish(self, job_id):
+        """
+        任务完成(成功或失败)后从队列中删除
+        """
+        with self.lock:
+            self.jobs = [job for job in self.jobs if job['id'] != job_id]
+            self._save()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.jobs)
@@ -0,0 +1,108 @@
+"""
+触发接口、手机和分析步骤的本地替身, 用于在没有手机、Appium和服务器时运行 JobService(见 benchmarks/bench_job_service)
+各步骤用sleep模拟耗时, 并记录每条消息的发送时间和每种资源的最大并发数, 用于检查排队和并发限制是否生效
+"""
+import threading
+import time
+
+
+class LocalTrigger:
+    """
+    模拟触发接口: 与真实接口一样只保存一个触发的聊天名称, clear()之后下一个用户才能触发
+    :param arrivals: [(相对开始时间的秒数, 聊天名称), ...]
+    """
+    def __init__(self, arrivals):
+        self.arrivals = sorted(arrivals)
+        self.start_time = time.time()
+        self.lock = threading.Lock()
+        self.content = ""
+        # 聊天名称 -> 实际触发的时间
+        self.arrival_times = {}
+        self.statuses = []
+
+    def fetch(self):
+        with self.lock:
+            if not self.content and self.arrivals and time.time() - self.start_time >= self.arrivals[0][0]:
+                _, self.content = self.arrivals.pop(0)
+                self.arrival_times.setdefault(self.content, time.time())
+            return self.content
+
+    def acknowledge(self, chat_room_name, status):
+        with self.lock:
+            self.statuses.append((time.time(), chat_room_name, status))
+
+    def clear(self):
+        with self.lock:
+            self.content = ""
+
+    def is_exhausted(self):
+        with self.lock:
+            return not self.arrivals and not self.content
+
+
+class LocalDevice:
+    """
+    模拟手机: 下载视频、发送消息都只是sleep, 同时进行的操作数记录在max_in_flight中(真实手机只能为1)
+    :param video_path: fetch_video返回的本地视频
+    :param fetch_seconds: 进入聊天、保存并下载视频的耗时
+    :param send_seconds: 发送一条消息(或推送图片并发送)的耗时
+    :param no_video_chats: 没有发送视频的聊天
+    """
+    def __init__(self, video_path='input_videos/input_video.mp4', fetch_seconds=0.3, send_seconds=0.1,
+                 no_video_chats=()):
+        self.video_path = video_path
+        self.fetch_seconds = fetch_seconds
+        self.send_seconds = send_seconds
+        self.no_video_chats = set(no_video_chats)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # [(发送时间, 聊天名称, 消息), ...]
+        self.messages = []
+
+    def _operate(self, seconds):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(seconds)
+        with self.lock:
+            self.in_flight -= 1
+
+    def fetch_video(self, chat_room_name):
+        self._operate(self.fetch_seconds)
+        if chat_room_name in self.no_video_chats:
+            return None
+        return "00:10", self.video_path
+
+    def send_text(self, chat_room_name, msg):
+        self._operate(self.send_seconds)
+        with self.lock:
+            self.messages.append((time.time(), chat_room_name, msg))
+
+    def send_result(self, chat_room_name, msg, image_path):
+        self._operate(self.send_seconds * 2)
+        with self.lock:
+            self.messages.append((time.time(), chat_room_name, msg))
+
+
+class LocalAnalyzer:
+    """
+    模拟本地推理和GPT请求
+    :param render_seconds: 检测球员并生成图片的耗时
+    :param review_seconds: GPT请求的耗时
+    :param failing_videos: 处理时抛出异常的视频
+    """
+    def __init__(self, render_seconds=1.0, review_seconds=1.0, failing_videos=()):
+        self.render_seconds = render_seconds
+        self.review_seconds = review_seconds
+        self.failing_videos = set(failing_videos)
+
+    def render(self, local_video_path):
+        time.sleep(self.render_seconds)
+        if local_video_path in self.failing_videos:
+            raise ValueError(f"Could not read video: {local_video_path}")
+        return f"/tmp/{local_video_path.split('/')[-1]}.jpg"
+
+    def review(self, image_path):
+        time.sleep(self.review_seconds)
+        return f"【动作】:正手\n【评分】:80分 ({image_path})"
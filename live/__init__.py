@@ -0,0 +1,3 @@
+from .live_source import LiveFrameSource
+from .online_filters import OnlineBallInterpolator, OnlineShotDetector
+from .live_analyzer import LiveAnalyzer
\ No newline at end of file
@@ -0,0 +1,180 @@
+import time
+from collections import deque
+
+import numpy as np
+import sys
+sys.path.append('../')
+from utils import DetectionTable, draw_player_stats_frame, LazyModule
+from mini_court import MiniCourt
+from match_stats import MatchStatsEngine
+from .online_filters import OnlineBallInterpolator, OnlineShotDetector
+
+cv2 = LazyModule('cv2')
+
+
+class LiveAnalyzer:
+    """
+    逐帧的实时分析
+    每一帧到达时立即检测球员、网球和球场关键点(关键点只在镜头变化时重新检测), 等之后ball_lookahead_frames帧
+    到达、网球空缺可以插值后, 映射到迷你球场、画出标注并输出; 击球在之后change_window_frames帧到达后确定,
+    确定后与上一次击球一起计入比赛数据. 迷你球场使用homography映射, 不需要向后看的球员高度窗口
+    """
+    def __init__(self, player_tracker, ball_tracker, court_keypoint_tracker, fps, ball_lookahead_frames=12):
+        """
+        :param player_tracker: PlayerTracker, 可以使用keyframe_interval减少检测次数
+        :param ball_tracker: BallTracker
+        :param court_keypoint_tracker: CourtKeypointTracker
+        :param fps: 输入的帧率
+        :param ball_lookahead_frames: 网球插值向后看的帧数, 也是输出相对输入的延迟帧数
+        """
+        self.player_tracker = player_tracker
+        self.ball_tracker = ball_tracker
+        self.court_keypoint_tracker = court_keypoint_tracker
+        self.fps = fps
+        self.ball_interpolator = OnlineBallInterpolator(ball_lookahead_frames)
+        self.shot_detector = OnlineShotDetector.from_ball_tracker(ball_tracker, fps)
+        self.court_keypoint_tracker.start()
+
+        self.mini_court = None
+        self.match_stats = None
+        self.chosen_players = None
+        # 选中的两个track id -> 比赛数据中的球员id(1, 2)
+        self.player_ids = {}
+        self.homography = None
+        self.homography_keypoints = None
+
+        # 等待网球插值的帧: 帧号 -> (帧, 读取时间, 球员, 关键点)
+        self.pending = {}
+        # 最近输出的帧在迷你球场上的位置, 击球确定时取击球帧的位置
+        self.recent_positions = deque(maxlen=self.shot_detector.change_window_frames + 2)
+        self.last_shot = None
+
+        # 统计信息
+        self.processed_frames = 0
+        self.frames = 0
+        self.shots = []
+        self.busy_seconds = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def get_court_keypoints(self, frame):
+        self.court_keypoint_tracker.update([frame])
+        self.court_keypoint_tracker.flush()
+        return self.court_keypoint_tracker.segment_keypoints[-1]
+
+    def get_homography(self, keypoints):
+        # 同一段镜头内关键点不变, 只拟合一次
+        if self.homography_keypoints is not keypoints:
+            self.homography = self.mini_court.fit_court_homography(keypoints)
+            self.homography_keypoints = keypoints
+        return self.homography
+
+    def process(self, frame_num, frame, capture_time=None):
+        """
+        送入一帧
+        :param frame_num: 帧号, 需要递增, 可以不连续(输入丢帧)
+        :param frame: 帧图像, 之后会被原地画上标注
+        :param capture_time: 读取该帧的时间(time.perf_counter()), 用于统计延迟
+        :return: 已完成的帧 [(帧号, 标注后的帧, 当前比赛数据), ...]
+        """
+        start_time = time.perf_counter()
+        if self.mini_court is None:
+            self.mini_court = MiniCourt(frame, projection='homography')
+            self.match_stats = MatchStatsEngine(self.fps, self.mini_court.get_width_of_mini_court())
+
+        # detect_frame_batch在稀疏关键帧模式下会用光流推算非关键帧
+        players = self.player_tracker.detect_frame_batch([frame], frame_num)
+        keypoints = self.get_court_keypoints(frame)
+        if self.chosen_players is None and len(np.unique(players.track_id)) >= 2:
+            self.chosen_players = self.player_tracker.choose_players(keypoints, players)
+            self.player_ids = {track_id: player_id for player_id, track_id in
+                               enumerate(sorted(self.chosen_players), start=1)}
+        if self.chosen_players is not None:
+            players = players.select(np.isin(players.track_id, self.chosen_players))
+
+        ball = self.ball_tracker.detect_frame(frame, frame_num)
+        self.pending[frame_num] = (frame, capture_time, players, keypoints)
+        results = [self.finish_frame(*item) for item in self.ball_interpolator.push(
+            frame_num, ball.bbox[0] if len(ball) else None)]
+        self.busy_seconds += time.perf_counter() - start_time
+        self.processed_frames += 1
+        return results
+
+    def flush(self):
+        """
+        输入结束, 输出所有等待中的帧
+        """
+        return [self.finish_frame(*item) for item in self.ball_interpolator.flush()]
+
+    def finish_frame(self, frame_num, ball_bbox):
+        frame, capture_time, players, keypoints = self.pending.pop(frame_num)
+        homography = self.get_homography(keypoints)
+
+        # 迷你球场上的位置
+        bbox = players.bbox.astype(np.float64)
+        foot_positions = np.stack([(bbox[:, 0] + bbox[:, 2]) / 2, bbox[:, 3]], axis=1)
+        player_ids = [self.player_ids.get(track_id, track_id) for track_id in players.track_id.tolist()]
+        player_positions = dict(zip(player_ids,
+                                    map(tuple, self.mini_court.transform_points(foot_positions, homography))))
+        ball_position = None
+        if ball_bbox is not None:
+            ball_center = [(ball_bbox[0] + ball_bbox[2]) / 2, (ball_bbox[1] + ball_bbox[3]) / 2]
+            ball_position = tuple(self.mini_court.transform_points(ball_center, homography)[0])
+        self.recent_positions.append((frame_num, player_positions, ball_position))
+
+        shot_frame = self.shot_detector.push(frame_num, ball_bbox)
+        if shot_frame is not None:
+            self.add_shot(shot_frame)
+
+        stats = self.match_stats.get_frame_stats(frame_num)
+        self.draw_frame(frame, frame_num, players, ball_bbox, keypoints, player_positions, ball_position, stats)
+
+        self.frames += 1
+        if capture_time is not None:
+            latency = time.perf_counter() - capture_time
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+        return frame_num, frame, stats
+
+    def add_shot(self, shot_frame):
+        positions = next((item for item in self.recent_positions if item[0] == shot_frame), None)
+        self.shots.append(shot_frame)
+        if positions is None:
+            return
+        _, player_positions, ball_position = positions
+        last_shot = self.last_shot
+        self.last_shot = positions
+        if last_shot is None:
+            return
+        # 两次击球时两名球员和网球都在画面中才能计算速度
+        _, last_player_positions, last_ball_position = last_shot
+        if last_ball_position is None or ball_position is None or len(last_player_positions) < 2 or \
+                set(last_player_positions) != set(player_positions):
+            return
+        self.match_stats.add_shot(last_shot[0], shot_frame, (last_ball_position, ball_position),
+                                  (last_player_positions, player_positions))
+
+    def draw_frame(self, frame, frame_num, players, ball_bbox, keypoints, player_positions, ball_position, stats):
+        self.player_tracker.draw_bbox(frame, players)
+        if ball_bbox is not None:
+            self.ball_tracker.draw_bbox(frame, DetectionTable([frame_num], [1], [ball_bbox]))
+        self.court_keypoint_tracker.court_line_detector.draw_keypoints(frame, keypoints)
+        self.mini_court.draw_mini_court_frame(frame)
+        self.mini_court.draw_points_on_mini_court_frame(frame, player_positions)
+        if ball_position is not None:
+            self.mini_court.draw_points_on_mini_court_frame(frame, {1: ball_position}, color=(0, 255, 255))
+        draw_player_stats_frame(frame, stats)
+        cv2.putText(frame, f"Frame: {frame_num}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        return frame
+
+    def get_stats(self):
+        """
+        输出的帧数、确定的击球、平均每帧处理耗时和从读取到输出的延迟(包括等待插值的时间)
+        """
+        return {
+            'frames': self.frames,
+            'shots': list(self.shots),
+            'seconds_per_frame': self.busy_seconds / max(self.processed_frames, 1),
+            'mean_latency_seconds': self.total_latency / max(self.frames, 1),
+            'max_latency_seconds': self.max_latency,
+        }
@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+from collections import deque
+import sys
+sys.path.append('../')
+from utils import LazyModule, open_video_at
+
+cv2 = LazyModule('cv2')
+
+
+class LiveFrameSource:
+    """
+    从摄像头、视频流或正在写入的文件中持续读取帧
+    读取在后台线程中进行, 等待处理的帧最多保留 latency_budget 秒, 处理跟不上时丢弃最旧的帧, 延迟不会无限增长;
+    读不到新帧时: 文件重新打开并跳过已读的帧(文件还在写入), 摄像头和视频流重新连接, 超过idle_timeout秒仍没有新帧时结束
+    replay=True 时按文件的原帧率回放, 用于在本地模拟实时输入
+    """
+    def __init__(self, source, replay=False, latency_budget=1.0, idle_timeout=5.0, poll_interval=0.2):
+        """
+        :param source: 摄像头编号(int或数字字符串)、视频流地址或文件路径
+        :param replay: 是否按原帧率回放
+        :param latency_budget: 等待处理的帧最多对应的秒数
+        :param idle_timeout: 多少秒没有新帧时认为输入结束
+        :param poll_interval: 读不到新帧时的重试间隔(秒)
+        """
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)
+        self.source = source
+        self.is_file = isinstance(source, str) and os.path.exists(source)
+        self.replay = replay
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+
+        cap = self.open_capture()
+        if not cap.isOpened():
+            raise IOError(f"Could not open video source: {source}")
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or 24
+        cap.release()
+        self.max_pending_frames = max(1, int(round(latency_budget * self.fps)))
+
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.finished = False
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.error = None
+
+        # 统计信息
+        self.frames_read = 0
+        self.frames_dropped = 0
+
+    def open_capture(self, start_frame=0):
+        """
+        :param start_frame: 文件中下一次读取的帧号; 已写入的帧不足时停在结尾, 下一次read()失败后再重新打开
+        """
+        if start_frame > 0:
+            # 逐帧grab跳过已读的帧, 按帧号seek会停在附近的关键帧, 重新打开后帧号错位
+            cap, _ = open_video_at(self.source, start_frame)
+            return cap
+        return cv2.VideoCapture(self.source)
+
+    def __iter__(self):
+        """
+        :return: 迭代 (帧号, 读取时间 time.perf_counter(), 帧), 帧号是输入中的帧号, 丢弃的帧会使帧号不连续
+        """
+        self.start()
+        try:
+            while True:
+                with self.condition:
+                    while not self.pending and not self.finished:
+                        self.condition.wait(0.1)
+                    if self.pending:
+                        item = self.pending.popleft()
+                    else:
+                        break
+                yield item
+        finally:
+            self.stop()
+        if self.error is not None:
+            raise self.error
+
+    def start(self):
+        self.stop_event.clear()
+        self.finished = False
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def get_stats(self):
+        return {'fps': self.fps, 'frames_read': self.frames_read, 'frames_dropped': self.frames_dropped}
+
+    def _put(self, item):
+        with self.condition:
+            if len(self.pending) >= self.max_pending_frames:
+                self.pending.popleft()
+                self.frames_dropped += 1
+            self.pending.append(item)
+            self.condition.notify()
+
+    def _read(self):
+        frame_num = 0
+        start_time = time.perf_counter()
+        cap = self.open_capture()
+        try:
+            last_frame_time = time.perf_counter()
+            while not self.stop_event.is_set():
+                ret, frame = cap.read()
+                if not ret:
+                    # 回放的文件已经写完, 读到结尾即结束
+                    if self.replay or time.perf_counter() - last_frame_time > self.idle_timeout:
+                        break
+                    # 文件可能还在写入, 视频流可能断开, 稍后从当前位置重新打开
+                    self.stop_event.wait(self.poll_interval)
+                    cap.release()
+                    cap = self.open_capture(frame_num if self.is_file else 0)
+                    continue
+
+                if self.replay:
+                    delay = start_time + frame_num / self.fps - time.perf_counter()
+                    if delay > 0:
+                        self.stop_event.wait(delay)
+                last_frame_time = time.perf_counter()
+                self._put((frame_num, last_frame_time, frame))
+                self.frames_read += 1
+                frame_num += 1
+        except BaseException as error:
+            self.error = error
+        finally:
+            cap.release()
+            with self.condition:
+                self.finished = True
+                self.condition.notify_all()
@@ -0,0 +1,106 @@
+from collections import deque
+
+import numpy as np
+
+
+class OnlineBallInterpolator:
+    """
+    固定lookahead的在线网球插值
+    每一帧在之后的lookahead_frames帧到达后输出: 有检测结果时原样输出; 缺失时若窗口内能找到下一次检测,
+    按帧号在前后两次检测之间线性插值(还没有检测过网球时直接使用下一次检测, 与离线的bfill一致), 否则输出None;
+    输入结束时末尾的空缺沿用最后一次检测(与离线的interpolate一致)
+    空缺不超过lookahead_frames帧时结果与 BallTracker.interpolate_ball_positions 相同
+    """
+    def __init__(self, lookahead_frames=12):
+        self.lookahead_frames = lookahead_frames
+        self.pending = deque()
+        self.last_known = None
+
+    def push(self, frame_num, bbox):
+        """
+        :param frame_num: 帧号, 需要递增
+        :param bbox: 网球检测框 [x1, y1, x2, y2], 没有检测到时为None
+        :return: 已确定的帧 [(帧号, 检测框或None), ...]
+        """
+        self.pending.append((frame_num, None if bbox is None else np.asarray(bbox, dtype=np.float64)))
+        ready = []
+        while len(self.pending) > self.lookahead_frames:
+            ready.append(self.pop())
+        return ready
+
+    def flush(self):
+        """
+        输入结束, 输出剩余的帧
+        """
+        ready = []
+        while self.pending:
+            ready.append(self.pop(hold_last=True))
+        return ready
+
+    def pop(self, hold_last=False):
+        frame_num, bbox = self.pending.popleft()
+        if bbox is not None:
+            self.last_known = (frame_num, bbox)
+            return frame_num, bbox
+
+        next_known = next(((next_frame, next_bbox) for next_frame, next_bbox in self.pending
+                           if next_bbox is not None), None)
+        if next_known is None:
+            if hold_last and self.last_known is not None:
+                return frame_num, self.last_known[1]
+            return frame_num, None
+        if self.last_known is None:
+            return frame_num, next_known[1]
+        (previous_frame, previous_bbox), (next_frame, next_bbox) = self.last_known, next_known
+        weight = (frame_num - previous_frame) / (next_frame - previous_frame)
+        return frame_num, previous_bbox + (next_bbox - previous_bbox) * weight
+
+
+class OnlineShotDetector:
+    """
+    在线击球检测, 判定规则与 trackers.ball_tracker.get_direction_change_frames 相同:
+    球中心纵坐标先做rolling_window_frames帧的滑动平均再求逐帧变化量,
+    第i帧方向改变且之后change_window_frames帧内新方向保持不少于minimum_change_frames帧时为击球;
+    因此第i帧在第 i+change_window_frames 帧到达后才能确定
+    """
+    def __init__(self, rolling_window_frames, minimum_change_frames, change_window_frames):
+        self.rolling_window_frames = rolling_window_frames
+        self.minimum_change_frames = minimum_change_frames
+        self.change_window_frames = change_window_frames
+        self.mid_y = deque(maxlen=rolling_window_frames)
+        self.previous_mean = np.nan
+        # (帧号, 变化量), 保留判定第i帧所需的 i .. i+change_window_frames
+        self.deltas = deque(maxlen=change_window_frames + 1)
+        self.num_frames = 0
+
+    @classmethod
+    def from_ball_tracker(cls, ball_tracker, fps):
+        return cls(*ball_tracker.get_shot_detection_frames(fps))
+
+    def push(self, frame_num, bbox):
+        """
+        :param frame_num: 帧号
+        :param bbox: 插值后的网球检测框, 没有时为None
+        :return: 新确定的击球帧号, 没有时为None
+        """
+        self.mid_y.append(np.nan if bbox is None else (bbox[1] + bbox[3]) / 2)
+        # 与pandas rolling(min_periods=1).mean()一样忽略NaN
+        values = np.array(self.mid_y)
+        values = values[~np.isnan(values)]
+        mean = values.mean() if len(values) else np.nan
+        self.deltas.append((frame_num, mean - self.previous_mean))
+        self.previous_mean = mean
+        self.num_frames += 1
+
+        # 第0帧没有前一帧的变化量, 不参与判定
+        if len(self.deltas) < self.change_window_frames + 1 or self.num_frames < self.change_window_frames + 2:
+            return None
+        shot_frame, delta = self.deltas[0]
+        window = np.array([value for _, value in list(self.deltas)[1:]])
+        moving_down = delta > 0
+        moving_up = delta < 0
+        if moving_down and window[0] < 0 and (window < 0).sum() >= self.minimum_change_frames:
+            return shot_frame
+        if moving_up and window[0] > 0 and (window > 0).sum() >= self.minimum_change_frames:
+            return shot_frame
+        return None
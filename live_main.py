@@ -0,0 +1,71 @@
+"""
+实时分析: 从摄像头、视频流或正在写入的文件中逐帧读取, 持续输出标注后的帧和比赛数据
+
+用法:
+    python live_main.py 0                                    # 摄像头0
+    python live_main.py rtsp://host/stream --output output_videos/live.mp4
+    python live_main.py input_videos/input_video.mp4 --replay  # 按原帧率回放文件, 在本地模拟实时输入
+"""
+import argparse
+import json
+
+from utils import VideoEncoder
+from trackers import PlayerTracker, BallTracker
+from court_line_detector import CourtLineDetector, CourtKeypointTracker
+from live import LiveFrameSource, LiveAnalyzer
+from telemetry import profiler, add_profile_arguments, start_profiling_from_args, finish_profiling_from_args
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('source', help='摄像头编号、视频流地址或视频文件')
+    parser.add_argument('--replay', action='store_true', help='按原帧率回放视频文件')
+    parser.add_argument('--output', default='output_videos/live_output.mp4', help='标注后的视频, 为空时不保存')
+    parser.add_argument('--stats', default=None, help='每次确定击球后把当前比赛数据追加到该jsonl文件')
+    parser.add_argument('--latency-budget', type=float, default=1.0, help='等待处理的帧最多对应的秒数')
+    parser.add_argument('--keyframe-interval', type=int, default=1, help='球员检测的关键帧间隔, 1为逐帧检测')
+    parser.add_argument('--ball-lookahead', type=int, default=12, help='网球插值向后看的帧数')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    start_profiling_from_args(args)
+
+    source = LiveFrameSource(args.source, replay=args.replay, latency_budget=args.latency_budget)
+    player_tracker = PlayerTracker(model_path='yolov8x', keyframe_interval=args.keyframe_interval)
+    ball_tracker = BallTracker(model_path='models/yolo5_last.pt')
+    court_keypoint_tracker = CourtKeypointTracker(CourtLineDetector("models/keypoints_model.pth"), batch_size=1)
+    analyzer = LiveAnalyzer(player_tracker, ball_tracker, court_keypoint_tracker, source.fps,
+                            ball_lookahead_frames=args.ball_lookahead)
+
+    encoder = VideoEncoder(args.output, fps=source.fps) if args.output else None
+    stats_file = open(args.stats, 'a') if args.stats else None
+    num_shots = 0
+
+    def write_results(results):
+        nonlocal num_shots
+        for frame_num, frame, stats in results:
+            if encoder is not None:
+                encoder.write(frame)
+            if stats_file is not None and len(analyzer.match_stats) != num_shots:
+                num_shots = len(analyzer.match_stats)
+                stats_file.write(json.dumps(stats) + "\n")
+                stats_file.flush()
+
+    try:
+        for frame_num, capture_time, frame in source:
+            with profiler.stage("live_process", 1):
+                results = analyzer.process(frame_num, frame, capture_time)
+            write_results(results)
+        write_results(analyzer.flush())
+    finally:
+        if encoder is not None:
+            encoder.close()
+        if stats_file is not None:
+            stats_file.close()
+    print(f"source: {source.get_stats()}, analyzer: {analyzer.get_stats()}")
+    if encoder is not None:
+        print(f"encode: {encoder.get_stats()}")
+    finish_profiling_from_args(args)
+
+
+if __name__ == "__main__":
+    main()
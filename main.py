@@ -1,148 +1,176 @@
-from utils import (read_video, 
+import argparse
+from itertools import islice
+from utils import (VideoFrameReader,
+                   batch_frames,
+                   DetectionTable,
                    save_video,
-                   measure_distance,
-                   draw_player_stats,
-                   convert_pixel_distance_to_meters
+                   PlayerStatsPanel,
+                   LazyModule
                    )
-import constants
-from trackers import PlayerTracker,BallTracker
-from court_line_detector import CourtLineDetector
+from trackers import PlayerTracker,BallTracker,detect_players_and_ball_sharded
+from court_line_detector import CourtLineDetector, CourtKeypointTracker
 from mini_court import MiniCourt
-import cv2
-import pandas as pd
-from copy import deepcopy
-
-
-def main():
+from pipeline import Pipeline
+from renderer import OverlayRenderer
+from match_stats import MatchStatsEngine
+from telemetry import profiler, add_profile_arguments, start_profiling_from_args, finish_profiling_from_args
+
+cv2 = LazyModule('cv2')
+
+
+def detect_players_and_ball(video_reader, player_tracker, ball_tracker, cache_dir=None, batch_size=8):
+    """
+    解码、球员检测、网球检测三个阶段在各自的线程中同时运行
+    检测结果按块追加到缓存中, 同一视频、模型和参数再次运行时直接读取缓存, 不再推理
+    """
+    player_cache = None
+    ball_cache = None
+    if cache_dir is not None:
+        player_cache = player_tracker.open_detection_cache(cache_dir, video_reader.video_path)
+        ball_cache = ball_tracker.open_detection_cache(cache_dir, video_reader.video_path)
+        player_detections = player_cache.load()
+        ball_detections = ball_cache.load()
+        if player_detections is not None and ball_detections is not None:
+            return player_detections, ball_detections
+        player_cache.start()
+        ball_cache.start()
+
+    def detect_players(item):
+        start_frame, frames = item
+        batch_player_detections = player_tracker.detect_frame_batch(frames, start_frame=start_frame)
+        if player_cache is not None:
+            player_cache.append(batch_player_detections)
+        return start_frame, frames, batch_player_detections
+
+    def detect_ball(item):
+        start_frame, frames, batch_player_detections = item
+        batch_ball_detections = ball_tracker.detect_frame_batch(frames, start_frame=start_frame)
+        if ball_cache is not None:
+            ball_cache.append(batch_ball_detections)
+        return batch_player_detections, batch_ball_detections
+
+    # 每个条目是一个batch, 帧数为其中frames的长度
+    detection_pipeline = Pipeline(queue_size=4)
+    detection_pipeline.add_stage("detect_players", detect_players, count_frames=lambda item: len(item[1]))
+    detection_pipeline.add_stage("detect_ball", detect_ball, count_frames=lambda item: len(item[1]))
+
+    # 每个batch带上第一帧的帧号, 检测结果中使用整段视频的绝对帧号
+    batches = ((batch_num * batch_size, frames) for batch_num, frames in enumerate(batch_frames(video_reader,
+                                                                                                 batch_size)))
+    player_detections = []
+    ball_detections = []
+    for batch_player_detections, batch_ball_detections in detection_pipeline.run(batches):
+        player_detections.append(batch_player_detections)
+        ball_detections.append(batch_ball_detections)
+    player_detections = DetectionTable.concatenate(player_detections)
+    ball_detections = DetectionTable.concatenate(ball_detections, num_frames=player_detections.num_frames)
+    print(f"detection stages: {detection_pipeline.get_stage_stats()}")
+
+    if cache_dir is not None:
+        player_cache.finish()
+        ball_cache.finish()
+    return player_detections, ball_detections
+
+
+def main(detection_workers=1):
+    """
+    :param detection_workers: 大于1时把视频分段, 由多个进程并行检测球员和网球, 再接续各段的track id
+    """
     # Read Video
     input_video_path = "input_videos/input_video.mp4"
-    video_frames = read_video(input_video_path)
+    video_reader = VideoFrameReader(input_video_path)
+    first_frame = video_reader.read_frame(0)
 
     # Detect Players and Ball
     player_tracker = PlayerTracker(model_path='yolov8x')
     ball_tracker = BallTracker(model_path='models/yolo5_last.pt')
 
-    player_detections = player_tracker.detect_frames(video_frames,
-                                                     read_from_stub=True,
-                                                     stub_path="tracker_stubs/player_detections.pkl"
-                                                     )
-    ball_detections = ball_tracker.detect_frames(video_frames,
-                                                     read_from_stub=True,
-                                                     stub_path="tracker_stubs/ball_detections.pkl"
-                                                     )
-    ball_detections = ball_tracker.interpolate_ball_positions(ball_detections)
+    with profiler.stage("detect_players_and_ball", len(video_reader)):
+        if detection_workers > 1:
+            player_detections, ball_detections = detect_players_and_ball_sharded(input_video_path, player_tracker,
+                                                                                 ball_tracker,
+                                                                                 workers=detection_workers,
+                                                                                 cache_dir="tracker_cache")
+        else:
+            player_detections, ball_detections = detect_players_and_ball(video_reader, player_tracker, ball_tracker,
+                                                                         cache_dir="tracker_cache")
+    with profiler.stage("interpolate_ball_positions", player_detections.num_frames):
+        ball_detections = ball_tracker.interpolate_ball_positions(ball_detections)
     
     
     # Court Line Detector model
     court_model_path = "models/keypoints_model.pth"
     court_line_detector = CourtLineDetector(court_model_path)
-    court_keypoints = court_line_detector.predict(video_frames[0])
+    # 只在镜头移动或切换时重新检测关键点, court_keypoints[frame_num] 为每一帧的关键点
+    court_keypoint_tracker = CourtKeypointTracker(court_line_detector)
+    with profiler.stage("detect_court_keypoints", len(video_reader)):
+        court_keypoints = court_keypoint_tracker.detect_frames(video_reader, cache_dir="tracker_cache")
 
     # choose players
-    player_detections = player_tracker.choose_and_filter_players(court_keypoints, player_detections)
+    player_detections = player_tracker.choose_and_filter_players(court_keypoints[0], player_detections)
 
     # MiniCourt
-    mini_court = MiniCourt(video_frames[0]) 
+    mini_court = MiniCourt(first_frame) 
 
     # Detect ball shots
-    ball_shot_frames= ball_tracker.get_ball_shot_frames(ball_detections)
+    with profiler.stage("get_ball_shot_frames", player_detections.num_frames):
+        ball_shot_frames= ball_tracker.get_ball_shot_frames(ball_detections, fps=video_reader.fps)
 
     # Convert positions to mini court positions
-    player_mini_court_detections, ball_mini_court_detections = mini_court.convert_bounding_boxes_to_mini_court_coordinates(player_detections, 
-                                                                                                          ball_detections,
-                                                                                                          court_keypoints)
-
-    player_stats_data = [{
-        'frame_num':0,
-        'player_1_number_of_shots':0,
-        'player_1_total_shot_speed':0,
-        'player_1_last_shot_speed':0,
-        'player_1_total_player_speed':0,
-        'player_1_last_player_speed':0,
-
-        'player_2_number_of_shots':0,
-        'player_2_total_shot_speed':0,
-        'player_2_last_shot_speed':0,
-        'player_2_total_player_speed':0,
-        'player_2_last_player_speed':0,
-    } ]
-    
-    for ball_shot_ind in range(len(ball_shot_frames)-1):
-        start_frame = ball_shot_frames[ball_shot_ind]
-        end_frame = ball_shot_frames[ball_shot_ind+1]
-        ball_shot_time_in_seconds = (end_frame-start_frame)/24 # 24fps
-
-        # Get distance covered by the ball
-        distance_covered_by_ball_pixels = measure_distance(ball_mini_court_detections[start_frame][1],
-                                                           ball_mini_court_detections[end_frame][1])
-        distance_covered_by_ball_meters = convert_pixel_distance_to_meters( distance_covered_by_ball_pixels,
-                                                                           constants.DOUBLE_LINE_WIDTH,
-                                                                           mini_court.get_width_of_mini_court()
-                                                                           ) 
-
-        # Speed of the ball shot in km/h
-        speed_of_ball_shot = distance_covered_by_ball_meters/ball_shot_time_in_seconds * 3.6
-
-        # player who the ball
-        player_positions = player_mini_court_detections[start_frame]
-        player_shot_ball = min( player_positions.keys(), key=lambda player_id: measure_distance(player_positions[player_id],
-                                                                                                 ball_mini_court_detections[start_frame][1]))
-
-        # opponent player speed
-        opponent_player_id = 1 if player_shot_ball == 2 else 2
-        distance_covered_by_opponent_pixels = measure_distance(player_mini_court_detections[start_frame][opponent_player_id],
-                                                                player_mini_court_detections[end_frame][opponent_player_id])
-        distance_covered_by_opponent_meters = convert_pixel_distance_to_meters( distance_covered_by_opponent_pixels,
-                                                                           constants.DOUBLE_LINE_WIDTH,
-                                                                           mini_court.get_width_of_mini_court()
-                                                                           ) 
-
-        speed_of_opponent = distance_covered_by_opponent_meters/ball_shot_time_in_seconds * 3.6
-
-        current_player_stats= deepcopy(player_stats_data[-1])
-        current_player_stats['frame_num'] = start_frame
-        current_player_stats[f'player_{player_shot_ball}_number_of_shots'] += 1
-        current_player_stats[f'player_{player_shot_ball}_total_shot_speed'] += speed_of_ball_shot
-        current_player_stats[f'player_{player_shot_ball}_last_shot_speed'] = speed_of_ball_shot
+    with profiler.stage("convert_to_mini_court", player_detections.num_frames):
+        player_mini_court_detections, ball_mini_court_detections = mini_court.convert_bounding_boxes_to_mini_court_coordinates(player_detections, 
+                                                                                                              ball_detections,
+                                                                                                              court_keypoints)
 
-        current_player_stats[f'player_{opponent_player_id}_total_player_speed'] += speed_of_opponent
-        current_player_stats[f'player_{opponent_player_id}_last_player_speed'] = speed_of_opponent
-
-        player_stats_data.append(current_player_stats)
-
-    player_stats_data_df = pd.DataFrame(player_stats_data)
-    frames_df = pd.DataFrame({'frame_num': list(range(len(video_frames)))})
-    player_stats_data_df = pd.merge(frames_df, player_stats_data_df, on='frame_num', how='left')
-    player_stats_data_df = player_stats_data_df.ffill()
-
-    player_stats_data_df['player_1_average_shot_speed'] = player_stats_data_df['player_1_total_shot_speed']/player_stats_data_df['player_1_number_of_shots']
-    player_stats_data_df['player_2_average_shot_speed'] = player_stats_data_df['player_2_total_shot_speed']/player_stats_data_df['player_2_number_of_shots']
-    player_stats_data_df['player_1_average_player_speed'] = player_stats_data_df['player_1_total_player_speed']/player_stats_data_df['player_2_number_of_shots']
-    player_stats_data_df['player_2_average_player_speed'] = player_stats_data_df['player_2_total_player_speed']/player_stats_data_df['player_1_number_of_shots']
+    # 按击球计算球速和跑动速度, 展开为每帧的数据
+    with profiler.stage("match_stats", player_detections.num_frames):
+        match_stats = MatchStatsEngine(video_reader.fps, mini_court.get_width_of_mini_court())
+        match_stats.add_shots(ball_shot_frames, player_mini_court_detections, ball_mini_court_detections)
+        player_stats_data_df = match_stats.to_dataframe(player_detections.num_frames)
 
 
 
     # Draw output
-    ## Draw Player Bounding Boxes
-    output_video_frames= player_tracker.draw_bboxes(video_frames, player_detections)
-    output_video_frames= ball_tracker.draw_bboxes(output_video_frames, ball_detections)
+    # 数据面板只在数值变化时重绘文字
+    player_stats_panel = PlayerStatsPanel(player_stats_data_df)
 
+    # 所有图层在一次遍历中原地画到同一帧上
+    renderer = OverlayRenderer()
+    ## Draw Player Bounding Boxes
+    renderer.add_layer("players", lambda frame, frame_num: player_tracker.draw_bbox(
+        frame, player_detections.get_frame(frame_num)))
+    renderer.add_layer("ball", lambda frame, frame_num: ball_tracker.draw_bbox(
+        frame, ball_detections.get_frame(frame_num)))
     ## Draw court Keypoints
-    output_video_frames  = court_line_detector.draw_keypoints_on_video(output_video_frames, court_keypoints)
-
+    renderer.add_layer("court_keypoints", lambda frame, frame_num: court_line_detector.draw_keypoints(
+        frame, court_keypoints[frame_num]))
     # Draw Mini Court
-    output_video_frames = mini_court.draw_mini_court(output_video_frames)
-    output_video_frames = mini_court.draw_points_on_mini_court(output_video_frames,player_mini_court_detections)
-    output_video_frames = mini_court.draw_points_on_mini_court(output_video_frames,ball_mini_court_detections, color=(0,255,255))    
-
+    renderer.add_layer("mini_court", lambda frame, frame_num: mini_court.draw_mini_court_frame(frame))
+    def draw_mini_court_points(frame, frame_num):
+        mini_court.draw_points_on_mini_court_frame(frame, player_mini_court_detections[frame_num])
+        mini_court.draw_points_on_mini_court_frame(frame, ball_mini_court_detections[frame_num], color=(0,255,255))
+    renderer.add_layer("mini_court_points", draw_mini_court_points)
     # Draw Player Stats
-    output_video_frames = draw_player_stats(output_video_frames,player_stats_data_df)
-
+    renderer.add_layer("player_stats", player_stats_panel.draw)
     ## Draw frame number on top left corner
-    for i, frame in enumerate(output_video_frames):
-        cv2.putText(frame, f"Frame: {i}",(10,30),cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-
-    save_video(output_video_frames, "output_videos/output_video.avi")
+    renderer.add_layer("frame_number", lambda frame, frame_num: cv2.putText(
+        frame, f"Frame: {frame_num}",(10,30),cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2))
+
+    # decode → render → encode: 解码、绘制和编码分别在后台线程中进行
+    render_pipeline = Pipeline(queue_size=8)
+    render_pipeline.add_stage("render", renderer, workers=2)
+    with profiler.stage("render_and_encode", player_detections.num_frames):
+        encode_stats = save_video(render_pipeline.run(enumerate(islice(video_reader, player_detections.num_frames))),
+                                  "output_videos/output_video.mp4", fps=video_reader.fps)
+    print(f"render stages: {render_pipeline.get_stage_stats()}, encode: {encode_stats}")
+    print(f"render layers: {renderer.get_layer_stats()}, stats panel renders: {player_stats_panel.renders}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    add_profile_arguments(parser)
+    parser.add_argument('--detection-workers', type=int, default=1,
+                        help='大于1时把视频分段, 由多个进程并行检测球员和网球')
+    args = parser.parse_args()
+    start_profiling_from_args(args)
+    main(detection_workers=args.detection_workers)
+    finish_profiling_from_args(args)
\ No newline at end of file
@@ -0,0 +1 @@
+from .match_stats_engine import MatchStatsEngine
\ No newline at end of file
@@ -0,0 +1,149 @@
+import numpy as np
+import sys
+sys.path.append('../')
+import constants
+from utils import measure_distance, convert_pixel_distance_to_meters, LazyModule
+
+pd = LazyModule('pandas')
+
+PLAYER_IDS = (1, 2)
+
+# 每次击球后累计的数据, 顺序与 MatchStatsEngine.states 的列一致
+STATE_COLUMNS = [
+    f'player_{player_id}_{name}'
+    for player_id in PLAYER_IDS
+    for name in ['number_of_shots', 'total_shot_speed', 'last_shot_speed', 'total_player_speed', 'last_player_speed']
+]
+
+# 按帧输出时由累计数据算出的平均值: 列名 -> (分子, 分母)
+# 球员跑动速度在对手击球时记录, 所以平均跑动速度除以对手的击球数
+AVERAGE_COLUMNS = {
+    'player_1_average_shot_speed': ('player_1_total_shot_speed', 'player_1_number_of_shots'),
+    'player_2_average_shot_speed': ('player_2_total_shot_speed', 'player_2_number_of_shots'),
+    'player_1_average_player_speed': ('player_1_total_player_speed', 'player_2_number_of_shots'),
+    'player_2_average_player_speed': ('player_2_total_player_speed', 'player_1_number_of_shots'),
+}
+
+
+class MatchStatsEngine:
+    """
+    增量计算的比赛数据
+    每次击球只在上一次的累计数据上更新一行(O(1)), 逐帧的数据在需要时按击球帧号一次性展开;
+    既可以离线处理整段视频的击球帧(add_shots), 也可以在实时处理中每确认一次击球就调用add_shot
+    """
+    def __init__(self, fps, mini_court_width, court_width_meters=constants.DOUBLE_LINE_WIDTH):
+        """
+        :param fps: 视频帧率, 用于把帧数换算成秒
+        :param mini_court_width: 迷你球场的宽度(像素), 即 MiniCourt.get_width_of_mini_court()
+        :param court_width_meters: 迷你球场宽度对应的实际距离(米)
+        """
+        self.fps = fps
+        self.mini_court_width = mini_court_width
+        self.court_width_meters = court_width_meters
+
+        # 第0行为开始时的全0数据, 之后每次击球一行
+        self.shot_frames = [0]
+        self.states = [np.zeros(len(STATE_COLUMNS))]
+        self.num_shots = 0
+
+    def __len__(self):
+        # 已记录的击球数
+        return self.num_shots
+
+    def get_speed(self, start_position, end_position, num_frames):
+        """
+        :return: 迷你球场上两点之间在num_frames帧内的平均速度(km/h)
+        """
+        distance_pixels = measure_distance(start_position, end_position)
+        distance_meters = convert_pixel_distance_to_meters(distance_pixels, self.court_width_meters,
+                                                           self.mini_court_width)
+        return distance_meters / (num_frames / self.fps) * 3.6
+
+    def add_shot(self, start_frame, end_frame, ball_positions, player_positions):
+        """
+        记录一次击球, 从这一次击球到下一次击球之间的球速和对手的跑动速度
+        :param start_frame: 本次击球的帧号, 需要大于之前记录的击球
+        :param end_frame: 下一次击球的帧号
+        :param ball_positions: (击球时网球位置, 下一次击球时网球位置), 迷你球场坐标
+        :param player_positions: (击球时 {球员id: 位置}, 下一次击球时 {球员id: 位置}), 迷你球场坐标
+        :return: 更新后的累计数据 {列名: 值}
+        """
+        if self.num_shots and start_frame <= self.shot_frames[-1]:
+            raise ValueError(f"Shot at frame {start_frame} is not after the last shot at {self.shot_frames[-1]}")
+        ball_start, ball_end = ball_positions
+        players_start, players_end = player_positions
+        num_frames = end_frame - start_frame
+
+        # 离网球最近的球员击球
+        speed_of_ball_shot = self.get_speed(ball_start, ball_end, num_frames)
+        player_shot_ball = min(players_start.keys(),
+                               key=lambda player_id: measure_distance(players_start[player_id], ball_start))
+        opponent_player_id = 1 if player_shot_ball == 2 else 2
+        speed_of_opponent = self.get_speed(players_start[opponent_player_id], players_end[opponent_player_id],
+                                           num_frames)
+
+        state = self.states[-1].copy()
+        shooter = STATE_COLUMNS.index(f'player_{player_shot_ball}_number_of_shots')
+        opponent = STATE_COLUMNS.index(f'player_{opponent_player_id}_number_of_shots')
+        state[shooter] += 1
+        state[shooter + 1] += speed_of_ball_shot
+        state[shooter + 2] = speed_of_ball_shot
+        state[opponent + 3] += speed_of_opponent
+        state[opponent + 4] = speed_of_opponent
+
+        if start_frame == 0:
+            # 第0帧就击球时替换初始数据
+            self.states[0] = state
+        else:
+            self.shot_frames.append(start_frame)
+            self.states.append(state)
+        self.num_shots += 1
+        return dict(zip(STATE_COLUMNS, state.tolist()))
+
+    def add_shots(self, ball_shot_frames, player_mini_court_detections, ball_mini_court_detections):
+        """
+        离线处理整段视频: 相邻两次击球之间为一次击球的数据, 最后一次击球没有下一次击球, 不计入
+        :param ball_shot_frames: 击球帧号列表
+        :param player_mini_court_detections: [{球员id: 位置}, ...] 每帧的球员位置
+        :param ball_mini_court_detections: [{1: 位置}, ...] 每帧的网球位置
+        :return: self
+        """
+        for start_frame, end_frame in zip(ball_shot_frames[:-1], ball_shot_frames[1:]):
+            self.add_shot(start_frame, end_frame,
+                          (ball_mini_court_detections[start_frame][1], ball_mini_court_detections[end_frame][1]),
+                          (player_mini_court_detections[start_frame], player_mini_court_detections[end_frame]))
+        return self
+
+    def get_frame_arrays(self, num_frames):
+        """
+        展开为逐帧的数据, 每一帧取该帧及之前最后一次击球后的累计值, 并计算平均值(没有击球时为NaN)
+        :param num_frames: 视频帧数
+        :return: {列名: (num_frames,) 数组}
+        """
+        frame_nums = np.arange(num_frames)
+        state_index = np.searchsorted(np.asarray(self.shot_frames), frame_nums, side='right') - 1
+        states = np.stack(self.states)[state_index]
+        arrays = {'frame_num': frame_nums}
+        arrays.update({column: states[:, i] for i, column in enumerate(STATE_COLUMNS)})
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for column, (numerator, denominator) in AVERAGE_COLUMNS.items():
+                arrays[column] = arrays[numerator] / arrays[denominator]
+        return arrays
+
+    def get_frame_stats(self, frame_num):
+        """
+        某一帧的数据, 实时处理时用于显示当前帧
+        :return: {列名: 值}
+        """
+        state_index = np.searchsorted(np.asarray(self.shot_frames), frame_num, side='right') - 1
+        stats = dict(frame_num=frame_num, **dict(zip(STATE_COLUMNS, self.states[state_index].tolist())))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for column, (numerator, denominator) in AVERAGE_COLUMNS.items():
+                stats[column] = float(np.float64(stats[numerator]) / stats[denominator])
+        return stats
+
+    def to_dataframe(self, num_frames):
+        """
+        :return: 每帧一行的DataFrame, 列与 get_frame_arrays 相同, 可直接交给PlayerStatsPanel
+        """
+        return pd.DataFrame(self.get_frame_arrays(num_frames))
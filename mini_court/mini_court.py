@@ -1,4 +1,3 @@
-import cv2
 import numpy as np
 import sys
 sys.path.append('../')
@@ -6,16 +5,27 @@ import constants
 from utils import (
     convert_meters_to_pixel_distance,
     convert_pixel_distance_to_meters,
-    get_foot_position,
-    get_closest_keypoint_index,
-    get_height_of_bbox,
     measure_xy_distance,
-    get_center_of_bbox,
-    measure_distance
+    sliding_window_max,
+    blend_rectangle,
+    LazyModule
 )
 
+cv2 = LazyModule('cv2')
+
+# 球场坐标映射方式
+# player_height: 以离目标最近的参考关键点为原点, 用球员的像素高度作比例尺换算距离
+# homography: 用14个球场关键点拟合一个单应矩阵, 所有点一次透视变换
+PROJECTION_MODES = ('player_height', 'homography')
+
+
 class MiniCourt():
-    def __init__(self,frame):
+    def __init__(self,frame, projection='player_height'):
+        if projection not in PROJECTION_MODES:
+            raise ValueError(f"Unknown projection mode: {projection}, expected one of {PROJECTION_MODES}")
+        self.projection = projection
+        self.homography_ransac_threshold = 3.0
+
         self.drawing_rectangle_width = 250
         self.drawing_rectangle_height = 500
         self.buffer = 50
@@ -25,6 +35,7 @@ class MiniCourt():
         self.set_mini_court_position()
         self.set_court_drawing_key_points()
         self.set_court_lines()
+        self.set_court_layer(frame)
 
 
     def convert_meters_to_pixels(self, meters):
@@ -100,6 +111,23 @@ class MiniCourt():
         self.court_end_y = self.end_y - self.padding_court
         self.court_drawing_width = self.court_end_x - self.court_start_x
 
+    def set_court_layer(self, frame):
+        # 迷你球场的点和线每一帧都一样, 初始化时画一次, 每帧只需按掩码拷贝
+        # 分别画在全黑和全白的画布上, 两者相同的像素就是被画到的像素
+        black_canvas = self.draw_court(np.zeros_like(frame, np.uint8))
+        white_canvas = self.draw_court(np.full_like(frame, 255, np.uint8))
+        mask = (black_canvas == white_canvas).all(axis=2)
+        ys, xs = np.nonzero(mask)
+        if len(ys) == 0:
+            self.court_layer_box = (0, 0, 0, 0)
+            self.court_layer = black_canvas[:0, :0]
+            self.court_layer_mask = mask[:0, :0, None]
+            return
+        x1, y1, x2, y2 = xs.min(), ys.min(), xs.max() + 1, ys.max() + 1
+        self.court_layer_box = (x1, y1, x2, y2)
+        self.court_layer = black_canvas[y1:y2, x1:x2].copy()
+        self.court_layer_mask = mask[y1:y2, x1:x2, None].copy()
+
     def set_canvas_background_box_position(self,frame):
         frame= frame.copy()
 
@@ -128,24 +156,28 @@ class MiniCourt():
         return frame
 
     def draw_background_rectangle(self,frame):
-        shapes = np.zeros_like(frame,np.uint8)
-        # Draw the rectangle
-        cv2.rectangle(shapes, (self.start_x, self.start_y), (self.end_x, self.end_y), (255, 255, 255), cv2.FILLED)
-        out = frame.copy()
+        # 只混合背景矩形区域, 原地修改
         alpha=0.5
-        mask = shapes.astype(bool)
-        out[mask] = cv2.addWeighted(frame, alpha, shapes, 1 - alpha, 0)[mask]
+        return blend_rectangle(frame, (self.start_x, self.start_y), (self.end_x, self.end_y), (255, 255, 255),
+                               1 - alpha)
 
-        return out
+    def draw_court_layer(self, frame):
+        # 拷贝初始化时画好的迷你球场, 结果与draw_court相同
+        x1, y1, x2, y2 = self.court_layer_box
+        np.copyto(frame[y1:y2, x1:x2], self.court_layer, where=self.court_layer_mask)
+        return frame
 
     def draw_mini_court(self,frames):
         output_frames = []
         for frame in frames:
-            frame = self.draw_background_rectangle(frame)
-            frame = self.draw_court(frame)
-            output_frames.append(frame)
+            output_frames.append(self.draw_mini_court_frame(frame))
         return output_frames
 
+    def draw_mini_court_frame(self,frame):
+        frame = self.draw_background_rectangle(frame)
+        frame = self.draw_court_layer(frame)
+        return frame
+
     def get_start_point_of_mini_court(self):
         return (self.court_start_x,self.court_start_y)
     def get_width_of_mini_court(self):
@@ -186,80 +218,261 @@ class MiniCourt():
 
         return  mini_court_player_position
 
-    def convert_bounding_boxes_to_mini_court_coordinates(self,player_boxes, ball_boxes, original_court_key_points ):
+    def get_mini_court_coordinates_batch(self,
+                                         object_positions,
+                                         original_court_key_points,
+                                         player_heights_in_pixels,
+                                         player_heights_in_meters,
+                                         key_point_indices=(0, 2, 12, 13)
+                                         ):
+        """
+        get_mini_court_coordinates 的数组版本, 一次映射任意多个点
+        计算的dtype跟随关键点(CourtLineDetector输出float32), 与逐点计算时numpy标量的类型提升一致, 结果逐位相同
+        :param object_positions: (N, 2) 视频中的位置
+        :param original_court_key_points: 视频中的球场关键点 [x0, y0, x1, y1, ...], 或每个点各自的关键点 (N, 28)
+        :param player_heights_in_pixels: (N,) 用作比例尺的球员像素高度
+        :param player_heights_in_meters: (N,) 对应球员的实际身高
+        :param key_point_indices: 候选的参考关键点
+        :return: (N, 2) 迷你球场上的位置
+        """
+        key_points = np.asarray(original_court_key_points)
+        dtype = np.result_type(key_points.dtype, 0.0)
+        object_positions = np.asarray(object_positions).astype(dtype).reshape(-1, 2)
+        key_point_rows = np.arange(len(object_positions)) if key_points.ndim == 2 else \
+            np.zeros(len(object_positions), dtype=np.int64)
+        key_points = key_points.astype(dtype).reshape(-1, key_points.shape[-1] // 2, 2)
+        key_point_indices = np.asarray(key_point_indices)
+
+        # Get The closest keypoint in pixels (只比较纵向距离, 相同时取靠前的关键点)
+        candidate_distances = np.abs(object_positions[:, 1:2] - key_points[key_point_rows][:, key_point_indices, 1])
+        closest_key_point_index = key_point_indices[np.argmin(candidate_distances, axis=1)]
+        closest_key_point = key_points[key_point_rows, closest_key_point_index]
+
+        distance_from_keypoint_x_pixels, distance_from_keypoint_y_pixels = measure_xy_distance(object_positions.T,
+                                                                                               closest_key_point.T)
+
+        # Conver pixel distance to meters
+        player_heights_in_meters = np.asarray(player_heights_in_meters).astype(dtype)
+        player_heights_in_pixels = np.asarray(player_heights_in_pixels).astype(dtype)
+        distance_from_keypoint_x_meters = convert_pixel_distance_to_meters(distance_from_keypoint_x_pixels,
+                                                                           player_heights_in_meters,
+                                                                           player_heights_in_pixels
+                                                                           )
+        distance_from_keypoint_y_meters = convert_pixel_distance_to_meters(distance_from_keypoint_y_pixels,
+                                                                           player_heights_in_meters,
+                                                                           player_heights_in_pixels
+                                                                           )
+
+        # Convert to mini court coordinates
+        mini_court_x_distance_pixels = self.convert_meters_to_pixels(distance_from_keypoint_x_meters)
+        mini_court_y_distance_pixels = self.convert_meters_to_pixels(distance_from_keypoint_y_meters)
+        drawing_key_points = np.asarray(self.drawing_key_points).astype(dtype).reshape(-1, 2)
+        closest_mini_court_keypoint = drawing_key_points[closest_key_point_index]
+
+        return np.stack([closest_mini_court_keypoint[:, 0] + mini_court_x_distance_pixels,
+                         closest_mini_court_keypoint[:, 1] + mini_court_y_distance_pixels], axis=1)
+
+    def get_rolling_player_heights(self, player_boxes, frames_before=20, frames_after=50):
+        """
+        每名球员在前frames_before帧到后frames_after帧内的最大检测框高度, 用作像素到米的比例尺
+        :param player_boxes: DetectionTable
+        :return: {player_id: (num_frames,) 数组}, 窗口内没有检测结果时为0
+        """
+        rolling_heights = {}
+        for player_id in player_boxes.track_ids:
+            track_boxes = player_boxes.get_track_boxes(player_id)
+            rolling_heights[player_id] = sliding_window_max(track_boxes[:, 3] - track_boxes[:, 1],
+                                                            frames_before, frames_after)
+        return rolling_heights
+
+    def fit_court_homography(self, original_court_key_points):
+        """
+        拟合从视频画面到迷你球场的单应矩阵, 14个关键点与drawing_key_points一一对应
+        使用RANSAC, 个别关键点检测偏差较大时不影响结果
+        :param original_court_key_points: 视频中的球场关键点 [x0, y0, x1, y1, ...]
+        :return: 3x3 单应矩阵
+        """
+        src_points = np.asarray(original_court_key_points, dtype=np.float64).reshape(-1, 2)
+        dst_points = np.asarray(self.drawing_key_points, dtype=np.float64).reshape(-1, 2)
+        homography, _ = cv2.findHomography(src_points, dst_points, cv2.RANSAC, self.homography_ransac_threshold)
+        if homography is None:
+            raise ValueError("Could not fit a court homography from the detected keypoints")
+        return homography
+
+    def get_keypoint_segments(self, original_court_key_points, num_frames):
+        """
+        把关键点拆成若干段, 每段内所有帧共用一组关键点
+        :param original_court_key_points: 所有帧共用的关键点 (28,), 逐帧关键点 (num_frames, 28) 或 CourtKeypoints
+        :return: [(起始帧, 结束帧(不含), 关键点), ...]
+        """
+        if hasattr(original_court_key_points, 'get_segments'):
+            return original_court_key_points.get_segments()
+        key_points = np.asarray(original_court_key_points)
+        if key_points.ndim == 1:
+            return [(0, num_frames, key_points)]
+        segment_starts = np.concatenate([[0], np.flatnonzero((np.diff(key_points, axis=0) != 0).any(axis=1)) + 1])
+        segment_ends = np.append(segment_starts[1:], num_frames)
+        return [(start, end, key_points[start]) for start, end in zip(segment_starts.tolist(), segment_ends.tolist())]
+
+    def get_frame_keypoints(self, original_court_key_points, frame_nums):
+        """
+        取出指定各帧的关键点
+        :return: 所有帧共用时原样返回 (28,), 否则为 (len(frame_nums), 28)
+        """
+        if hasattr(original_court_key_points, 'to_array'):
+            original_court_key_points = original_court_key_points.to_array()
+        key_points = np.asarray(original_court_key_points)
+        if key_points.ndim == 1:
+            return key_points
+        return key_points[frame_nums]
+
+    def transform_points(self, points, homography):
+        """
+        对一组点做透视变换
+        :param points: (N, 2)
+        :return: (N, 2) float64
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(points) == 0:
+            return points.copy()
+        return cv2.perspectiveTransform(points[:, None, :], homography)[:, 0, :]
+
+    def project_to_mini_court(self, player_boxes, ball_boxes, original_court_key_points):
+        """
+        一次把整段视频中球员脚下的位置和网球位置映射到迷你球场, 映射方式由self.projection决定
+        :param player_boxes: 已筛选出两名球员的DetectionTable
+        :param ball_boxes: 插值后的网球DetectionTable
+        :param original_court_key_points: 所有帧共用的球场关键点 (28,), 逐帧关键点 (num_frames, 28) 或 CourtKeypoints
+        :return: (player_positions, ball_positions)
+            player_positions: (len(player_boxes), 2), 与player_boxes的行一一对应
+            ball_positions: (num_frames, 2), 没有网球的帧为NaN
+        """
+        if self.projection == 'homography':
+            return self.project_with_homography(player_boxes, ball_boxes, original_court_key_points)
+        return self.project_with_player_heights(player_boxes, ball_boxes, original_court_key_points)
+
+    def project_with_homography(self, player_boxes, ball_boxes, original_court_key_points):
+        """
+        用单应矩阵映射球员脚下的位置和网球中心, 不需要球员高度; 关键点逐帧变化时每段各拟合一次
+        网球中心按其在地面上的投影处理, 与player_height方式一样是近似值
+        """
+        num_frames = player_boxes.num_frames
+        bbox = player_boxes.bbox.astype(np.float64)
+        foot_positions = np.stack([(bbox[:, 0] + bbox[:, 2]) / 2, bbox[:, 3]], axis=1)
+        player_positions = np.empty_like(foot_positions)
+
+        ball_bbox = ball_boxes.get_track_boxes(1)[:num_frames]
+        ball_centers = np.stack([(ball_bbox[:, 0] + ball_bbox[:, 2]) / 2, (ball_bbox[:, 1] + ball_bbox[:, 3]) / 2],
+                                axis=1)
+        has_ball = ~np.isnan(ball_centers).any(axis=1)
+        ball_positions = np.full((num_frames, 2), np.nan)
+
+        for start_frame, end_frame, key_points in self.get_keypoint_segments(original_court_key_points, num_frames):
+            homography = self.fit_court_homography(key_points)
+            rows = slice(player_boxes.frame_offsets[start_frame], player_boxes.frame_offsets[end_frame])
+            player_positions[rows] = self.transform_points(foot_positions[rows], homography)
+            ball_frames = start_frame + np.flatnonzero(has_ball[start_frame:end_frame])
+            ball_positions[ball_frames] = self.transform_points(ball_centers[ball_frames], homography)
+
+        return player_positions, ball_positions
+
+    def project_with_player_heights(self, player_boxes, ball_boxes, original_court_key_points):
+        """
+        以离目标最近的参考关键点为原点, 用球员的像素高度把距离换算成米再映射到迷你球场
+        网球的比例尺使用当前帧离网球最近的球员
+        :param player_boxes: 已筛选出两名球员的DetectionTable
+        :param ball_boxes: 插值后的网球DetectionTable
+        :param original_court_key_points: 所有帧共用的球场关键点 (28,), 逐帧关键点 (num_frames, 28) 或 CourtKeypoints
+        :return: (player_positions, ball_positions), 没有球员的帧网球位置也为NaN
+        """
         player_heights = {
             1: constants.PLAYER_1_HEIGHT_METERS,
             2: constants.PLAYER_2_HEIGHT_METERS
         }
+        num_frames = player_boxes.num_frames
+        frame_nums = player_boxes.frame
+        player_ids = player_boxes.track_id
+        bbox = player_boxes.bbox.astype(np.float64)
+
+        # 每一行对应的球员高度(像素/米)
+        rolling_heights = self.get_rolling_player_heights(player_boxes)
+        row_heights_in_pixels = np.zeros(len(player_boxes))
+        row_heights_in_meters = np.zeros(len(player_boxes))
+        for player_id, heights in rolling_heights.items():
+            rows = player_ids == player_id
+            row_heights_in_pixels[rows] = heights[frame_nums[rows]]
+            row_heights_in_meters[rows] = player_heights[player_id]
+
+        # Players: 与get_foot_position一样, 横坐标取整
+        foot_positions = np.stack([((bbox[:, 0] + bbox[:, 2]) / 2).astype(np.int64), bbox[:, 3]], axis=1)
+        player_positions = self.get_mini_court_coordinates_batch(foot_positions,
+                                                                 self.get_frame_keypoints(original_court_key_points,
+                                                                                          frame_nums),
+                                                                 row_heights_in_pixels,
+                                                                 row_heights_in_meters)
+
+        # Ball: 与get_center_of_bbox一样, 中心点取整
+        ball_bbox = ball_boxes.get_track_boxes(1)
+        ball_frames = np.flatnonzero(~np.isnan(ball_bbox).any(axis=1))
+        ball_centers = np.full((num_frames, 2), -1, dtype=np.int64)
+        ball_centers[ball_frames] = np.stack([(ball_bbox[ball_frames, 0] + ball_bbox[ball_frames, 2]) / 2,
+                                              (ball_bbox[ball_frames, 1] + ball_bbox[ball_frames, 3]) / 2],
+                                             axis=1).astype(np.int64)
+        has_ball = np.zeros(num_frames, dtype=bool)
+        has_ball[ball_frames] = True
+
+        # closest player to ball: 每一帧距离最小的行, 距离相同时取靠前的行
+        player_centers = np.stack([(bbox[:, 0] + bbox[:, 2]) / 2, (bbox[:, 1] + bbox[:, 3]) / 2],
+                                  axis=1).astype(np.int64)
+        ball_distances = (((ball_centers[frame_nums] - player_centers) ** 2).sum(axis=1)) ** 0.5
+        order = np.lexsort((np.arange(len(player_boxes)), ball_distances, frame_nums))
+        frames_with_players = np.flatnonzero(np.diff(player_boxes.frame_offsets) > 0)
+        closest_rows = order[player_boxes.frame_offsets[frames_with_players]]
+        closest_rows = closest_rows[has_ball[frames_with_players]]
+
+        ball_positions = np.full((num_frames, 2), np.nan, dtype=player_positions.dtype)
+        ball_positions[frame_nums[closest_rows]] = self.get_mini_court_coordinates_batch(
+            ball_centers[frame_nums[closest_rows]],
+            self.get_frame_keypoints(original_court_key_points, frame_nums[closest_rows]),
+            row_heights_in_pixels[closest_rows],
+            row_heights_in_meters[closest_rows])
+
+        return player_positions, ball_positions
 
-        output_player_boxes= []
-        output_ball_boxes= []
-
-        for frame_num, player_bbox in enumerate(player_boxes):
-            ball_box = ball_boxes[frame_num][1]
-            ball_position = get_center_of_bbox(ball_box)
-            closest_player_id_to_ball = min(player_bbox.keys(), key=lambda x: measure_distance(ball_position, get_center_of_bbox(player_bbox[x])))
-
-            output_player_bboxes_dict = {}
-            for player_id, bbox in player_bbox.items():
-                foot_position = get_foot_position(bbox)
-
-                # Get The closest keypoint in pixels
-                closest_key_point_index = get_closest_keypoint_index(foot_position,original_court_key_points, [0,2,12,13])
-                closest_key_point = (original_court_key_points[closest_key_point_index*2], 
-                                     original_court_key_points[closest_key_point_index*2+1])
-
-                # # Get Player height in pixels
-                # frame_index_min = max(0, frame_num-20)
-                # frame_index_max = min(len(player_boxes), frame_num+50)
-                # bboxes_heights_in_pixels = [get_height_of_bbox(player_boxes[i][player_id]) for i in range (frame_index_min,frame_index_max)]
-                # max_player_height_in_pixels = max(bboxes_heights_in_pixels)
-
-                # (fix) Get Player height in pixels
-                frame_index_min = max(0, frame_num - 20)
-                frame_index_max = min(len(player_boxes), frame_num + 50)
-                bboxes_heights_in_pixels = []
-                for i in range(frame_index_min, frame_index_max):
-                    bbox = player_boxes[i].get(player_id)
-                    if bbox is not None:
-                        bboxes_heights_in_pixels.append(get_height_of_bbox(bbox))
-                if bboxes_heights_in_pixels:
-                    max_player_height_in_pixels = max(bboxes_heights_in_pixels)
-                else:
-                    max_player_height_in_pixels = 0  # 或者其他适当的默认值
-
-                mini_court_player_position = self.get_mini_court_coordinates(foot_position,
-                                                                            closest_key_point, 
-                                                                            closest_key_point_index, 
-                                                                            max_player_height_in_pixels,
-                                                                            player_heights[player_id]
-                                                                            )
-                
-                output_player_bboxes_dict[player_id] = mini_court_player_position
-
-                if closest_player_id_to_ball == player_id:
-                    # Get The closest keypoint in pixels
-                    closest_key_point_index = get_closest_keypoint_index(ball_position,original_court_key_points, [0,2,12,13])
-                    closest_key_point = (original_court_key_points[closest_key_point_index*2], 
-                                        original_court_key_points[closest_key_point_index*2+1])
-                    
-                    mini_court_player_position = self.get_mini_court_coordinates(ball_position,
-                                                                            closest_key_point, 
-                                                                            closest_key_point_index, 
-                                                                            max_player_height_in_pixels,
-                                                                            player_heights[player_id]
-                                                                            )
-                    output_ball_boxes.append({1:mini_court_player_position})
-            output_player_boxes.append(output_player_bboxes_dict)
+    def convert_bounding_boxes_to_mini_court_coordinates(self,player_boxes, ball_boxes, original_court_key_points ):
+        """
+        把球员脚下的位置和网球位置映射到迷你球场, 计算见 project_to_mini_court
+        :param player_boxes: 已筛选出两名球员的DetectionTable
+        :param ball_boxes: 插值后的网球DetectionTable
+        :param original_court_key_points: 所有帧共用的球场关键点 (28,), 逐帧关键点 (num_frames, 28) 或 CourtKeypoints
+        :return: (球员位置 [{player_id: (x, y)}, ...], 网球位置 [{1: (x, y)}, ...]), 没有网球的帧为空字典
+        """
+        player_positions, ball_positions = self.project_to_mini_court(player_boxes, ball_boxes,
+                                                                      original_court_key_points)
+
+        # 逐个取出的元素保持numpy标量类型, 与原来逐点计算得到的值完全相同
+        output_player_boxes = [{} for _ in range(player_boxes.num_frames)]
+        for frame_num, player_id, x, y in zip(player_boxes.frame.tolist(), player_boxes.track_id.tolist(),
+                                              list(player_positions[:, 0]), list(player_positions[:, 1])):
+            output_player_boxes[frame_num][player_id] = (x, y)
+
+        has_ball = ~np.isnan(ball_positions).any(axis=1)
+        output_ball_boxes = [{1: (x, y)} if valid else {} for valid, x, y in zip(has_ball.tolist(),
+                                                                                  list(ball_positions[:, 0]),
+                                                                                  list(ball_positions[:, 1]))]
 
         return output_player_boxes , output_ball_boxes
     
     def draw_points_on_mini_court(self,frames,postions, color=(0,255,0)):
         for frame_num, frame in enumerate(frames):
-            for _, position in postions[frame_num].items():
-                x,y = position
-                x= int(x)
-                y= int(y)
-                cv2.circle(frame, (x,y), 5, color, -1)
+            self.draw_points_on_mini_court_frame(frame, postions[frame_num], color)
         return frames
 
+    def draw_points_on_mini_court_frame(self,frame,positions, color=(0,255,0)):
+        for _, position in positions.items():
+            x,y = position
+            x= int(x)
+            y= int(y)
+            cv2.circle(frame, (x,y), 5, color, -1)
+        return frame
+
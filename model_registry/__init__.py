@@ -0,0 +1,4 @@
+from .model_registry import ModelRegistry
+
+# 进程内共用的模型注册表
+registry = ModelRegistry()
@@ -0,0 +1,130 @@
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import sys
+sys.path.append('../')
+from trackers import PlayerTracker, BallTracker, load_yolo
+from court_line_detector import CourtLineDetector
+from telemetry import profiler
+
+
+class ModelRegistry:
+    """
+    进程内共用的模型, 每个模型只加载一次, 加载后先在空白帧上推理一次(预热), 之后的任务直接开始推理
+    YOLO模型: track的跟踪状态保存在模型对象中, 所以每个模型对象同一时间只借给一个任务, 借出时清空跟踪状态;
+    所有已加载的副本都在使用中时(多个任务同时运行)再加载一份
+    球场关键点模型: 推理没有状态, 所有任务共用一个
+    """
+    def __init__(self, warmup_frame_shape=(720, 1280, 3)):
+        """
+        :param warmup_frame_shape: 预热用的空白帧大小, 与实际视频接近时预热更充分
+        """
+        self.warmup_frame_shape = warmup_frame_shape
+        self.lock = threading.Lock()
+        # 模型路径 -> 空闲的YOLO模型列表
+        self.idle_yolo_models = {}
+        # 模型路径 -> 已加载的副本数
+        self.yolo_copies = {}
+        # 模型路径 -> CourtLineDetector
+        self.court_line_detectors = {}
+        self.court_line_detector_lock = threading.Lock()
+
+        # 统计信息
+        self.loads = 0
+        self.checkouts = 0
+
+    def get_warmup_frame(self):
+        return np.zeros(self.warmup_frame_shape, dtype=np.uint8)
+
+    def load_yolo(self, model_path):
+        """
+        加载一份YOLO模型并预热
+        """
+        with profiler.stage("load_model"):
+            model = load_yolo(model_path)
+            model.predict(self.get_warmup_frame(), verbose=False)
+        with self.lock:
+            self.yolo_copies[model_path] = self.yolo_copies.get(model_path, 0) + 1
+            self.loads += 1
+        return model
+
+    def checkout_yolo(self, model_path):
+        """
+        借出一个空闲的YOLO模型, 没有空闲的模型时加载一份; 用完后需要调用release_yolo归还
+        """
+        with self.lock:
+            self.checkouts += 1
+            idle_models = self.idle_yolo_models.get(model_path)
+            if idle_models:
+                return idle_models.pop()
+        return self.load_yolo(model_path)
+
+    def release_yolo(self, model_path, model):
+        with self.lock:
+            self.idle_yolo_models.setdefault(model_path, []).append(model)
+
+    @contextmanager
+    def player_tracker(self, model_path='yolov8x.pt', **tracker_params):
+        """
+        为一个任务创建PlayerTracker, 使用已加载的模型, 跟踪状态(track id)从头开始
+        用法: with registry.player_tracker('yolov8x.pt') as player_tracker: ...
+        :param tracker_params: PlayerTracker的其他参数(conf, imgsz, keyframe_interval等)
+        """
+        model = self.checkout_yolo(model_path)
+        try:
+            player_tracker = PlayerTracker(model_path, model=model, **tracker_params)
+            player_tracker.reset_tracking()
+            yield player_tracker
+        finally:
+            self.release_yolo(model_path, model)
+
+    @contextmanager
+    def ball_tracker(self, model_path='models/yolo5_last.pt', **tracker_params):
+        """
+        为一个任务创建BallTracker, 使用已加载的模型
+        :param tracker_params: BallTracker的其他参数(conf, imgsz等)
+        """
+        model = self.checkout_yolo(model_path)
+        try:
+            yield BallTracker(model_path, model=model, **tracker_params)
+        finally:
+            self.release_yolo(model_path, model)
+
+    def get_court_line_detector(self, model_path='models/keypoints_model.pth'):
+        """
+        :return: 所有任务共用的CourtLineDetector, 第一次调用时加载并预热
+        """
+        with self.court_line_detector_lock:
+            court_line_detector = self.court_line_detectors.get(model_path)
+            if court_line_detector is None:
+                with profiler.stage("load_model"):
+                    court_line_detector = CourtLineDetector(model_path)
+                    court_line_detector.predict(self.get_warmup_frame())
+                self.court_line_detectors[model_path] = court_line_detector
+                with self.lock:
+                    self.loads += 1
+            return court_line_detector
+
+    def preload(self, yolo_model_paths=('yolov8x.pt',), court_model_paths=()):
+        """
+        服务启动时预先加载并预热模型, 第一个任务也不用等待加载
+        :param yolo_model_paths: 球员和网球的YOLO模型
+        :param court_model_paths: 球场关键点模型
+        :return: self
+        """
+        for model_path in yolo_model_paths:
+            with self.lock:
+                loaded = self.yolo_copies.get(model_path, 0) > 0
+            if not loaded:
+                self.release_yolo(model_path, self.load_yolo(model_path))
+        for model_path in court_model_paths:
+            self.get_court_line_detector(model_path)
+        return self
+
+    def get_stats(self):
+        """
+        加载次数(包括预热)、借出次数和每个YOLO模型的副本数
+        """
+        with self.lock:
+            return {'loads': self.loads, 'checkouts': self.checkouts, 'yolo_copies': dict(self.yolo_copies)}
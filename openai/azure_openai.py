@@ -8,69 +8,295 @@
 """
 
 
-import requests
+import asyncio
 import base64
+import datetime
+import email.utils
+import json
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import LazyModule
+from telemetry import profiler
+
+requests = LazyModule('requests')
 
 API_KEY = "xxxxx"
 
+SYSTEM_PROMPT = "你是一个专业的网球动作分析系统, 目标是给网球动作进行分类和打分，并给出基于提供材料的回复"
 
-def send_image_and_text_to_gpt(image_path: str, text: str):
+# 可以重试的HTTP状态码: 限流和服务端临时错误
+RETRY_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+
+class GPTRequestError(RuntimeError):
+    pass
+
+
+class ImagePayload:
     """
-    发送图片和文字到GPT模型
-    :return:
+    请求体: 图片在读取时分块base64编码, 不需要把整张图片和编码结果放进内存
+    有__len__时requests会设置Content-Length并按块读取发送; 每次请求(包括重试)都要新建一个
     """
-    model = "gpt-4o"
-    # Configuration
-    encoded_image = base64.b64encode(open(image_path, 'rb').read()).decode('ascii')
-    headers = {
-        "Content-Type": "application/json",
-        "api-key": API_KEY,
-    }
-
-    # Payload for the request
-    payload = {
-      "messages": [
-        {
-          "role": "system",
-          "content": [
-            {
-              "type": "text",
-              "text": "你是一个专业的网球动作分析系统, 目标是给网球动作进行分类和打分，并给出基于提供材料的回复"
-            }
-          ]
-        },
-        {
-          "role": "user",
-          "content": [
-              {
-                  "type": "text",
-                  "text": text
-              },
-              {
-                  "type": "image_url",
-                  "image_url": {
-                    "url": f"data:image/jpeg;base64,{encoded_image}"
-                  }
-              },
-
-          ]
-        }
-      ],
-      "temperature": 0.7,
-      "top_p": 0.95,
-      "max_tokens": 800
-    }
-
-    endpoint = f"https://chatgpt3.openai.azure.com/openai/deployments/{model}/chat/completions?api-version=2024-02-15-preview"
-    # Send request
+    PLACEHOLDER = "__IMAGE_BASE64__"
+
+    def __init__(self, payload, image_path, chunk_size=3 * 64 * 1024):
+        """
+        :param payload: 请求的JSON, 其中图片的位置用 ImagePayload.PLACEHOLDER 代替
+        :param chunk_size: 每次读取的图片字节数, 必须是3的倍数, 各块的编码结果才能直接拼接
+        """
+        self.prefix, self.suffix = [part.encode('utf-8') for part in
+                                    json.dumps(payload, ensure_ascii=False).split(self.PLACEHOLDER)]
+        self.image_file = open(image_path, 'rb')
+        self.image_size = os.path.getsize(image_path)
+        self.chunk_size = chunk_size
+        self.buffer = self.prefix
+        self.image_done = False
+        self.suffix_sent = False
+
+    def __len__(self):
+        return len(self.prefix) + (self.image_size + 2) // 3 * 4 + len(self.suffix)
+
+    def read(self, size=-1):
+        while (size < 0 or len(self.buffer) < size) and not self.suffix_sent:
+            if not self.image_done:
+                chunk = self.image_file.read(self.chunk_size)
+                if chunk:
+                    self.buffer += base64.b64encode(chunk)
+                    continue
+                self.image_done = True
+                self.image_file.close()
+            self.buffer += self.suffix
+            self.suffix_sent = True
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def close(self):
+        self.image_file.close()
+
+
+def get_retry_after_seconds(response):
+    """
+    服务端要求的等待时间: Azure OpenAI 的 retry-after-ms, 或标准的 Retry-After(秒数或HTTP日期)
+    :return: 秒数, 没有时返回None
+    """
+    retry_after_ms = response.headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            seconds = float(retry_after_ms) / 1000
+            if math.isfinite(seconds):
+                return max(0.0, seconds)
+        except ValueError:
+            pass
+    retry_after = response.headers.get('retry-after')
+    if not retry_after:
+        return None
     try:
-        print("sending request...")
-        response = requests.post(endpoint, headers=headers, json=payload)
-        response.raise_for_status()  # Will raise an HTTPError if the HTTP request returned an unsuccessful status code
-    except requests.RequestException as e:
-        raise SystemExit(f"Failed to make the request. Error: {e}")
+        seconds = float(retry_after)
+        return max(0.0, seconds) if math.isfinite(seconds) else None
+    except ValueError:
+        pass
+    try:
+        retry_date = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        # 格式不对时忽略, 按指数退避等待
+        return None
+    if retry_date.tzinfo is None:
+        # HTTP日期都是GMT, 没有时区时按UTC处理, 不能当作本地时间
+        retry_date = retry_date.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, retry_date.timestamp() - time.time())
+
+
+class AzureOpenAIClient:
+    """
+    Azure OpenAI 接口的客户端
+    所有请求共用一个requests.Session, 连接保持并复用(连接池), 不用每次重新建立TLS连接;
+    同时进行的请求数有上限, 超过时排队等待(退避等待期间不占用名额); 每次请求有连接和读取超时;
+    限流(429)、服务端临时错误和网络错误按指数退避重试, 服务端返回了等待时间(retry-after)时按服务端的要求等待;
+    重试次数用完后抛出GPTRequestError, 不会结束整个进程
+    """
+    def __init__(self, api_key=API_KEY, base_url="https://chatgpt3.openai.azure.com", model="gpt-4o",
+                 api_version="2024-02-15-preview", max_concurrency=4, timeout=(10, 120), max_retries=4,
+                 backoff_seconds=1.0, max_backoff_seconds=30.0):
+        """
+        :param base_url: 服务地址, 测试时可以换成本地的模拟服务(见 benchmarks/mock_gpt_server.py)
+        :param max_concurrency: 同时进行的请求数上限, 也是连接池的大小
+        :param timeout: (连接超时, 读取超时) 秒
+        :param max_retries: 失败后最多重试的次数
+        :param backoff_seconds: 第一次重试前的等待时间, 之后每次翻倍(加随机抖动)
+        :param max_backoff_seconds: 每次等待时间的上限
+        """
+        self.api_key = api_key
+        self.model = model
+        self.api_version = api_version
+        self.endpoint = f"{base_url}/openai/deployments/{model}/chat/completions?api-version={api_version}"
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
 
-    print(response.json()['choices'][0]['message']['content'])
-    return str(response.json()['choices'][0]['message']['content']) + f"\nby Zacks({model})"
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        # 异步接口在这个线程池中执行请求
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
 
+        # 统计信息
+        self.stats_lock = threading.Lock()
+        self.requests = 0
+        self.attempts = 0
+        self.retries = 0
+        self.failures = 0
 
+    def build_payload(self, text):
+        return {
+            "messages": [
+                {
+                    "role": "system",
+                    "content": [{"type": "text", "text": SYSTEM_PROMPT}]
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": text},
+                        {"type": "image_url",
+                         "image_url": {"url": f"data:image/jpeg;base64,{ImagePayload.PLACEHOLDER}"}},
+                    ]
+                }
+            ],
+            "temperature": 0.7,
+            "top_p": 0.95,
+            "max_tokens": 800
+        }
+
+    def get_settings(self):
+        """
+        影响回复内容的设置(模型、系统提示词、采样参数), 用于结果缓存的键
+        """
+        payload = self.build_payload("")
+        return {'model': self.model, 'api_version': self.api_version, 'system_prompt': SYSTEM_PROMPT,
+                'temperature': payload['temperature'], 'top_p': payload['top_p'], 'max_tokens': payload['max_tokens']}
+
+    def get_backoff_seconds(self, attempt, response=None):
+        """
+        第attempt次重试前的等待时间
+        """
+        if response is not None:
+            retry_after = get_retry_after_seconds(response)
+            if retry_after is not None:
+                # 至少等待服务端要求的时间, 稍微错开同时被限流的请求
+                return min(retry_after * random.uniform(1.0, 1.2), self.max_backoff_seconds)
+        backoff = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt)
+        # 随机抖动, 避免多个请求同时重试
+        return backoff * random.uniform(0.5, 1.0)
+
+    def send_image_and_text(self, image_path, text):
+        """
+        发送图片和文字
+        :return: 回复内容
+        """
+        payload = self.build_payload(text)
+        headers = {"Content-Type": "application/json", "api-key": self.api_key}
+        with self.stats_lock:
+            self.requests += 1
+        for attempt in range(self.max_retries + 1):
+            with self.stats_lock:
+                self.attempts += 1
+            response, error = None, None
+            # 只在发送请求时占用并发名额, 退避等待时让给其他请求
+            with self.semaphore:
+                body = ImagePayload(payload, image_path)
+                try:
+                    with profiler.model_call(self.model):
+                        response = self.session.post(self.endpoint, headers=headers, data=body, timeout=self.timeout)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error = e
+                finally:
+                    body.close()
+
+            if response is not None:
+                if response.status_code == 200:
+                    try:
+                        return self.get_content(response)
+                    except GPTRequestError as e:
+                        # 回复格式不对, 重试通常也没有用
+                        error = e
+                        break
+                error = GPTRequestError(f"HTTP {response.status_code}: {response.text[:200]}")
+                if response.status_code not in RETRY_STATUS_CODES:
+                    break
+            if attempt == self.max_retries:
+                break
+            backoff = self.get_backoff_seconds(attempt, response)
+            print(f"GPT request failed ({error}), retry in {backoff:.1f}s")
+            with self.stats_lock:
+                self.retries += 1
+            time.sleep(backoff)
+        with self.stats_lock:
+            self.failures += 1
+        raise GPTRequestError(f"Failed to make the request. Error: {error}")
+
+    @staticmethod
+    def get_content(response):
+        """
+        :return: 回复内容, 响应不是预期的JSON格式时抛出GPTRequestError
+        """
+        try:
+            return str(response.json()['choices'][0]['message']['content'])
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise GPTRequestError(f"Invalid response ({e!r}): {response.text[:200]}") from e
+
+    async def send_image_and_text_async(self, image_path, text):
+        """
+        send_image_and_text 的异步版本, 请求在客户端的线程池中执行, 并发数同样受 max_concurrency 限制
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.send_image_and_text,
+                                                                image_path, text)
+
+    def get_stats(self):
+        """
+        请求数、实际发送次数(包括重试)、重试次数和最终失败的请求数
+        """
+        with self.stats_lock:
+            return {'requests': self.requests, 'attempts': self.attempts, 'retries': self.retries,
+                    'failures': self.failures}
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client():
+    """
+    :return: 进程内共用的客户端, 第一次使用时创建
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = AzureOpenAIClient()
+        return _default_client
+
+
+def send_image_and_text_to_gpt(image_path: str, text: str):
+    """
+    发送图片和文字到GPT模型
+    :return:
+    """
+    client = get_default_client()
+    print("sending request...")
+    content = client.send_image_and_text(image_path, text)
+    print(content)
+    return content + f"\nby Zacks({client.model})"
@@ -0,0 +1,164 @@
+import queue
+import threading
+import time
+import sys
+sys.path.append('../')
+from telemetry import profiler
+
+# 队列结束标记
+_STOP = object()
+
+
+class PipelineStage:
+    def __init__(self, name, func, workers=1, count_frames=None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.count_frames = count_frames
+
+        # 多个worker时按输入顺序输出
+        self.next_seq = 0
+        self.order_condition = threading.Condition()
+
+        # 统计信息
+        self.items = 0
+        self.frames = 0
+        self.busy_seconds = 0.0
+        self.stats_lock = threading.Lock()
+
+
+class Pipeline:
+    """
+    多阶段流水线, 每个阶段在独立的worker线程中运行, 阶段之间通过有界队列连接
+    OpenCV解码/编码、模型推理和numpy运算都会释放GIL, 因此各阶段可以在多核上同时运行,
+    总耗时接近最慢的那个阶段而不是所有阶段之和; 有界队列保证内存中同时存在的帧数有上限
+    """
+    def __init__(self, queue_size=8):
+        self.queue_size = queue_size
+        self.stages = []
+        self.stop_event = threading.Event()
+        self.errors = []
+
+    def add_stage(self, name, func, workers=1, count_frames=None):
+        """
+        添加一个阶段
+        :param name: 阶段名称
+        :param func: 处理函数, 输入上一阶段的输出, 返回交给下一阶段的结果
+        :param workers: worker线程数, 只有无状态的阶段才能大于1, 输出顺序始终与输入一致
+        :param count_frames: 输入一个条目, 返回其中的帧数(条目是一个batch时), 用于统计帧率; 为None时每个条目算一帧
+        :return: self, 便于链式调用
+        """
+        self.stages.append(PipelineStage(name, func, workers, count_frames))
+        return self
+
+    def run(self, source):
+        """
+        运行流水线
+        :param source: 输入的可迭代对象, 在单独的线程中读取
+        :return: 按输入顺序迭代最后一个阶段的输出
+        """
+        self.stop_event.clear()
+        self.errors = []
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+
+        threads = [threading.Thread(target=self._feed, args=(source, queues[0]), daemon=True)]
+        for stage, q_in, q_out in zip(self.stages, queues[:-1], queues[1:]):
+            remaining_workers = [stage.workers]
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(target=self._work, args=(stage, q_in, q_out, remaining_workers),
+                                                daemon=True))
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = self._get(queues[-1])
+                if item is _STOP:
+                    break
+                yield item[1]
+        finally:
+            # 正常结束时各线程都已退出; 消费方提前退出或出错时通知所有线程停止
+            self.stop_event.set()
+            for thread in threads:
+                thread.join()
+        if self.errors:
+            raise self.errors[0]
+
+    def get_stage_stats(self):
+        """
+        各阶段处理的条目数、帧数和累计处理时间, 用于找出最慢的阶段
+        """
+        return {stage.name: {'items': stage.items, 'frames': stage.frames, 'busy_seconds': stage.busy_seconds}
+                for stage in self.stages}
+
+    def _feed(self, source, q_out):
+        seq = 0
+        try:
+            for item in source:
+                if not self._put(q_out, (seq, item)):
+                    return
+                seq += 1
+        except BaseException as error:
+            self._fail(error)
+        finally:
+            self._put(q_out, _STOP)
+
+    def _work(self, stage, q_in, q_out, remaining_workers):
+        try:
+            while True:
+                item = self._get(q_in)
+                if item is _STOP:
+                    # 放回结束标记, 让同阶段的其他worker也能退出
+                    self._put(q_in, _STOP)
+                    break
+                seq, value = item
+                frames = stage.count_frames(value) if stage.count_frames is not None else 1
+
+                start_time = time.perf_counter()
+                with profiler.stage(stage.name, frames):
+                    result = stage.func(value)
+                elapsed = time.perf_counter() - start_time
+                with stage.stats_lock:
+                    stage.items += 1
+                    stage.frames += frames
+                    stage.busy_seconds += elapsed
+
+                # 等待轮到自己的序号再输出, 保证顺序
+                with stage.order_condition:
+                    while stage.next_seq != seq:
+                        if self.stop_event.is_set():
+                            return
+                        stage.order_condition.wait(0.1)
+                    if not self._put(q_out, (seq, result)):
+                        return
+                    stage.next_seq += 1
+                    stage.order_condition.notify_all()
+        except BaseException as error:
+            self._fail(error)
+        finally:
+            with stage.order_condition:
+                remaining_workers[0] -= 1
+                last_worker = remaining_workers[0] == 0
+            if last_worker:
+                self._put(q_out, _STOP)
+
+    def _fail(self, error):
+        self.errors.append(error)
+        self.stop_event.set()
+
+    def _put(self, q, item):
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, q):
+        while not self.stop_event.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _STOP
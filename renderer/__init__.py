@@ -0,0 +1 @@
+from .overlay_renderer import OverlayRenderer
\ No newline at end of file
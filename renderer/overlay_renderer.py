@@ -0,0 +1,58 @@
+import time
+import threading
+
+
+class OverlayLayer:
+    def __init__(self, name, draw_func):
+        self.name = name
+        self.draw_func = draw_func
+
+        # 统计信息
+        self.frames = 0
+        self.busy_seconds = 0.0
+
+
+class OverlayRenderer:
+    """
+    把多个图层按添加顺序画到同一帧上, 每一帧只经过一次, 所有图层都原地修改帧
+    半透明的面板只混合各自的区域(见 utils.blend_rectangle), 静态的迷你球场在MiniCourt初始化时预先画好,
+    因此渲染一帧除了绘制本身之外几乎不分配内存
+    """
+    def __init__(self):
+        self.layers = []
+        self.stats_lock = threading.Lock()
+
+    def add_layer(self, name, draw_func):
+        """
+        添加一个图层
+        :param name: 图层名称
+        :param draw_func: draw_func(frame, frame_num), 原地画到frame上
+        :return: self, 便于链式调用
+        """
+        self.layers.append(OverlayLayer(name, draw_func))
+        return self
+
+    def render(self, frame, frame_num):
+        """
+        依次画出所有图层
+        :return: 画好的帧(与输入是同一个数组)
+        """
+        for layer in self.layers:
+            start_time = time.perf_counter()
+            layer.draw_func(frame, frame_num)
+            elapsed = time.perf_counter() - start_time
+            with self.stats_lock:
+                layer.frames += 1
+                layer.busy_seconds += elapsed
+        return frame
+
+    def __call__(self, item):
+        # 可以直接作为Pipeline的阶段: 输入 (帧号, 帧), 输出画好的帧
+        frame_num, frame = item
+        return self.render(frame, frame_num)
+
+    def get_layer_stats(self):
+        """
+        各图层绘制的帧数和累计耗时
+        """
+        return {layer.name: {'frames': layer.frames, 'busy_seconds': layer.busy_seconds} for layer in self.layers}
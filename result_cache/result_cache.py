@@ -0,0 +1,132 @@
+import json
+import os
+import shutil
+import threading
+import time
+import sys
+sys.path.append('../')
+from utils import hash_file, hash_params
+
+CACHE_FORMAT_VERSION = 1
+
+
+class ResultCache:
+    """
+    视频分析结果(九宫格图片和GPT回复)的缓存, 同一个视频被多次转发时直接返回上次的结果, 不再检测球员和请求GPT
+    缓存键由视频内容的哈希和分析参数(提示词、模型、采样设置等)组成, 任何一项变化都会自动失效
+    每个结果是一个目录:
+        image.jpg   九宫格图片
+        meta.json   回复内容、创建时间等, 最后写入, 有meta.json的结果才是完整的; 修改时间记录最后一次命中
+    超过max_age_seconds的结果视为过期; 结果数或总大小超过上限时先删除最久没有命中的
+    """
+    def __init__(self, cache_dir, params, max_entries=500, max_bytes=1024 * 1024 * 1024,
+                 max_age_seconds=30 * 24 * 3600):
+        """
+        :param cache_dir: 缓存目录
+        :param params: 影响分析结果的参数, 可以json序列化
+        :param max_entries: 最多保存的结果数
+        :param max_bytes: 所有结果的总大小上限
+        :param max_age_seconds: 结果的有效期(秒)
+        """
+        self.cache_dir = cache_dir
+        self.params = params
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_key(self, video_path):
+        return hash_params({'version': CACHE_FORMAT_VERSION, 'video': hash_file(video_path), 'params': self.params})
+
+    def get_entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, video_path):
+        """
+        :return: (回复内容, 图片路径), 没有缓存或已过期时返回None
+        """
+        entry_path = self.get_entry_path(self.get_key(video_path))
+        meta_path = os.path.join(entry_path, 'meta.json')
+        with self.lock:
+            try:
+                with open(meta_path, 'r') as f:
+                    meta = json.load(f)
+                created_at = float(meta['created_at'])
+                response_msg, image_name = meta['response_msg'], meta['image_name']
+            except (OSError, ValueError, KeyError, TypeError):
+                self.misses += 1
+                return None
+            if time.time() - created_at > self.max_age_seconds:
+                shutil.rmtree(entry_path, ignore_errors=True)
+                self.misses += 1
+                return None
+            # 记录最后一次命中的时间, 淘汰时保留常用的结果
+            os.utime(meta_path)
+            self.hits += 1
+        print(f"loaded cached result from {entry_path}")
+        return response_msg, os.path.join(entry_path, image_name)
+
+    def put(self, video_path, response_msg, image_path):
+        """
+        保存结果, 图片复制到缓存目录
+        :return: (回复内容, 缓存中的图片路径)
+        """
+        entry_path = self.get_entry_path(self.get_key(video_path))
+        image_name = 'image' + os.path.splitext(image_path)[1]
+        with self.lock:
+            shutil.rmtree(entry_path, ignore_errors=True)
+            os.makedirs(entry_path)
+            shutil.copyfile(image_path, os.path.join(entry_path, image_name))
+            meta = {'response_msg': response_msg, 'image_name': image_name, 'created_at': time.time()}
+            # 先写临时文件再替换, 中途退出不会留下不完整的结果
+            tmp_path = os.path.join(entry_path, 'meta.json.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(tmp_path, os.path.join(entry_path, 'meta.json'))
+            self._evict(keep=entry_path)
+        return response_msg, os.path.join(entry_path, image_name)
+
+    def _evict(self, keep=None):
+        """
+        删除过期、不完整的结果, 结果数或总大小超过上限时按最后命中时间从旧到新删除
+        :param keep: 不删除的结果(刚写入的)
+        """
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_path = self.get_entry_path(key)
+            meta_path = os.path.join(entry_path, 'meta.json')
+            try:
+                last_used = os.path.getmtime(meta_path)
+                with open(meta_path, 'r') as f:
+                    created_at = float(json.load(f)['created_at'])
+                size = sum(os.path.getsize(os.path.join(entry_path, name)) for name in os.listdir(entry_path))
+            except (OSError, ValueError, KeyError, TypeError):
+                # 写入中断留下的目录, 或meta.json不完整、已损坏
+                shutil.rmtree(entry_path, ignore_errors=True)
+                continue
+            entries.append((last_used, created_at, size, entry_path))
+
+        entries.sort()
+        total_bytes = sum(size for _, _, size, _ in entries)
+        now = time.time()
+        for i, (last_used, created_at, size, entry_path) in enumerate(entries):
+            expired = now - created_at > self.max_age_seconds
+            over_limit = len(entries) - i > self.max_entries or total_bytes > self.max_bytes
+            if entry_path == keep or (not expired and not over_limit):
+                continue
+            shutil.rmtree(entry_path, ignore_errors=True)
+            total_bytes -= size
+            self.evictions += 1
+
+    def get_stats(self):
+        """
+        命中次数、未命中次数和淘汰的结果数
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
@@ -0,0 +1,34 @@
+import os
+
+from .profiler import Profiler, NULL_SPAN, get_rss_bytes, get_peak_rss_bytes
+
+# 进程内共用的统计实例; 设置环境变量 TENNIS_PROFILE=1 时在导入时打开(用于没有命令行参数的服务, 如wx_watcher)
+profiler = Profiler()
+if os.environ.get('TENNIS_PROFILE', '') not in ('', '0'):
+    profiler.enable()
+
+
+def add_profile_arguments(parser):
+    """
+    给命令行增加统计相关的参数
+    :param parser: argparse.ArgumentParser
+    """
+    parser.add_argument('--profile', action='store_true', help='统计各阶段和模型推理的耗时、帧率和峰值内存')
+    parser.add_argument('--profile-json', default=None, help='统计结果保存为JSON, 指定时自动打开统计')
+    parser.add_argument('--profile-prometheus', default=None,
+                        help='统计结果保存为Prometheus文本格式, 指定时自动打开统计')
+
+
+def start_profiling_from_args(args):
+    if args.profile or args.profile_json or args.profile_prometheus:
+        profiler.enable()
+
+
+def finish_profiling_from_args(args):
+    """
+    打印统计表格并按参数保存文件, 没有打开统计时什么也不做
+    """
+    if not profiler.enabled:
+        return
+    print(profiler.format_summary())
+    profiler.export(json_path=args.profile_json, prometheus_path=args.profile_prometheus)
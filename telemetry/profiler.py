@@ -0,0 +1,251 @@
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # Windows没有resource模块, 只能读取当前RSS
+    resource = None
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def get_peak_rss_bytes():
+    """
+    :return: 进程启动以来的峰值RSS(字节), 无法获取时为None
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS单位为字节, Linux为KB
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def get_rss_bytes():
+    """
+    :return: 当前RSS(字节), 没有/proc时退回峰值RSS
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return get_peak_rss_bytes()
+
+
+class NullSpan:
+    """
+    关闭统计时使用的空记录, 所有调用共用同一个实例, 几乎没有开销
+    """
+    frames = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    """
+    一次阶段或模型调用的计时, 用作with语句; 帧数在结束前可以通过 span.frames 修改
+    """
+    def __init__(self, profiler, kind, name, frames):
+        self.profiler = profiler
+        self.kind = kind
+        self.name = name
+        self.frames = frames
+        self.start_time = None
+        self.peak_rss = None
+
+    def __enter__(self):
+        self.profiler.open_span(self)
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.close_span(self, time.perf_counter() - self.start_time)
+        return False
+
+
+class Profiler:
+    """
+    按阶段和模型调用统计耗时、帧数、吞吐量和峰值RSS
+    阶段(stage): 处理流程中的一步, 记录调用次数、总耗时、帧数和执行期间的峰值RSS(后台线程每sample_interval秒采样)
+    模型调用(model_call): 每次推理, 按模型记录调用次数、总耗时、最长一次耗时和帧数
+    默认关闭, 关闭时stage/model_call直接返回空记录
+    """
+    def __init__(self, sample_interval=0.05, prefix='tennis'):
+        self.sample_interval = sample_interval
+        self.prefix = prefix
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.active_spans = set()
+        self.stop_event = threading.Event()
+        self.sampler = None
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+            self.models = {}
+            self.start_time = time.perf_counter()
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        self.stop_event.clear()
+        if self.sample_interval:
+            self.sampler = threading.Thread(target=self._sample_rss, daemon=True)
+            self.sampler.start()
+
+    def disable(self):
+        self.enabled = False
+        self.stop_event.set()
+        if self.sampler is not None:
+            self.sampler.join()
+            self.sampler = None
+
+    def stage(self, name, frames=0):
+        """
+        :param name: 阶段名称, 同名阶段累计
+        :param frames: 该阶段处理的帧数, 用于计算帧率, 可以在with块中通过 span.frames 设置
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, 'stage', name, frames)
+
+    def model_call(self, name, frames=1):
+        """
+        :param name: 模型名称(一般为模型路径)
+        :param frames: 这次推理输入的帧数
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, 'model', name, frames)
+
+    def open_span(self, span):
+        if span.kind == 'stage':
+            span.peak_rss = get_rss_bytes()
+            with self.lock:
+                self.active_spans.add(span)
+
+    def close_span(self, span, seconds):
+        with self.lock:
+            if span.kind == 'stage':
+                self.active_spans.discard(span)
+                record = self.stages.setdefault(span.name, {'calls': 0, 'seconds': 0.0, 'frames': 0,
+                                                            'peak_rss_bytes': None})
+                peak_rss = max(filter(None, [span.peak_rss, get_rss_bytes(), record['peak_rss_bytes']]),
+                               default=None)
+                record['peak_rss_bytes'] = peak_rss
+            else:
+                record = self.models.setdefault(span.name, {'calls': 0, 'seconds': 0.0, 'frames': 0,
+                                                            'max_call_seconds': 0.0})
+                record['max_call_seconds'] = max(record['max_call_seconds'], seconds)
+            record['calls'] += 1
+            record['seconds'] += seconds
+            record['frames'] += span.frames
+
+    def _sample_rss(self):
+        while not self.stop_event.wait(self.sample_interval):
+            rss = get_rss_bytes()
+            if rss is None:
+                return
+            with self.lock:
+                for span in self.active_spans:
+                    if span.peak_rss is None or rss > span.peak_rss:
+                        span.peak_rss = rss
+
+    def to_dict(self):
+        """
+        :return: 可以直接保存为JSON的统计结果, 帧率为 帧数/总耗时
+        """
+        with self.lock:
+            stages = {name: dict(record) for name, record in self.stages.items()}
+            models = {name: dict(record) for name, record in self.models.items()}
+        for record in list(stages.values()) + list(models.values()):
+            record['fps'] = record['frames'] / record['seconds'] if record['frames'] and record['seconds'] else None
+        return {
+            'wall_seconds': time.perf_counter() - self.start_time,
+            'peak_rss_bytes': get_peak_rss_bytes(),
+            'stages': stages,
+            'models': models,
+        }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent, ensure_ascii=False)
+
+    def to_prometheus(self):
+        """
+        :return: Prometheus文本格式(可由node_exporter的textfile collector或Pushgateway收集)
+        """
+        data = self.to_dict()
+        metrics = [
+            ('stage_calls_total', 'counter', 'Number of times each stage ran', 'stages', 'stage', 'calls'),
+            ('stage_seconds_total', 'counter', 'Wall time spent in each stage', 'stages', 'stage', 'seconds'),
+            ('stage_frames_total', 'counter', 'Frames processed by each stage', 'stages', 'stage', 'frames'),
+            ('stage_frames_per_second', 'gauge', 'Frames per second of each stage', 'stages', 'stage', 'fps'),
+            ('stage_peak_rss_bytes', 'gauge', 'Peak resident memory while each stage ran', 'stages', 'stage',
+             'peak_rss_bytes'),
+            ('model_calls_total', 'counter', 'Number of inference calls per model', 'models', 'model', 'calls'),
+            ('model_seconds_total', 'counter', 'Inference time per model', 'models', 'model', 'seconds'),
+            ('model_frames_total', 'counter', 'Frames passed to each model', 'models', 'model', 'frames'),
+            ('model_frames_per_second', 'gauge', 'Inference frames per second per model', 'models', 'model', 'fps'),
+            ('model_max_call_seconds', 'gauge', 'Slowest single inference call per model', 'models', 'model',
+             'max_call_seconds'),
+        ]
+        lines = []
+        for metric, metric_type, help_text, group, label, field in metrics:
+            name = f"{self.prefix}_{metric}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for key, record in data[group].items():
+                if record[field] is not None:
+                    lines.append(f'{name}{{{label}="{escape_label(key)}"}} {record[field]}')
+        for metric, help_text, value in [('wall_seconds', 'Seconds since profiling started', data['wall_seconds']),
+                                         ('process_peak_rss_bytes', 'Peak resident memory of the process',
+                                          data['peak_rss_bytes'])]:
+            if value is not None:
+                lines.extend([f"# HELP {self.prefix}_{metric} {help_text}", f"# TYPE {self.prefix}_{metric} gauge",
+                              f"{self.prefix}_{metric} {value}"])
+        return "\n".join(lines) + "\n"
+
+    def format_summary(self):
+        """
+        :return: 便于在终端查看的表格
+        """
+        data = self.to_dict()
+        lines = [f"{'stage / model':<36}{'calls':>7}{'seconds':>10}{'frames':>8}{'fps':>9}{'peak RSS MB':>13}"]
+        for group in ['stages', 'models']:
+            for name, record in data[group].items():
+                fps = '' if record['fps'] is None else f"{record['fps']:.1f}"
+                peak_rss = record.get('peak_rss_bytes')
+                peak_rss = '' if peak_rss is None else f"{peak_rss / 1024 ** 2:.0f}"
+                label = name if group == 'stages' else f"[model] {name}"
+                lines.append(f"{label:<36}{record['calls']:>7}{record['seconds']:>10.3f}{record['frames']:>8}"
+                             f"{fps:>9}{peak_rss:>13}")
+        return "\n".join(lines)
+
+    def export(self, json_path=None, prometheus_path=None):
+        """
+        保存统计结果
+        :param json_path: JSON文件路径, 为None时不保存
+        :param prometheus_path: Prometheus文本文件路径, 为None时不保存
+        """
+        for path, content in [(json_path, self.to_json), (prometheus_path, self.to_prometheus)]:
+            if path:
+                directory = os.path.dirname(os.path.abspath(path))
+                os.makedirs(directory, exist_ok=True)
+                with open(path, 'w') as f:
+                    f.write(content())
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,28 @@
+"""
+KeyframePropagator 在关键帧上没有检测到球员时(如视频开头球场上没有人)的处理
+
+用法(在仓库根目录运行):
+    python -m pytest tests
+"""
+import numpy as np
+
+from trackers.keyframe_propagator import KeyframePropagator
+from utils import DetectionTable
+
+
+def test_empty_keyframe_propagates_empty_detections():
+    detected_frames = []
+
+    def detect_frame(frame, frame_num):
+        detected_frames.append(frame_num)
+        return DetectionTable.empty(frame_num + 1)
+
+    propagator = KeyframePropagator(detect_frame, keyframe_interval=5)
+    frames = [np.zeros((72, 128, 3), dtype=np.uint8)] * 12
+    detections = DetectionTable.concatenate([propagator.update(frames[:4]), propagator.update(frames[4:], 4)])
+
+    assert len(detections) == 0
+    assert detections.num_frames == len(frames)
+    # 没有检测框时仍按keyframe_interval检测, 中间帧沿用空结果
+    assert detected_frames == [0, 5, 10]
+    assert propagator.get_stats() == {'keyframes': 3, 'propagated_frames': 9}
@@ -0,0 +1,82 @@
+"""
+model_registry 借出的YOLO模型被多个任务复用时, 跟踪器每帧只更新一次
+FakeYOLO 按ultralytics的 Model.track / register_tracker 的行为注册跟踪回调, 不需要安装ultralytics和模型文件
+
+用法(在仓库根目录运行):
+    python -m pytest tests
+"""
+from types import SimpleNamespace
+
+import numpy as np
+
+from model_registry import ModelRegistry
+
+
+class FakeTracker:
+    def __init__(self):
+        self.frame_id = 0
+
+    def update(self):
+        self.frame_id += 1
+
+    def reset(self):
+        self.frame_id = 0
+
+
+class FakeYOLO:
+    """
+    与ultralytics相同: predictor没有trackers属性时, track()注册一组 on_predict_start / on_predict_postprocess_end 回调;
+    on_predict_start 在persist=True且已有trackers时不重新创建跟踪器; on_predict_postprocess_end 对每帧结果更新一次跟踪器
+    """
+    def __init__(self):
+        self.predictor = None
+        self.callbacks = {'on_predict_start': [], 'on_predict_postprocess_end': []}
+        self.updates = 0
+
+    def track(self, source, persist=False, **kwargs):
+        if not hasattr(self.predictor, 'trackers'):
+            self.callbacks['on_predict_start'].append(lambda predictor: self.on_predict_start(predictor, persist))
+            self.callbacks['on_predict_postprocess_end'].append(self.on_predict_postprocess_end)
+        return self.predict(source)
+
+    def predict(self, source, **kwargs):
+        frames = source if isinstance(source, list) else [source]
+        if self.predictor is None:
+            self.predictor = SimpleNamespace()
+        for callback in self.callbacks['on_predict_start']:
+            callback(self.predictor)
+        self.predictor.results = [SimpleNamespace(boxes=SimpleNamespace(id=None), names={0: 'person'})
+                                  for _ in frames]
+        for callback in self.callbacks['on_predict_postprocess_end']:
+            callback(self.predictor)
+        return self.predictor.results
+
+    @staticmethod
+    def on_predict_start(predictor, persist):
+        if hasattr(predictor, 'trackers') and persist:
+            return
+        predictor.trackers = [FakeTracker()]
+
+    def on_predict_postprocess_end(self, predictor):
+        for _ in predictor.results:
+            predictor.trackers[0].update()
+            self.updates += 1
+
+
+def test_reused_model_updates_tracker_once_per_frame():
+    registry = ModelRegistry()
+    model = FakeYOLO()
+    registry.release_yolo('fake.pt', model)
+    frames = [np.zeros((8, 8, 3), dtype=np.uint8)] * 6
+
+    for job, batch_size in enumerate([1, 4, 4]):
+        with registry.player_tracker('fake.pt') as player_tracker:
+            assert player_tracker.model is model
+            player_tracker.detect_frames(frames, batch_size=batch_size)
+        assert model.updates == len(frames) * (job + 1)
+        # 每个任务的跟踪状态从头开始
+        assert model.predictor.trackers[0].frame_id == len(frames)
+
+    assert len(model.callbacks['on_predict_start']) == 1
+    assert len(model.callbacks['on_predict_postprocess_end']) == 1
+    assert registry.loads == 0
@@ -1,2 +1,4 @@
 from .player_tracker import PlayerTracker
-from .ball_tracker import BallTracker
\ No newline at end of file
+from .ball_tracker import BallTracker
+from .sharded_detection import detect_players_and_ball_sharded
+from .model_loader import load_yolo
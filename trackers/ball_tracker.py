@@ -1,97 +1,213 @@
-from ultralytics import YOLO 
-import cv2
-import pickle
-import pandas as pd
+import numpy as np
+import sys
+sys.path.append('../')
+from utils import DetectionTable, batch_frames, LazyModule
+from telemetry import profiler
+from .detection_cache import DetectionCache
+from .model_loader import load_yolo
+
+cv2 = LazyModule('cv2')
+pd = LazyModule('pandas')
 
 class BallTracker:
-    def __init__(self,model_path):
-        self.model = YOLO(model_path)
+    def __init__(self,model_path, conf=0.15, imgsz=640,
+                 rolling_window_frames=5, minimum_change_frames_for_hit=25, change_window_ratio=1.2,
+                 reference_fps=24, model=None):
+        # model_path为None时不加载模型, 只用于处理缓存中已有的检测结果; model为已加载的YOLO模型(见 model_registry)
+        self.model_path = model_path
+        self.model = model
+        if self.model is None and model_path is not None:
+            self.model = load_yolo(model_path)
+        self.conf = conf
+        self.imgsz = imgsz
+
+        # 击球检测参数, 以reference_fps下的帧数表示, 其他帧率按比例缩放
+        # rolling_window_frames: 球纵坐标平滑窗口
+        # minimum_change_frames_for_hit: 方向改变后需要保持的最少帧数
+        # change_window_ratio: 统计方向保持帧数的窗口 = minimum_change_frames_for_hit * change_window_ratio
+        self.rolling_window_frames = rolling_window_frames
+        self.minimum_change_frames_for_hit = minimum_change_frames_for_hit
+        self.change_window_ratio = change_window_ratio
+        self.reference_fps = reference_fps
+
+    def get_shot_detection_frames(self, fps=None):
+        """
+        按视频帧率缩放击球检测的窗口
+        :param fps: 视频帧率, 为None时按reference_fps处理
+        :return: (平滑窗口帧数, 方向保持最少帧数, 统计窗口帧数)
+        """
+        scale = 1 if fps is None else fps / self.reference_fps
+        rolling_window_frames = max(1, int(round(self.rolling_window_frames * scale)))
+        minimum_change_frames_for_hit = max(1, int(round(self.minimum_change_frames_for_hit * scale)))
+        change_window_frames = int(minimum_change_frames_for_hit * self.change_window_ratio)
+        return rolling_window_frames, minimum_change_frames_for_hit, change_window_frames
+
+    def get_init_params(self):
+        """
+        重新创建相同检测配置的BallTracker所需的参数, 用于在其他进程中创建检测器
+        """
+        return {'model_path': self.model_path, 'conf': self.conf, 'imgsz': self.imgsz}
+
+    def get_inference_params(self):
+        # 影响检测结果的所有参数, 作为检测缓存键的一部分
+        return {
+            'task': 'predict',
+            'conf': self.conf,
+            'imgsz': self.imgsz,
+        }
+
+    def open_detection_cache(self, cache_dir, video_path):
+        return DetectionCache(cache_dir, video_path, self.model_path, self.get_inference_params())
 
     def interpolate_ball_positions(self, ball_positions):
-        ball_positions = [x.get(1,[]) for x in ball_positions]
-        # convert the list into pandas dataframe
-        df_ball_positions = pd.DataFrame(ball_positions,columns=['x1','y1','x2','y2'])
+        """
+        对没有检测到网球的帧做线性插值, 视频开头缺失的帧用第一次检测到的位置填充
+        :param ball_positions: DetectionTable
+        :return: 每一帧恰好一行的DetectionTable, 插值得到的行置信度为0
+        """
+        # convert the track into pandas dataframe
+        boxes = ball_positions.get_track_boxes(1)
+        df_ball_positions = pd.DataFrame(boxes,columns=['x1','y1','x2','y2'])
 
         # interpolate the missing values
         df_ball_positions = df_ball_positions.interpolate()
         df_ball_positions = df_ball_positions.bfill()
 
-        ball_positions = [{1:x} for x in df_ball_positions.to_numpy().tolist()]
-
-        return ball_positions
+        confidence = np.zeros(ball_positions.num_frames, dtype=np.float32)
+        ball_rows = ball_positions.track_id == 1
+        confidence[ball_positions.frame[ball_rows]] = ball_positions.confidence[ball_rows]
 
-    def get_ball_shot_frames(self,ball_positions):
-        ball_positions = [x.get(1,[]) for x in ball_positions]
-        # convert the list into pandas dataframe
-        df_ball_positions = pd.DataFrame(ball_positions,columns=['x1','y1','x2','y2'])
+        # 整段视频都没有检测到网球时没有可以插值的位置
+        boxes = df_ball_positions.to_numpy()
+        valid = ~np.isnan(boxes).any(axis=1)
+        frame_nums = np.flatnonzero(valid)
+        return DetectionTable(frame_nums, np.ones(len(frame_nums)), boxes[valid], confidence[valid],
+                              num_frames=ball_positions.num_frames)
 
-        df_ball_positions['ball_hit'] = 0
+    def get_ball_shot_frames(self,ball_positions, fps=None):
+        # convert the track into pandas dataframe
+        df_ball_positions = pd.DataFrame(ball_positions.get_track_boxes(1),columns=['x1','y1','x2','y2'])
+        rolling_window_frames, minimum_change_frames_for_hit, change_window_frames = \
+            self.get_shot_detection_frames(fps)
 
         df_ball_positions['mid_y'] = (df_ball_positions['y1'] + df_ball_positions['y2'])/2
-        df_ball_positions['mid_y_rolling_mean'] = df_ball_positions['mid_y'].rolling(window=5, min_periods=1, center=False).mean()
+        df_ball_positions['mid_y_rolling_mean'] = df_ball_positions['mid_y'].rolling(window=rolling_window_frames, min_periods=1, center=False).mean()
         df_ball_positions['delta_y'] = df_ball_positions['mid_y_rolling_mean'].diff()
-        minimum_change_frames_for_hit = 25
-        for i in range(1,len(df_ball_positions)- int(minimum_change_frames_for_hit*1.2) ):
-            negative_position_change = df_ball_positions['delta_y'].iloc[i] >0 and df_ball_positions['delta_y'].iloc[i+1] <0
-            positive_position_change = df_ball_positions['delta_y'].iloc[i] <0 and df_ball_positions['delta_y'].iloc[i+1] >0
-
-            if negative_position_change or positive_position_change:
-                change_count = 0 
-                for change_frame in range(i+1, i+int(minimum_change_frames_for_hit*1.2)+1):
-                    negative_position_change_following_frame = df_ball_positions['delta_y'].iloc[i] >0 and df_ball_positions['delta_y'].iloc[change_frame] <0
-                    positive_position_change_following_frame = df_ball_positions['delta_y'].iloc[i] <0 and df_ball_positions['delta_y'].iloc[change_frame] >0
-
-                    if negative_position_change and negative_position_change_following_frame:
-                        change_count+=1
-                    elif positive_position_change and positive_position_change_following_frame:
-                        change_count+=1
-            
-                if change_count>minimum_change_frames_for_hit-1:
-                    df_ball_positions['ball_hit'].iloc[i] = 1
-
-        frame_nums_with_ball_hits = df_ball_positions[df_ball_positions['ball_hit']==1].index.tolist()
-
-        return frame_nums_with_ball_hits
-
-    def detect_frames(self,frames, read_from_stub=False, stub_path=None):
-        ball_detections = []
 
-        if read_from_stub and stub_path is not None:
-            with open(stub_path, 'rb') as f:
-                ball_detections = pickle.load(f)
-            return ball_detections
-
-        for frame in frames:
-            player_dict = self.detect_frame(frame)
-            ball_detections.append(player_dict)
-        
-        if stub_path is not None:
-            with open(stub_path, 'wb') as f:
-                pickle.dump(ball_detections, f)
-        
-        return ball_detections
+        return get_direction_change_frames(df_ball_positions['delta_y'].to_numpy(),
+                                           minimum_change_frames_for_hit, change_window_frames)
+
+    def detect_frames(self,frames, batch_size=1, cache_dir=None, video_path=None):
+        """
+        检测每一帧中的网球
+        :param frames: 帧列表或VideoFrameReader
+        :param batch_size: 大于1时批量推理
+        :param cache_dir: 检测缓存目录, 为None时不使用缓存
+        :param video_path: 视频路径, 用于计算缓存键, frames为VideoFrameReader时可省略
+        :return: DetectionTable, 网球的track id固定为1
+        """
+        cache = None
+        if cache_dir is not None:
+            video_path = video_path or getattr(frames, 'video_path', None)
+            if video_path is None:
+                raise ValueError("video_path is required when cache_dir is set")
+            cache = self.open_detection_cache(cache_dir, video_path)
+            ball_detections = cache.load()
+            if ball_detections is not None:
+                return ball_detections
+            cache.start()
 
-    def detect_frame(self,frame):
-        results = self.model.predict(frame,conf=0.15)[0]
-
-        ball_dict = {}
-        for box in results.boxes:
-            result = box.xyxy.tolist()[0]
-            ball_dict[1] = result
-        
-        return ball_dict
-
-    def draw_bboxes(self,video_frames, player_detections):
+        ball_detections = []
+        num_frames = 0
+        for batch in batch_frames(frames, batch_size):
+            if batch_size > 1:
+                batch_detections = self.detect_frame_batch(batch, start_frame=num_frames)
+            else:
+                batch_detections = self.detect_frame(batch[0], frame_num=num_frames)
+            if cache is not None:
+                cache.append(batch_detections)
+            ball_detections.append(batch_detections)
+            num_frames += len(batch)
+
+        if cache is not None:
+            cache.finish()
+
+        return DetectionTable.concatenate(ball_detections, num_frames=num_frames)
+
+    def detect_frame(self,frame, frame_num=0):
+        with profiler.model_call(self.model_path):
+            results = self.model.predict(frame,conf=self.conf,imgsz=self.imgsz)[0]
+        return self.get_ball_table(results, frame_num)
+
+    def detect_frame_batch(self,frames, start_frame=0):
+        with profiler.model_call(self.model_path, len(frames)):
+            results = self.model.predict(frames,conf=self.conf,imgsz=self.imgsz)
+        return DetectionTable.concatenate([self.get_ball_table(result, start_frame + offset)
+                                           for offset, result in enumerate(results)],
+                                          num_frames=start_frame + len(frames))
+
+    def get_ball_table(self,results, frame_num):
+        """
+        一帧中的网球, 有多个检测框时与原来一样保留最后一个
+        :param results: YOLO的单帧结果
+        :param frame_num: 该帧在整段视频中的帧号
+        :return: DetectionTable, 最多一行
+        """
+        boxes = results.boxes
+        if len(boxes) == 0:
+            return DetectionTable.empty(frame_num + 1)
+        return DetectionTable([frame_num], [1],
+                              boxes.xyxy[-1:].cpu().numpy(),
+                              boxes.conf[-1:].cpu().numpy(),
+                              boxes.cls[-1:].cpu().numpy(),
+                              num_frames=frame_num + 1)
+
+    def draw_bboxes(self,video_frames, ball_detections):
         output_video_frames = []
-        for frame, ball_dict in zip(video_frames, player_detections):
-            # Draw Bounding Boxes
-            for track_id, bbox in ball_dict.items():
-                x1, y1, x2, y2 = bbox
-                cv2.putText(frame, f"Ball ID: {track_id}",(int(bbox[0]),int(bbox[1] -10 )),cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 255), 2)
-                cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 255), 2)
-            output_video_frames.append(frame)
+        for frame_num, frame in enumerate(video_frames):
+            output_video_frames.append(self.draw_bbox(frame, ball_detections.get_frame(frame_num)))
         
         return output_video_frames
 
-
-    
\ No newline at end of file
+    def draw_bbox(self, frame, ball_table):
+        # Draw Bounding Boxes
+        for track_id, bbox in zip(ball_table.track_id.tolist(), ball_table.bbox.tolist()):
+            x1, y1, x2, y2 = bbox
+            cv2.putText(frame, f"Ball ID: {track_id}",(int(bbox[0]),int(bbox[1] -10 )),cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 255), 2)
+            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 255), 2)
+        return frame
+
+
+def get_direction_change_frames(delta_y, minimum_change_frames, change_window_frames):
+    """
+    找出球的纵向运动方向发生改变, 并且新方向在之后的窗口内保持足够帧数的帧
+    第i帧满足: delta_y[i] 与 delta_y[i+1] 异号, 且 delta_y[i+1 .. i+change_window_frames] 中
+    与 delta_y[i+1] 同号的帧数不少于 minimum_change_frames; NaN 不计入任何方向
+    :param delta_y: 平滑后球中心纵坐标的逐帧变化量
+    :param minimum_change_frames: 新方向需要保持的最少帧数
+    :param change_window_frames: 统计窗口的帧数
+    :return: 击球帧号列表
+    """
+    delta_y = np.asarray(delta_y, dtype=np.float64)
+    last_frame = len(delta_y) - change_window_frames
+    if last_frame <= 1:
+        return []
+
+    moving_down = delta_y > 0
+    moving_up = delta_y < 0
+    # 前缀和, 窗口[a, b]内的计数 = cumsum[b+1] - cumsum[a]
+    down_cumsum = np.concatenate(([0], np.cumsum(moving_down)))
+    up_cumsum = np.concatenate(([0], np.cumsum(moving_up)))
+
+    frames = np.arange(1, last_frame)
+    window_start = frames + 1
+    window_end = frames + change_window_frames + 1
+    down_count = down_cumsum[window_end] - down_cumsum[window_start]
+    up_count = up_cumsum[window_end] - up_cumsum[window_start]
+
+    negative_position_change = moving_down[frames] & moving_up[frames + 1]
+    positive_position_change = moving_up[frames] & moving_down[frames + 1]
+    ball_hit = (negative_position_change & (up_count >= minimum_change_frames)) | \
+               (positive_position_change & (down_count >= minimum_change_frames))
+
+    return frames[ball_hit].tolist()
@@ -0,0 +1,121 @@
+import json
+import os
+import shutil
+import numpy as np
+import sys
+sys.path.append('../')
+from utils import DetectionTable, hash_file, hash_file_or_name, hash_params
+
+CACHE_FORMAT_VERSION = 2
+
+
+class DetectionCache:
+    """
+    按内容寻址的检测结果缓存
+    缓存键由视频内容、模型权重和推理参数(conf, imgsz, tracker配置等)的哈希组成, 任何一项变化都会自动失效
+    每个缓存是一个目录, DetectionTable的每列一个二进制文件, 检测过程中按块追加写入, 读取时直接内存映射:
+        frame.bin       int32    帧号
+        track_id.bin    int32    track id
+        bbox.bin        float32  x1, y1, x2, y2 (YOLO输出本身就是float32, 不损失精度)
+        confidence.bin  float32  置信度
+        class_id.bin    int32    类别id
+        meta.json       帧数、检测数、是否完整等
+    """
+    columns = {
+        'frame': (np.int32, ()),
+        'track_id': (np.int32, ()),
+        'bbox': (np.float32, (4,)),
+        'confidence': (np.float32, ()),
+        'class_id': (np.int32, ()),
+    }
+
+    def __init__(self, cache_dir, video_path, model_path, inference_params):
+        self.cache_dir = cache_dir
+        key_params = {
+            'version': CACHE_FORMAT_VERSION,
+            'video': hash_file(video_path),
+            'model': hash_file_or_name(model_path),
+            'params': inference_params,
+        }
+        self.key = hash_params(key_params)
+        self.path = os.path.join(cache_dir, self.key)
+        self.meta = dict(key_params, num_frames=0, num_detections=0, complete=False)
+
+    def get_column_path(self, name):
+        return os.path.join(self.path, f"{name}.bin")
+
+    def get_meta_path(self):
+        return os.path.join(self.path, "meta.json")
+
+    def exists(self):
+        meta_path = self.get_meta_path()
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, 'r') as f:
+            return json.load(f).get('complete', False)
+
+    def load_columns(self):
+        """
+        以内存映射方式打开各列
+        :return: {列名: 数组}, 缓存不存在或未写完时返回None
+        """
+        if not self.exists():
+            return None
+        with open(self.get_meta_path(), 'r') as f:
+            self.meta = json.load(f)
+        num_detections = self.meta['num_detections']
+        columns = {}
+        for name, (dtype, shape) in self.columns.items():
+            if num_detections == 0:
+                columns[name] = np.zeros((0,) + shape, dtype=dtype)
+            else:
+                columns[name] = np.memmap(self.get_column_path(name), dtype=dtype, mode='r',
+                                          shape=(num_detections,) + shape)
+        return columns
+
+    def load(self):
+        """
+        读取缓存
+        :return: 内存映射的DetectionTable, 缓存不存在时返回None
+        """
+        columns = self.load_columns()
+        if columns is None:
+            return None
+        print(f"loaded {self.meta['num_detections']} cached detections from {self.path}")
+        return DetectionTable(num_frames=self.meta['num_frames'], **columns)
+
+    def start(self):
+        """
+        清空旧的(可能是未写完的)缓存, 开始写入
+        """
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(self.path)
+        for name in self.columns:
+            open(self.get_column_path(name), 'wb').close()
+        self.meta.update(num_frames=0, num_detections=0, complete=False)
+        self.write_meta()
+
+    def append(self, detections):
+        """
+        追加一段连续帧的检测结果
+        :param detections: DetectionTable, 帧号为整段视频中的绝对帧号
+        """
+        for name in self.columns:
+            with open(self.get_column_path(name), 'ab') as f:
+                f.write(np.ascontiguousarray(getattr(detections, name)).tobytes())
+
+        self.meta['num_frames'] = max(self.meta['num_frames'], detections.num_frames)
+        self.meta['num_detections'] += len(detections)
+        self.write_meta()
+
+    def finish(self):
+        self.meta['complete'] = True
+        self.write_meta()
+
+    def write_meta(self):
+        # 先写临时文件再替换, 中途退出不会留下损坏的meta
+        tmp_path = self.get_meta_path() + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self.get_meta_path())
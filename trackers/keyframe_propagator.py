@@ -0,0 +1,192 @@
+import numpy as np
+import sys
+sys.path.append('../')
+from utils import DetectionTable, LazyModule
+
+cv2 = LazyModule('cv2')
+
+# LK光流的窗口大小和金字塔层数
+LK_WINDOW_SIZE = (15, 15)
+LK_MAX_LEVEL = 3
+
+
+class KeyframePropagator:
+    """
+    稀疏关键帧检测: 只在关键帧上运行检测模型, 中间帧的检测框用光流从上一帧推算
+    每个检测框内取若干角点, 用金字塔LK光流逐帧跟踪, 前后向误差过大的点丢弃;
+    框的平移取跟踪点位移的中位数, 缩放取点对距离之比的中位数, track id和类别沿用关键帧的结果
+    推算框的置信度 = 关键帧置信度 * 仍被跟踪的点所占比例
+    出现以下任一情况时当前帧改为关键帧重新检测:
+        距上一个关键帧已有keyframe_interval帧
+        任一推算框的置信度低于min_confidence(遮挡、出画面、跟踪点丢失)
+        任一框在一帧内的位移超过motion_threshold像素(快速运动时光流不可靠)
+    """
+    def __init__(self, detect_frame, keyframe_interval=5, min_confidence=0.3, motion_threshold=20.0,
+                 max_corners=30, max_flow_error=1.0):
+        """
+        :param detect_frame: 检测函数 detect_frame(frame, frame_num) -> 该帧的DetectionTable
+        :param keyframe_interval: 两个关键帧之间最多相隔的帧数, 为1时每帧都检测
+        :param min_confidence: 推算框置信度的下限
+        :param motion_threshold: 一帧内允许的最大位移(像素)
+        :param max_corners: 每个框内最多跟踪的角点数
+        :param max_flow_error: 前后向光流的最大误差(像素)
+        """
+        self.detect_frame = detect_frame
+        self.keyframe_interval = keyframe_interval
+        self.min_confidence = min_confidence
+        self.motion_threshold = motion_threshold
+        self.max_corners = max_corners
+        self.max_flow_error = max_flow_error
+        self.start()
+
+    def get_params(self):
+        # 影响输出结果的所有参数, 作为检测缓存键的一部分
+        return {
+            'keyframe_interval': self.keyframe_interval,
+            'min_confidence': self.min_confidence,
+            'motion_threshold': self.motion_threshold,
+            'max_corners': self.max_corners,
+            'max_flow_error': self.max_flow_error,
+        }
+
+    def start(self):
+        """
+        清空状态, 开始处理新的视频
+        """
+        self.previous_gray = None
+        self.keyframe_table = None
+        self.boxes = None
+        self.points = []
+        self.initial_point_counts = None
+        self.frames_since_keyframe = 0
+
+        # 统计信息
+        self.keyframes = 0
+        self.propagated_frames = 0
+
+    def update(self, frames, start_frame=0):
+        """
+        按顺序送入若干帧
+        :param frames: 紧接在上一次送入的帧之后的帧列表
+        :param start_frame: 第一帧在整段视频中的帧号
+        :return: DetectionTable
+        """
+        tables = []
+        for offset, frame in enumerate(frames):
+            frame_num = start_frame + offset
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            table = None
+            if self.keyframe_table is not None and self.frames_since_keyframe + 1 < self.keyframe_interval:
+                table = self.propagate(gray, frame_num)
+            if table is None:
+                table = self.detect_keyframe(frame, gray, frame_num)
+            self.previous_gray = gray
+            tables.append(table)
+        return DetectionTable.concatenate(tables, num_frames=start_frame + len(frames))
+
+    def detect_keyframe(self, frame, gray, frame_num):
+        table = self.detect_frame(frame, frame_num)
+        self.keyframe_table = table
+        self.boxes = table.bbox.astype(np.float64)
+        self.points = [self.get_box_points(gray, box) for box in self.boxes]
+        self.initial_point_counts = np.array([len(points) for points in self.points], dtype=np.float64)
+        self.frames_since_keyframe = 0
+        self.keyframes += 1
+        return table
+
+    def get_box_points(self, gray, box):
+        # 在框的中间区域取角点, 避开边缘处的背景
+        height, width = gray.shape
+        x1, y1, x2, y2 = box
+        margin_x = (x2 - x1) * 0.1
+        margin_y = (y2 - y1) * 0.1
+        x1, x2 = int(max(x1 + margin_x, 0)), int(min(x2 - margin_x, width))
+        y1, y2 = int(max(y1 + margin_y, 0)), int(min(y2 - margin_y, height))
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            return np.empty((0, 2), dtype=np.float32)
+        # 只在框内计算角点, 比对整幅图加掩码快得多
+        points = cv2.goodFeaturesToTrack(gray[y1:y2, x1:x2], self.max_corners, 0.01, 3)
+        if points is None:
+            return np.empty((0, 2), dtype=np.float32)
+        return points.reshape(-1, 2) + np.array([x1, y1], dtype=np.float32)
+
+    def track_points(self, gray):
+        """
+        前后向LK光流
+        :return: (每个点的新位置, 是否跟踪成功)
+        """
+        if not self.points:
+            # 关键帧上没有检测框, 空结果沿用到下一个关键帧
+            return np.empty((0, 2), dtype=np.float32), np.zeros(0, dtype=bool)
+        all_points = np.concatenate(self.points).reshape(-1, 1, 2)
+        if len(all_points) == 0:
+            return all_points.reshape(-1, 2), np.zeros(0, dtype=bool)
+        lk_params = dict(winSize=LK_WINDOW_SIZE, maxLevel=LK_MAX_LEVEL,
+                         criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+        new_points, status, _ = cv2.calcOpticalFlowPyrLK(self.previous_gray, gray, all_points, None, **lk_params)
+        back_points, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self.previous_gray, new_points, None,
+                                                               **lk_params)
+        flow_error = np.linalg.norm((back_points - all_points).reshape(-1, 2), axis=1)
+        tracked = (status.ravel() == 1) & (back_status.ravel() == 1) & (flow_error < self.max_flow_error)
+        return new_points.reshape(-1, 2), tracked
+
+    def propagate(self, gray, frame_num):
+        """
+        用光流推算当前帧的检测框
+        :return: DetectionTable, 触发重新检测时返回None
+        """
+        new_points, tracked = self.track_points(gray)
+
+        boxes = self.boxes.copy()
+        point_counts = np.zeros(len(boxes))
+        next_points = []
+        start = 0
+        for box_index, old_points in enumerate(self.points):
+            end = start + len(old_points)
+            box_tracked = tracked[start:end]
+            old_points = old_points[box_tracked]
+            box_points = new_points[start:end][box_tracked]
+            start = end
+            next_points.append(box_points)
+            point_counts[box_index] = len(box_points)
+            if len(box_points) == 0:
+                continue
+
+            shift = np.median(box_points - old_points, axis=0)
+            if np.hypot(*shift) > self.motion_threshold:
+                return None
+
+            scale = 1.0
+            if len(box_points) >= 2:
+                old_distances = np.linalg.norm(old_points[:, None] - old_points[None], axis=2)
+                new_distances = np.linalg.norm(box_points[:, None] - box_points[None], axis=2)
+                valid = old_distances > 1
+                if valid.any():
+                    scale = float(np.median(new_distances[valid] / old_distances[valid]))
+
+            x1, y1, x2, y2 = boxes[box_index]
+            center_x = (x1 + x2) / 2 + shift[0]
+            center_y = (y1 + y2) / 2 + shift[1]
+            half_width = (x2 - x1) / 2 * scale
+            half_height = (y2 - y1) / 2 * scale
+            boxes[box_index] = [center_x - half_width, center_y - half_height,
+                                center_x + half_width, center_y + half_height]
+
+        tracked_ratios = np.divide(point_counts, self.initial_point_counts,
+                                   out=np.zeros(len(boxes)), where=self.initial_point_counts > 0)
+        confidence = self.keyframe_table.confidence * tracked_ratios
+        if (confidence < self.min_confidence).any():
+            return None
+
+        self.boxes = boxes
+        self.points = next_points
+        self.frames_since_keyframe += 1
+        self.propagated_frames += 1
+        return DetectionTable(np.full(len(boxes), frame_num), self.keyframe_table.track_id, boxes, confidence,
+                              self.keyframe_table.class_id, num_frames=frame_num + 1)
+
+    def get_stats(self):
+        """
+        运行检测模型的帧数和用光流推算的帧数
+        """
+        return {'keyframes': self.keyframes, 'propagated_frames': self.propagated_frames}
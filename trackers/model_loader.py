@@ -0,0 +1,7 @@
+def load_yolo(model_path):
+    """
+    加载YOLO模型
+    ultralytics(连带torch)导入需要数秒, 只在真正需要模型时才导入, 只处理缓存结果或几何计算的代码路径不受影响
+    """
+    from ultralytics import YOLO
+    return YOLO(model_path)
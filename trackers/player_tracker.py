@@ -1,90 +1,170 @@
-from ultralytics import YOLO 
-import cv2
-import pickle
+import numpy as np
 import sys
 sys.path.append('../')
-from utils import measure_distance, get_center_of_bbox
+from utils import DetectionTable, batch_frames, hash_file_or_name, LazyModule
+from telemetry import profiler
+from .detection_cache import DetectionCache
+from .keyframe_propagator import KeyframePropagator
+from .model_loader import load_yolo
+
+cv2 = LazyModule('cv2')
 
 class PlayerTracker:
-    def __init__(self,model_path):
-        self.model = YOLO(model_path)
+    def __init__(self,model_path, conf=0.25, imgsz=640, tracker='botsort.yaml', keyframe_interval=1, model=None,
+                 **keyframe_params):
+        """
+        :param keyframe_interval: 大于1时只在关键帧上检测, 中间帧的检测框用光流推算, 见 KeyframePropagator
+        :param model: 已加载的YOLO模型(见 model_registry), 为None时从model_path加载
+        :param keyframe_params: 传给KeyframePropagator的其他参数(min_confidence, motion_threshold等)
+        """
+        self.model_path = model_path
+        self.model = model if model is not None else load_yolo(model_path)
+        self.conf = conf
+        self.imgsz = imgsz
+        self.tracker = tracker
+        self.keyframe_propagator = None
+        if keyframe_interval > 1:
+            self.keyframe_propagator = KeyframePropagator(self.detect_frame, keyframe_interval, **keyframe_params)
+
+    def get_init_params(self):
+        """
+        重新创建相同配置的PlayerTracker所需的参数, 用于在其他进程中创建检测器
+        """
+        params = {'model_path': self.model_path, 'conf': self.conf, 'imgsz': self.imgsz, 'tracker': self.tracker}
+        if self.keyframe_propagator is not None:
+            params.update(self.keyframe_propagator.get_params())
+        return params
+
+    def get_inference_params(self):
+        # 影响检测结果的所有参数, 作为检测缓存键的一部分
+        params = {
+            'task': 'track',
+            'conf': self.conf,
+            'imgsz': self.imgsz,
+            'tracker': hash_file_or_name(self.tracker),
+        }
+        if self.keyframe_propagator is not None:
+            params['keyframes'] = self.keyframe_propagator.get_params()
+        return params
+
+    def open_detection_cache(self, cache_dir, video_path):
+        return DetectionCache(cache_dir, video_path, self.model_path, self.get_inference_params())
 
     def choose_and_filter_players(self, court_keypoints, player_detections):
-        player_detections_first_frame = player_detections[0]
-        chosen_player = self.choose_players(court_keypoints, player_detections_first_frame)
-        filtered_player_detections = []
-        for player_dict in player_detections:
-            filtered_player_dict = {track_id: bbox for track_id, bbox in player_dict.items() if track_id in chosen_player}
-            filtered_player_detections.append(filtered_player_dict)
-        return filtered_player_detections
-
-    def choose_players(self, court_keypoints, player_dict):
-        distances = []
-        for track_id, bbox in player_dict.items():
-            player_center = get_center_of_bbox(bbox)
-
-            min_distance = float('inf')
-            for i in range(0,len(court_keypoints),2):
-                court_keypoint = (court_keypoints[i], court_keypoints[i+1])
-                distance = measure_distance(player_center, court_keypoint)
-                if distance < min_distance:
-                    min_distance = distance
-            distances.append((track_id, min_distance))
-        
-        # sorrt the distances in ascending order
-        distances.sort(key = lambda x: x[1])
-        # Choose the first 2 tracks
-        chosen_players = [distances[0][0], distances[1][0]]
+        chosen_player = self.choose_players(court_keypoints, player_detections.get_frame(0))
+        return player_detections.filter_tracks(chosen_player)
+
+    def choose_players(self, court_keypoints, player_table):
+        # 第一帧中离球场关键点最近的两个track, 中心点与get_center_of_bbox一样取整
+        bbox = player_table.bbox.astype(np.float64)
+        player_centers = np.stack([(bbox[:, 0] + bbox[:, 2]) / 2, (bbox[:, 1] + bbox[:, 3]) / 2], axis=1).astype(int)
+        court_keypoints = np.asarray(court_keypoints, dtype=np.float64).reshape(-1, 2)
+        distances = np.linalg.norm(player_centers[:, None, :] - court_keypoints[None, :, :], axis=2).min(axis=1)
+
+        # sort the distances in ascending order, choose the first 2 tracks
+        order = np.argsort(distances, kind='stable')
+        chosen_players = player_table.track_id[order[:2]].tolist()
         return chosen_players
 
 
-    def detect_frames(self,frames, read_from_stub=False, stub_path=None):
+    def detect_frames(self,frames, batch_size=1, cache_dir=None, video_path=None):
+        """
+        检测每一帧中的球员
+        :param frames: 帧列表或VideoFrameReader
+        :param batch_size: 大于1时批量推理
+        :param cache_dir: 检测缓存目录, 为None时不使用缓存
+        :param video_path: 视频路径, 用于计算缓存键, frames为VideoFrameReader时可省略
+        :return: DetectionTable
+        """
+        cache = None
+        if cache_dir is not None:
+            video_path = video_path or getattr(frames, 'video_path', None)
+            if video_path is None:
+                raise ValueError("video_path is required when cache_dir is set")
+            cache = self.open_detection_cache(cache_dir, video_path)
+            player_detections = cache.load()
+            if player_detections is not None:
+                return player_detections
+            cache.start()
+
+        if self.keyframe_propagator is not None:
+            self.keyframe_propagator.start()
         player_detections = []
+        num_frames = 0
+        for batch in batch_frames(frames, batch_size):
+            if batch_size > 1 or self.keyframe_propagator is not None:
+                batch_detections = self.detect_frame_batch(batch, start_frame=num_frames)
+            else:
+                batch_detections = self.detect_frame(batch[0], frame_num=num_frames)
+            if cache is not None:
+                cache.append(batch_detections)
+            player_detections.append(batch_detections)
+            num_frames += len(batch)
 
-        if read_from_stub and stub_path is not None:
-            with open(stub_path, 'rb') as f:
-                player_detections = pickle.load(f)
-            return player_detections
+        if cache is not None:
+            cache.finish()
 
-        for frame in frames:
-            player_dict = self.detect_frame(frame)
-            player_detections.append(player_dict)
-        
-        if stub_path is not None:
-            with open(stub_path, 'wb') as f:
-                pickle.dump(player_detections, f)
-        
-        return player_detections
-
-    def detect_frame(self,frame):
-        results = self.model.track(frame, persist=True)[0]
-        id_name_dict = results.names
-
-        player_dict = {}
-        for box in results.boxes:
-            try:
-                track_id = int(box.id.tolist()[0])
-                result = box.xyxy.tolist()[0]
-                object_cls_id = box.cls.tolist()[0]
-                object_cls_name = id_name_dict[object_cls_id]
-                if object_cls_name == "person":
-                    player_dict[track_id] = result
-            except Exception as error:
-                print(error)
-        
-        return player_dict
+        return DetectionTable.concatenate(player_detections, num_frames=num_frames)
+
+    def reset_tracking(self):
+        # 清空YOLO内部的跟踪器状态, 下一次track时重新分配track id
+        # 只能原地reset, 不能删除predictor.trackers: 没有trackers时model.track会再注册一组跟踪回调, 之后每帧更新两次
+        predictor = getattr(self.model, 'predictor', None)
+        for tracker in getattr(predictor, 'trackers', None) or []:
+            tracker.reset()
+        if self.keyframe_propagator is not None:
+            self.keyframe_propagator.start()
+
+    def detect_frame(self,frame, frame_num=0):
+        with profiler.model_call(self.model_path):
+            results = self.model.track(frame, persist=True, conf=self.conf, imgsz=self.imgsz, tracker=self.tracker)[0]
+        return self.get_player_table(results, frame_num)
+
+    def detect_frame_batch(self,frames, start_frame=0):
+        # 一次前向推理处理整个batch; persist=True时跟踪器按帧顺序逐帧更新, 跨batch的track id保持一致
+        if self.keyframe_propagator is not None:
+            # 稀疏关键帧模式下逐帧决定是否检测
+            return self.keyframe_propagator.update(frames, start_frame)
+        with profiler.model_call(self.model_path, len(frames)):
+            results = self.model.track(frames, persist=True, conf=self.conf, imgsz=self.imgsz, tracker=self.tracker)
+        return DetectionTable.concatenate([self.get_player_table(result, start_frame + offset)
+                                           for offset, result in enumerate(results)],
+                                          num_frames=start_frame + len(frames))
+
+    def get_player_table(self,results, frame_num):
+        """
+        一帧中类别为person且已分配track id的检测框
+        :param results: YOLO的单帧结果
+        :param frame_num: 该帧在整段视频中的帧号
+        :return: DetectionTable
+        """
+        boxes = results.boxes
+        if boxes.id is None:
+            # 跟踪器还没有确认任何track
+            return DetectionTable.empty(frame_num + 1)
+
+        person_class_ids = [class_id for class_id, class_name in results.names.items() if class_name == "person"]
+        class_ids = boxes.cls.cpu().numpy().astype(np.int32)
+        mask = np.isin(class_ids, person_class_ids)
+        num_boxes = int(mask.sum())
+        return DetectionTable(np.full(num_boxes, frame_num),
+                              boxes.id.cpu().numpy()[mask],
+                              boxes.xyxy.cpu().numpy()[mask],
+                              boxes.conf.cpu().numpy()[mask],
+                              class_ids[mask],
+                              num_frames=frame_num + 1)
 
     def draw_bboxes(self,video_frames, player_detections):
         output_video_frames = []
-        for frame, player_dict in zip(video_frames, player_detections):
-            # Draw Bounding Boxes
-            for track_id, bbox in player_dict.items():
-                x1, y1, x2, y2 = bbox
-                cv2.putText(frame, f"Player ID: {track_id}",(int(bbox[0]),int(bbox[1] -10 )),cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
-                cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 2)
-            output_video_frames.append(frame)
+        for frame_num, frame in enumerate(video_frames):
+            output_video_frames.append(self.draw_bbox(frame, player_detections.get_frame(frame_num)))
         
         return output_video_frames
 
-
-    
\ No newline at end of file
+    def draw_bbox(self, frame, player_table):
+        # Draw Bounding Boxes
+        for track_id, bbox in zip(player_table.track_id.tolist(), player_table.bbox.tolist()):
+            x1, y1, x2, y2 = bbox
+            cv2.putText(frame, f"Player ID: {track_id}",(int(bbox[0]),int(bbox[1] -10 )),cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
+            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 2)
+        return frame
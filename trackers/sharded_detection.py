@@ -0,0 +1,203 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import sys
+sys.path.append('../')
+from utils import DetectionTable, VideoFrameReader, batch_frames, get_iou_matrix
+from .detection_cache import DetectionCache
+from .player_tracker import PlayerTracker
+from .ball_tracker import BallTracker
+
+# 每个worker进程中的检测器, 由_init_worker创建, 同一进程处理多个分段时复用
+_worker_trackers = None
+
+
+def get_shard_ranges(num_frames, num_shards):
+    """
+    把视频均匀切成若干段
+    :param num_frames: 视频帧数(可以是容器中记录的估计值)
+    :param num_shards: 分段数
+    :return: [(起始帧, 结束帧(不含)), ...], 最后一段的结束帧为None, 一直读到视频结尾
+    """
+    bounds = np.linspace(0, num_frames, max(num_shards, 1) + 1).round().astype(int).tolist()
+    ranges = [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start] or [(0, 0)]
+    ranges[-1] = (ranges[-1][0], None)
+    return ranges
+
+
+def _init_worker(player_params, ball_params, torch_threads):
+    global _worker_trackers
+    if torch_threads:
+        # 每个进程只用分到的核, 避免多个进程的推理线程互相争抢
+        try:
+            import torch
+            torch.set_num_threads(torch_threads)
+        except ImportError:
+            pass
+    _worker_trackers = (PlayerTracker(**player_params), BallTracker(**ball_params))
+
+
+def _detect_shard(video_path, start_frame, end_frame, batch_size):
+    """
+    在worker进程中检测一段视频, 每段都从干净的跟踪状态开始
+    :return: (球员DetectionTable, 网球DetectionTable), 使用整段视频的绝对帧号
+    """
+    player_tracker, ball_tracker = _worker_trackers
+    player_tracker.reset_tracking()
+    player_detections = []
+    ball_detections = []
+    frame_num = start_frame
+    for frames in batch_frames(VideoFrameReader(video_path).iter_frames(start_frame, end_frame), batch_size):
+        player_detections.append(player_tracker.detect_frame_batch(frames, start_frame=frame_num))
+        ball_detections.append(ball_tracker.detect_frame_batch(frames, start_frame=frame_num))
+        frame_num += len(frames)
+    return (DetectionTable.concatenate(player_detections, num_frames=frame_num),
+            DetectionTable.concatenate(ball_detections, num_frames=frame_num))
+
+
+def match_tracks(previous_detections, current_detections, frame_nums, iou_threshold=0.5):
+    """
+    用重叠帧中检测框的IoU把新分段的track对应到已有的track
+    某对track的得分 = 两者在重叠帧中的IoU之和 / 新track出现的帧数, 按得分从高到低一对一匹配
+    :param previous_detections: 已合并的结果, 需要包含重叠帧
+    :param current_detections: 新分段的结果, 需要包含重叠帧
+    :param frame_nums: 重叠的帧号
+    :param iou_threshold: 得分低于该值的不匹配
+    :return: {新分段的track id: 已有的track id}
+    """
+    scores = {}
+    current_frame_counts = {}
+    for frame_num in frame_nums:
+        previous_frame = previous_detections.get_frame(frame_num)
+        current_frame = current_detections.get_frame(frame_num)
+        for current_id in current_frame.track_id.tolist():
+            current_frame_counts[current_id] = current_frame_counts.get(current_id, 0) + 1
+        if len(previous_frame) == 0 or len(current_frame) == 0:
+            continue
+        ious = get_iou_matrix(current_frame.bbox, previous_frame.bbox)
+        for i, current_id in enumerate(current_frame.track_id.tolist()):
+            for j, previous_id in enumerate(previous_frame.track_id.tolist()):
+                if ious[i, j] > 0:
+                    scores[(current_id, previous_id)] = scores.get((current_id, previous_id), 0.0) + ious[i, j]
+
+    matches = {}
+    matched_previous_ids = set()
+    pairs = sorted(((score / current_frame_counts[current_id], current_id, previous_id)
+                    for (current_id, previous_id), score in scores.items()), reverse=True)
+    for score, current_id, previous_id in pairs:
+        if score < iou_threshold:
+            break
+        if current_id in matches or previous_id in matched_previous_ids:
+            continue
+        matches[current_id] = previous_id
+        matched_previous_ids.add(previous_id)
+    return matches
+
+
+def remap_track_ids(detections, id_map):
+    """
+    :param id_map: {原track id: 新track id}, 需要覆盖表中所有的track id
+    :return: 替换track id后的DetectionTable
+    """
+    old_ids = np.array(sorted(id_map), dtype=np.int64)
+    new_ids = np.array([id_map[track_id] for track_id in old_ids.tolist()], dtype=np.int64)
+    track_ids = new_ids[np.searchsorted(old_ids, detections.track_id)] if len(detections) else detections.track_id
+    return DetectionTable(detections.frame, track_ids, detections.bbox, detections.confidence, detections.class_id,
+                          num_frames=detections.num_frames)
+
+
+def merge_shard_detections(shard_results, shard_starts, overlap_frames, iou_threshold=0.5):
+    """
+    合并各分段的检测结果
+    除第一段外, 每段都从 起始帧-重叠帧数 开始检测, 重叠帧只用来匹配track, 最终结果取前一段的检测;
+    球员track id按重叠帧中的IoU接续, 没有匹配上的track分配新的id; 网球每帧一个框, 直接按帧拼接
+    :param shard_results: [(球员DetectionTable, 网球DetectionTable), ...], 按分段顺序
+    :param shard_starts: 每段不含重叠部分的起始帧
+    :param overlap_frames: 相邻分段重叠的帧数
+    :return: (球员DetectionTable, 网球DetectionTable)
+    """
+    player_tables = []
+    ball_tables = []
+    next_track_id = 1
+    for (players, balls), start_frame in zip(shard_results, shard_starts):
+        track_ids = np.unique(players.track_id).tolist()
+        if not player_tables:
+            id_map = {track_id: track_id for track_id in track_ids}
+        else:
+            # 分段比重叠帧数短时, 重叠部分可能跨过前面多个分段
+            previous_players = DetectionTable.concatenate(player_tables, num_frames=start_frame)
+            overlap_frame_nums = range(max(start_frame - overlap_frames, 0), start_frame)
+            id_map = match_tracks(previous_players, players, overlap_frame_nums, iou_threshold)
+            for track_id in track_ids:
+                if track_id not in id_map:
+                    id_map[track_id] = next_track_id
+                    next_track_id += 1
+        if id_map:
+            next_track_id = max(next_track_id, max(id_map.values()) + 1)
+
+        players = remap_track_ids(players.select(players.frame >= start_frame), id_map)
+        player_tables.append(players)
+        ball_tables.append(balls.select(balls.frame >= start_frame))
+
+    num_frames = max(players.num_frames for players, _ in shard_results)
+    return (DetectionTable.concatenate(player_tables, num_frames=num_frames),
+            DetectionTable.concatenate(ball_tables, num_frames=num_frames))
+
+
+def detect_players_and_ball_sharded(video_path, player_tracker, ball_tracker, workers=None, num_shards=None,
+                                    overlap_frames=30, batch_size=8, cache_dir=None, iou_threshold=0.5):
+    """
+    把视频切成若干段, 由多个进程并行检测球员和网球, 再把各段的结果接成一个连续的结果
+    每个进程创建自己的检测器(跟踪器状态不能跨进程共享), 各段之间多检测overlap_frames帧用于接续track id,
+    网球是逐帧检测, 拼接后与单进程检测的结果一致, 插值和击球检测看到的是同一条连续的轨迹
+    :param video_path: 视频路径
+    :param player_tracker: PlayerTracker, 只用它的配置, 不在当前进程中推理
+    :param ball_tracker: BallTracker, 只用它的配置
+    :param workers: 进程数, 默认为CPU核数
+    :param num_shards: 分段数, 默认与进程数相同
+    :param overlap_frames: 相邻分段重叠的帧数, 也是新分段跟踪器的预热帧数
+    :param batch_size: 每次推理的帧数
+    :param cache_dir: 检测缓存目录, 为None时不使用缓存
+    :param iou_threshold: 接续track id的最低平均IoU
+    :return: (球员DetectionTable, 网球DetectionTable)
+    """
+    workers = workers or os.cpu_count()
+    num_shards = num_shards or workers
+
+    player_cache = None
+    ball_cache = None
+    if cache_dir is not None:
+        # 分段会改变track id的分配, 球员缓存单独计算键; 网球逐帧检测, 与单进程共用缓存
+        player_params = dict(player_tracker.get_inference_params(),
+                             sharding={'num_shards': num_shards, 'overlap_frames': overlap_frames,
+                                       'iou_threshold': iou_threshold})
+        player_cache = DetectionCache(cache_dir, video_path, player_tracker.model_path, player_params)
+        ball_cache = ball_tracker.open_detection_cache(cache_dir, video_path)
+        player_detections = player_cache.load()
+        ball_detections = ball_cache.load()
+        if player_detections is not None and ball_detections is not None:
+            return player_detections, ball_detections
+
+    shard_ranges = get_shard_ranges(len(VideoFrameReader(video_path)), num_shards)
+    torch_threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"detecting {len(shard_ranges)} shards with {workers} workers, {torch_threads} threads each")
+    # spawn: 子进程不继承父进程中已经初始化的模型和线程池
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker,
+                             initargs=(player_tracker.get_init_params(), ball_tracker.get_init_params(),
+                                       torch_threads)) as executor:
+        futures = [executor.submit(_detect_shard, video_path, max(start_frame - overlap_frames, 0), end_frame,
+                                   batch_size)
+                   for start_frame, end_frame in shard_ranges]
+        shard_results = [future.result() for future in futures]
+
+    player_detections, ball_detections = merge_shard_detections(
+        shard_results, [start_frame for start_frame, _ in shard_ranges], overlap_frames, iou_threshold)
+
+    if cache_dir is not None:
+        for cache, detections in [(player_cache, player_detections), (ball_cache, ball_detections)]:
+            cache.start()
+            cache.append(detections)
+            cache.finish()
+    return player_detections, ball_detections
@@ -1,4 +1,11 @@
-from .video_utils import read_video, save_video, save_video_to_images_with_sampling
-from .bbox_utils import get_center_of_bbox, measure_distance, get_foot_position,get_closest_keypoint_index,get_height_of_bbox,measure_xy_distance,get_center_of_bbox
+from .video_utils import save_video, save_video_to_images_with_sampling
+from .video_utils import VideoFrameReader, open_video_at, batch_frames, get_sampled_frame_ids, save_frames_to_grid_image
+from .video_writer import VideoEncoder, VIDEO_CODECS
+from .bbox_utils import get_center_of_bbox, measure_distance, get_foot_position,get_closest_keypoint_index,get_height_of_bbox,measure_xy_distance,get_center_of_bbox,get_iou_matrix
 from .conversions import convert_pixel_distance_to_meters, convert_meters_to_pixel_distance
-from .player_stats_drawer_utils import draw_player_stats
\ No newline at end of file
+from .player_stats_drawer_utils import draw_player_stats, draw_player_stats_frame, PlayerStatsPanel
+from .hash_utils import hash_file, hash_file_or_name, hash_params, new_file_hasher, remember_file_hash
+from .detection_table import DetectionTable
+from .array_utils import sliding_window_max
+from .draw_utils import blend_rectangle
+from .lazy_import import LazyModule
\ No newline at end of file
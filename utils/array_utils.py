@@ -0,0 +1,23 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def sliding_window_max(values, frames_before, frames_after, default=0):
+    """
+    每一帧在 [i-frames_before, i+frames_after) 窗口内的最大值, 窗口在视频两端截断, NaN不参与比较
+    :param values: (num_frames,) 数组, 没有数据的帧为NaN
+    :param frames_before: 当前帧之前包含的帧数
+    :param frames_after: 从当前帧开始包含的帧数
+    :param default: 窗口内全是NaN时的值
+    :return: (num_frames,) float64 数组
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return values.copy()
+    # 用-inf填充两端和缺失的帧, 每个窗口都是填充后数组上的一段定长视图, 不复制数据
+    padded = np.concatenate([np.full(frames_before, -np.inf),
+                             np.where(np.isnan(values), -np.inf, values),
+                             np.full(frames_after - 1, -np.inf)])
+    window_max = sliding_window_view(padded, frames_before + frames_after).max(axis=1)
+    window_max[np.isneginf(window_max)] = default
+    return window_max
@@ -1,3 +1,5 @@
+import numpy as np
+
 def get_center_of_bbox(bbox):
     x1, y1, x2, y2 = bbox
     center_x = int((x1 + x2) / 2)
@@ -29,4 +31,20 @@ def measure_xy_distance(p1,p2):
     return abs(p1[0]-p2[0]), abs(p1[1]-p2[1])
 
 def get_center_of_bbox(bbox):
-    return (int((bbox[0]+bbox[2])/2),int((bbox[1]+bbox[3])/2))
\ No newline at end of file
+    return (int((bbox[0]+bbox[2])/2),int((bbox[1]+bbox[3])/2))
+
+def get_iou_matrix(boxes_a, boxes_b):
+    """
+    两组检测框两两之间的IoU
+    :param boxes_a: (N, 4) x1, y1, x2, y2
+    :param boxes_b: (M, 4) x1, y1, x2, y2
+    :return: (N, M)
+    """
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64).reshape(1, -1, 4)
+    width = np.clip(np.minimum(boxes_a[..., 2], boxes_b[..., 2]) - np.maximum(boxes_a[..., 0], boxes_b[..., 0]), 0, None)
+    height = np.clip(np.minimum(boxes_a[..., 3], boxes_b[..., 3]) - np.maximum(boxes_a[..., 1], boxes_b[..., 1]), 0, None)
+    intersection = width * height
+    area_a = (boxes_a[..., 2] - boxes_a[..., 0]) * (boxes_a[..., 3] - boxes_a[..., 1])
+    area_b = (boxes_b[..., 2] - boxes_b[..., 0]) * (boxes_b[..., 3] - boxes_b[..., 1])
+    return intersection / np.maximum(area_a + area_b - intersection, 1e-9)
@@ -0,0 +1,138 @@
+import numpy as np
+
+
+class DetectionTable:
+    """
+    列式存储的检测结果(struct of arrays), 每一行是一个检测框, 行按帧号升序排列
+        frame       int32    (N,)   帧号
+        track_id    int32    (N,)   track id, 网球固定为1
+        bbox        float32  (N, 4) x1, y1, x2, y2
+        confidence  float32  (N,)   置信度
+        class_id    int32    (N,)   类别id
+    num_frames 为视频总帧数, 包括没有检测结果的帧
+    相比 [{track_id: [x1, y1, x2, y2]}, ...] 每个检测框只占24字节, 并且可以对整段视频做向量化运算
+    """
+    def __init__(self, frame, track_id, bbox, confidence=None, class_id=None, num_frames=None):
+        self.frame = np.asarray(frame, dtype=np.int32)
+        self.track_id = np.asarray(track_id, dtype=np.int32)
+        self.bbox = np.asarray(bbox, dtype=np.float32).reshape(-1, 4)
+        if confidence is None:
+            confidence = np.ones(len(self.frame), dtype=np.float32)
+        if class_id is None:
+            class_id = np.zeros(len(self.frame), dtype=np.int32)
+        self.confidence = np.asarray(confidence, dtype=np.float32)
+        self.class_id = np.asarray(class_id, dtype=np.int32)
+        if num_frames is None:
+            num_frames = int(self.frame[-1]) + 1 if len(self.frame) else 0
+        self.num_frames = num_frames
+        self._frame_offsets = None
+
+    @classmethod
+    def empty(cls, num_frames=0):
+        return cls(np.zeros(0), np.zeros(0), np.zeros((0, 4)), num_frames=num_frames)
+
+    @classmethod
+    def concatenate(cls, tables, num_frames=None):
+        """
+        按顺序拼接多个表, 各表的帧号需要已经是整段视频中的绝对帧号
+        """
+        tables = list(tables)
+        if not tables:
+            return cls.empty(num_frames or 0)
+        if num_frames is None:
+            num_frames = max(table.num_frames for table in tables)
+        return cls(np.concatenate([table.frame for table in tables]),
+                   np.concatenate([table.track_id for table in tables]),
+                   np.concatenate([table.bbox for table in tables]),
+                   np.concatenate([table.confidence for table in tables]),
+                   np.concatenate([table.class_id for table in tables]),
+                   num_frames=num_frames)
+
+    @classmethod
+    def from_dicts(cls, detections):
+        """
+        由旧格式转换
+        :param detections: [{track_id: [x1, y1, x2, y2]}, ...]
+        """
+        frame_nums = []
+        track_ids = []
+        bboxes = []
+        for frame_num, detection_dict in enumerate(detections):
+            for track_id, bbox in detection_dict.items():
+                frame_nums.append(frame_num)
+                track_ids.append(track_id)
+                bboxes.append(bbox)
+        return cls(frame_nums, track_ids, np.asarray(bboxes, dtype=np.float32).reshape(-1, 4),
+                   num_frames=len(detections))
+
+    def to_dicts(self):
+        """
+        转换为旧格式 [{track_id: [x1, y1, x2, y2]}, ...]
+        """
+        return [self.get_frame_dict(frame_num) for frame_num in range(self.num_frames)]
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def frame_offsets(self):
+        # 第i帧的检测框位于 [frame_offsets[i], frame_offsets[i+1]) 行
+        if self._frame_offsets is None:
+            self._frame_offsets = np.searchsorted(self.frame, np.arange(self.num_frames + 1), side='left')
+        return self._frame_offsets
+
+    @property
+    def track_ids(self):
+        return np.unique(self.track_id).tolist()
+
+    def select(self, rows, num_frames=None):
+        """
+        按行选择(布尔掩码或升序的行号), 返回新表
+        """
+        return DetectionTable(self.frame[rows], self.track_id[rows], self.bbox[rows],
+                              self.confidence[rows], self.class_id[rows],
+                              num_frames=self.num_frames if num_frames is None else num_frames)
+
+    def get_frame(self, frame_num):
+        """
+        某一帧的检测结果, 返回的表中各列是原数组的视图, 不复制数据
+        """
+        start, end = self.frame_offsets[frame_num], self.frame_offsets[frame_num + 1]
+        return self.select(slice(start, end))
+
+    def get_frame_dict(self, frame_num):
+        """
+        某一帧的检测结果
+        :return: {track_id: [x1, y1, x2, y2]}
+        """
+        frame_table = self.get_frame(frame_num)
+        return dict(zip(frame_table.track_id.tolist(), frame_table.bbox.tolist()))
+
+    def slice_frames(self, start_frame, end_frame=None):
+        """
+        截取 [start_frame, end_frame) 的检测结果, 帧号从0重新编号
+        """
+        if end_frame is None:
+            end_frame = self.num_frames
+        start_frame = min(max(start_frame, 0), self.num_frames)
+        end_frame = min(max(end_frame, start_frame), self.num_frames)
+        frame_table = self.select(slice(self.frame_offsets[start_frame], self.frame_offsets[end_frame]),
+                                  num_frames=end_frame - start_frame)
+        frame_table.frame = frame_table.frame - start_frame
+        return frame_table
+
+    def filter_tracks(self, track_ids):
+        """
+        只保留指定track id的检测结果
+        """
+        return self.select(np.isin(self.track_id, track_ids))
+
+    def get_track_boxes(self, track_id):
+        """
+        某个track在每一帧的检测框, 没有检测结果的帧为NaN
+        :return: (num_frames, 4) float64 数组
+        """
+        boxes = np.full((self.num_frames, 4), np.nan)
+        mask = self.track_id == track_id
+        boxes[self.frame[mask]] = self.bbox[mask]
+        return boxes
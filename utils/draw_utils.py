@@ -0,0 +1,40 @@
+import numpy as np
+from .lazy_import import LazyModule
+
+cv2 = LazyModule('cv2')
+
+# 按(形状, 颜色)缓存的纯色块, 只读, 多个渲染线程可以共用
+_solid_blocks = {}
+
+
+def get_solid_block(shape, color):
+    """
+    取得一个纯色的uint8图像块, 同样的形状和颜色只分配一次
+    """
+    key = (tuple(shape), tuple(color))
+    block = _solid_blocks.get(key)
+    if block is None:
+        block = np.empty(shape, dtype=np.uint8)
+        block[:] = color
+        block.flags.writeable = False
+        _solid_blocks[key] = block
+    return block
+
+
+def blend_rectangle(frame, start_point, end_point, color, alpha):
+    """
+    在frame上原地画一个半透明的实心矩形, 只混合矩形区域, 不复制整帧
+    结果与 cv2.rectangle(..., cv2.FILLED) 画在整帧副本上再用 cv2.addWeighted 混合整帧相同
+    :param start_point: 左上角 (x, y)
+    :param end_point: 右下角 (x, y), 与cv2.rectangle一样包含在矩形内
+    :param color: BGR颜色
+    :param alpha: 矩形颜色的权重, 原图的权重为 1-alpha
+    :return: frame
+    """
+    x1, y1 = max(start_point[0], 0), max(start_point[1], 0)
+    x2, y2 = min(end_point[0] + 1, frame.shape[1]), min(end_point[1] + 1, frame.shape[0])
+    if x1 >= x2 or y1 >= y2:
+        return frame
+    roi = frame[y1:y2, x1:x2]
+    cv2.addWeighted(get_solid_block(roi.shape, color), alpha, roi, 1 - alpha, 0, dst=roi)
+    return frame
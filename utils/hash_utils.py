@@ -0,0 +1,62 @@
+import hashlib
+import json
+import os
+
+# 同一个文件在大小和修改时间不变的情况下只计算一次哈希
+_file_hash_memo = {}
+
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    """
+    分块计算文件内容的哈希, 不会把整个文件读进内存
+    :param file_path: 文件路径
+    :param chunk_size: 每次读取的字节数
+    :return: 十六进制哈希字符串
+    """
+    stat = os.stat(file_path)
+    memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    if memo_key in _file_hash_memo:
+        return _file_hash_memo[memo_key]
+
+    hasher = new_file_hasher()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    digest = hasher.hexdigest()
+    _file_hash_memo[memo_key] = digest
+    return digest
+
+
+def new_file_hasher():
+    """
+    :return: 与hash_file相同算法的哈希对象, 用于在写入文件的同时计算哈希(见 remember_file_hash)
+    """
+    return hashlib.blake2b(digest_size=16)
+
+
+def remember_file_hash(file_path, digest):
+    """
+    记录已经在写入时计算好的文件哈希, 之后hash_file不用再读一遍文件
+    :param digest: new_file_hasher() 的 hexdigest()
+    """
+    stat = os.stat(file_path)
+    _file_hash_memo[(os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)] = digest
+
+
+def hash_params(params):
+    """
+    计算参数字典的哈希, 与键的顺序无关
+    :param params: 可以json序列化的参数
+    :return: 十六进制哈希字符串
+    """
+    data = json.dumps(params, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def hash_file_or_name(file_path_or_name):
+    """
+    本地文件按内容计算哈希, 否则(如ultralytics自动下载的 'yolov8x.pt')直接使用名字
+    """
+    if os.path.isfile(file_path_or_name):
+        return hash_file(file_path_or_name)
+    return str(file_path_or_name)
@@ -0,0 +1,28 @@
+import importlib
+
+
+class LazyModule:
+    """
+    延迟导入的模块, 第一次访问属性时才真正导入
+    用于cv2、pandas、torch等导入较慢的库, 只用到几何计算或已缓存检测结果的代码路径不需要付出导入时间;
+    访问过的属性缓存在实例上, 之后的访问与直接使用模块一样快
+    用法: cv2 = LazyModule('cv2')
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        # 只有实例上还没有的属性才会进入这里
+        value = getattr(self._load(), attr)
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
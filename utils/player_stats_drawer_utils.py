@@ -1,58 +1,176 @@
+import threading
+from collections import OrderedDict
+
 import numpy as np
-import cv2
+from .draw_utils import blend_rectangle
+from .lazy_import import LazyModule
+
+cv2 = LazyModule('cv2')
+
+# 面板上显示的列, 顺序与 PlayerStatsPanel.values 的列一致
+PLAYER_STATS_COLUMNS = [
+    'player_1_last_shot_speed',
+    'player_2_last_shot_speed',
+    'player_1_last_player_speed',
+    'player_2_last_player_speed',
+    'player_1_average_shot_speed',
+    'player_2_average_shot_speed',
+    'player_1_average_player_speed',
+    'player_2_average_player_speed',
+]
+
+PANEL_WIDTH = 350
+PANEL_HEIGHT = 230
+
 
 def draw_player_stats(output_video_frames,player_stats):
+    panel = PlayerStatsPanel(player_stats)
+    for frame_num in range(min(len(output_video_frames), panel.num_frames)):
+        output_video_frames[frame_num] = panel.draw(output_video_frames[frame_num], frame_num)
 
-    for index, row in player_stats.iterrows():
-        player_1_shot_speed = row['player_1_last_shot_speed']
-        player_2_shot_speed = row['player_2_last_shot_speed']
-        player_1_speed = row['player_1_last_player_speed']
-        player_2_speed = row['player_2_last_player_speed']
-
-        avg_player_1_shot_speed = row['player_1_average_shot_speed']
-        avg_player_2_shot_speed = row['player_2_average_shot_speed']
-        avg_player_1_speed = row['player_1_average_player_speed']
-        avg_player_2_speed = row['player_2_average_player_speed']
-
-        frame = output_video_frames[index]
-        shapes = np.zeros_like(frame, np.uint8)
-
-        width=350
-        height=230
-
-        start_x = frame.shape[1]-400
-        start_y = frame.shape[0]-500
-        end_x = start_x+width
-        end_y = start_y+height
-
-        overlay = frame.copy()
-        cv2.rectangle(overlay, (start_x, start_y), (end_x, end_y), (0, 0, 0), -1)
-        alpha = 0.5 
-        cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
-        output_video_frames[index] = frame
-
-        text = "     Player 1     Player 2"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+80, start_y+30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-        
-        text = "Shot Speed"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+10, start_y+80), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
-        text = f"{player_1_shot_speed:.1f} km/h    {player_2_shot_speed:.1f} km/h"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+130, start_y+80), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-
-        text = "Player Speed"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+10, start_y+120), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
-        text = f"{player_1_speed:.1f} km/h    {player_2_speed:.1f} km/h"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+130, start_y+120), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-        
-        
-        text = "avg. S. Speed"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+10, start_y+160), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
-        text = f"{avg_player_1_shot_speed:.1f} km/h    {avg_player_2_shot_speed:.1f} km/h"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+130, start_y+160), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-        
-        text = "avg. P. Speed"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+10, start_y+200), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
-        text = f"{avg_player_1_speed:.1f} km/h    {avg_player_2_speed:.1f} km/h"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+130, start_y+200), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-    
     return output_video_frames
+
+
+def get_player_stats_panel_position(frame_shape):
+    """
+    :return: 面板左上角 (start_x, start_y)
+    """
+    return frame_shape[1]-400, frame_shape[0]-500
+
+
+def draw_player_stats_frame(frame, row):
+    start_x, start_y = get_player_stats_panel_position(frame.shape)
+    end_x = start_x+PANEL_WIDTH
+    end_y = start_y+PANEL_HEIGHT
+
+    # 只混合面板区域
+    alpha = 0.5
+    blend_rectangle(frame, (start_x, start_y), (end_x, end_y), (0, 0, 0), alpha)
+
+    return draw_player_stats_text(frame, row, start_x, start_y)
+
+
+def draw_player_stats_text(frame, row, start_x, start_y):
+    player_1_shot_speed = row['player_1_last_shot_speed']
+    player_2_shot_speed = row['player_2_last_shot_speed']
+    player_1_speed = row['player_1_last_player_speed']
+    player_2_speed = row['player_2_last_player_speed']
+
+    avg_player_1_shot_speed = row['player_1_average_shot_speed']
+    avg_player_2_shot_speed = row['player_2_average_shot_speed']
+    avg_player_1_speed = row['player_1_average_player_speed']
+    avg_player_2_speed = row['player_2_average_player_speed']
+
+    text = "     Player 1     Player 2"
+    frame = cv2.putText(frame, text, (start_x+80, start_y+30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
+    text = "Shot Speed"
+    frame = cv2.putText(frame, text, (start_x+10, start_y+80), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
+    text = f"{player_1_shot_speed:.1f} km/h    {player_2_shot_speed:.1f} km/h"
+    frame = cv2.putText(frame, text, (start_x+130, start_y+80), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+
+    text = "Player Speed"
+    frame = cv2.putText(frame, text, (start_x+10, start_y+120), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
+    text = f"{player_1_speed:.1f} km/h    {player_2_speed:.1f} km/h"
+    frame = cv2.putText(frame, text, (start_x+130, start_y+120), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+
+
+    text = "avg. S. Speed"
+    frame = cv2.putText(frame, text, (start_x+10, start_y+160), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
+    text = f"{avg_player_1_shot_speed:.1f} km/h    {avg_player_2_shot_speed:.1f} km/h"
+    frame = cv2.putText(frame, text, (start_x+130, start_y+160), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+
+    text = "avg. P. Speed"
+    frame = cv2.putText(frame, text, (start_x+10, start_y+200), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
+    text = f"{avg_player_1_speed:.1f} km/h    {avg_player_2_speed:.1f} km/h"
+    frame = cv2.putText(frame, text, (start_x+130, start_y+200), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+
+    return frame
+
+
+class PlayerStatsPanel:
+    """
+    按变化重绘的球员数据面板
+    数据只在击球帧变化, 相邻且数值相同的帧组成一段, 每段的文字只光栅化一次并缓存为精灵图;
+    每一帧只需混合面板背景, 再用两次整块的乘加把文字合成上去
+    文字没有抗锯齿时(OpenCV 4.x 的 LINE_8)结果与 draw_player_stats_frame 逐帧绘制逐位相同,
+    有抗锯齿时(OpenCV 5)个别边缘像素相差1
+    """
+    def __init__(self, player_stats, cache_size=4):
+        """
+        :param player_stats: 每帧一行的DataFrame, 需要包含 PLAYER_STATS_COLUMNS
+        :param cache_size: 缓存的精灵图数量, 多个渲染线程乱序处理相邻的两段时不会反复重绘
+        """
+        self.values = player_stats[PLAYER_STATS_COLUMNS].to_numpy(dtype=np.float64)
+        self.num_frames = len(self.values)
+
+        # 与上一帧任意一列不同(NaN与NaN视为相同)时开始新的一段
+        current = self.values[1:]
+        previous = self.values[:-1]
+        changed = ((current != previous) & ~(np.isnan(current) & np.isnan(previous))).any(axis=1)
+        self.segment_ids = np.concatenate([[0], np.cumsum(changed)])
+
+        self.cache_size = cache_size
+        self.sprites = OrderedDict()
+        self.sprite_lock = threading.Lock()
+        self.renders = 0
+
+    def get_row(self, frame_num):
+        return dict(zip(PLAYER_STATS_COLUMNS, self.values[frame_num]))
+
+    def get_sprite_box(self, frame_shape):
+        # 文字可能超出面板右侧, 精灵图一直延伸到画面右边缘, 下方留出字母下沿的空间
+        start_x, start_y = get_player_stats_panel_position(frame_shape)
+        return start_x, start_y, frame_shape[1], min(frame_shape[0], start_y+PANEL_HEIGHT+20)
+
+    def build_sprite(self, frame_num, frame_shape):
+        """
+        分别画在全黑和全白的画布上: 黑色画布上是按覆盖率预乘的文字颜色, 两者之差是每个像素上背景保留的权重
+        合成时 结果 = 背景 * 权重 / 255 + 预乘的颜色, 只处理文字所在的最小矩形
+        :return: (背景权重, 预乘的文字颜色, 文字矩形在画面中的位置 (x1, y1, x2, y2))
+        """
+        x1, y1, x2, y2 = self.get_sprite_box(frame_shape)
+        row = self.get_row(frame_num)
+        black_canvas = draw_player_stats_text(np.zeros((y2-y1, x2-x1, 3), np.uint8), row, 0, 0)
+        white_canvas = draw_player_stats_text(np.full((y2-y1, x2-x1, 3), 255, np.uint8), row, 0, 0)
+        background_weights = (white_canvas.astype(np.int16) - black_canvas).astype(np.uint8)
+        self.renders += 1
+
+        ys, xs = np.nonzero(background_weights.min(axis=2) < 255)
+        if len(ys) == 0:
+            return background_weights[:0, :0], black_canvas[:0, :0], (x1, y1, x1, y1)
+        text_y1, text_y2, text_x1, text_x2 = ys.min(), ys.max() + 1, xs.min(), xs.max() + 1
+        return (background_weights[text_y1:text_y2, text_x1:text_x2].copy(),
+                black_canvas[text_y1:text_y2, text_x1:text_x2].copy(),
+                (x1 + text_x1, y1 + text_y1, x1 + text_x2, y1 + text_y2))
+
+    def get_sprite(self, frame_num, frame_shape):
+        key = (int(self.segment_ids[frame_num]), frame_shape)
+        with self.sprite_lock:
+            sprite = self.sprites.get(key)
+            if sprite is None:
+                sprite = self.build_sprite(frame_num, frame_shape)
+                self.sprites[key] = sprite
+                if len(self.sprites) > self.cache_size:
+                    self.sprites.popitem(last=False)
+            else:
+                self.sprites.move_to_end(key)
+        return sprite
+
+    def draw(self, frame, frame_num):
+        """
+        把第frame_num帧的数据面板原地画到frame上
+        """
+        start_x, start_y = get_player_stats_panel_position(frame.shape)
+        if start_x < 0 or start_y < 0:
+            # 画面比面板还小, 直接逐帧绘制
+            return draw_player_stats_frame(frame, self.get_row(frame_num))
+
+        blend_rectangle(frame, (start_x, start_y), (start_x+PANEL_WIDTH, start_y+PANEL_HEIGHT), (0, 0, 0), 0.5)
+        background_weights, text_colors, (x1, y1, x2, y2) = self.get_sprite(frame_num, frame.shape)
+        if x1 == x2:
+            return frame
+        roi = frame[y1:y2, x1:x2]
+        cv2.multiply(roi, background_weights, dst=roi, scale=1/255)
+        cv2.add(roi, text_colors, dst=roi)
+        return frame
@@ -1,39 +1,158 @@
 
-import cv2
 import numpy as np
+from .video_writer import VideoEncoder
+from .lazy_import import LazyModule
 
-def read_video(video_path):
+cv2 = LazyModule('cv2')
+
+
+class VideoFrameReader:
+    """
+    流式读取视频帧, 每次迭代重新打开视频并逐帧解码, 内存占用与视频长度无关
+    """
+    def __init__(self, video_path):
+        self.video_path = video_path
+
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise IOError(f"Could not open video: {video_path}")
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or 24
+        self.frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        cap.release()
+
+    def __iter__(self):
+        cap = cv2.VideoCapture(self.video_path)
+        try:
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                yield frame
+        finally:
+            cap.release()
+
+    def iter_frames(self, start_frame=0, end_frame=None):
+        """
+        从start_frame开始流式读取, 用于分段并行处理
+        :param start_frame: 第一帧的帧号, 定位方式见 open_video_at
+        :param end_frame: 结束帧号(不含), 为None时读到视频结尾
+        :return: 迭代帧图像
+        """
+        cap, reached = open_video_at(self.video_path, start_frame)
+        try:
+            if not reached:
+                return
+            frame_num = start_frame
+            while end_frame is None or frame_num < end_frame:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                yield frame
+                frame_num += 1
+        finally:
+            cap.release()
+
+    def __len__(self):
+        # 容器中记录的帧数, 部分编码格式下只是估计值
+        return self.frame_count
+
+    def read_frame(self, frame_num):
+        """
+        读取指定的一帧
+        :param frame_num: 帧号
+        :return: 帧图像
+        """
+        return self.read_frames([frame_num])[frame_num]
+
+    def read_frames(self, frame_nums):
+        """
+        顺序解码并只保留指定的帧, 跳过的帧只grab不解码, 比按帧号seek更准确
+        :param frame_nums: 需要的帧号列表
+        :return: {帧号: 帧图像}
+        """
+        wanted = set(frame_nums)
+        frames = {}
+        if not wanted:
+            return frames
+        last_frame_num = max(wanted)
+        cap = cv2.VideoCapture(self.video_path)
+        try:
+            for frame_num in range(last_frame_num + 1):
+                if frame_num in wanted:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    frames[frame_num] = frame
+                elif not cap.grab():
+                    break
+        finally:
+            cap.release()
+        missing = wanted - frames.keys()
+        if missing:
+            raise IndexError(f"Frames {sorted(missing)} out of range for {self.video_path}")
+        return frames
+
+
+def open_video_at(video_path, start_frame=0):
+    """
+    打开视频并定位到start_frame, 前面的帧只grab不解码
+    不用CAP_PROP_POS_FRAMES: 按帧号seek在压缩视频上可能停在附近的关键帧, 之后的帧号都会错位
+    :param video_path: 视频路径
+    :param start_frame: 下一次read()读到的帧号
+    :return: (cv2.VideoCapture, 是否到达start_frame), 视频不足start_frame帧时停在结尾
+    """
     cap = cv2.VideoCapture(video_path)
-    frames = []
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frames.append(frame)
-    cap.release()
-    return frames[:300]  # 限制处理帧数
+    for _ in range(start_frame):
+        if not cap.grab():
+            return cap, False
+    return cap, True
 
 
-def save_video(output_video_frames, output_video_path):
-    fourcc = cv2.VideoWriter_fourcc(*'MJPG')
-    out = cv2.VideoWriter(output_video_path, fourcc, 24, (output_video_frames[0].shape[1], output_video_frames[0].shape[0]))
-    for frame in output_video_frames:
-        out.write(frame)
-    out.release()
+def batch_frames(frames, batch_size):
+    """
+    将帧迭代器按batch_size分组
+    :param frames: 帧列表或迭代器
+    :param batch_size: 每组的帧数
+    :return: 迭代每组帧的列表, 最后一组可能不足batch_size
+    """
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 
-def save_video_to_images_with_sampling(output_video_frames, output_video_path, max_frame_id, num_samples=10,
-                                       target_size_kb=500):
+def save_video(output_video_frames, output_video_path, fps=24, codec=None, queue_size=16):
     """
-    保存视频并在max_frame_id帧的左右各采样输出num_samples张图片，并将这些图片拼接成一个9宫格的图片
-    :param output_video_frames: 视频帧列表
-    :param output_video_path: 输出视频路径
+    保存视频, output_video_frames 可以是列表也可以是逐帧产生的迭代器
+    编码在后台线程中进行, 与产生帧的过程同时运行
+    :param fps: 帧率, 应传入原视频的帧率(VideoFrameReader.fps)
+    :param codec: 编码方式, 见 video_writer.VIDEO_CODECS, 为None时按扩展名选择(.avi为MJPG, .mp4为H.264)
+    :param queue_size: 等待编码的最大帧数
+    :return: 编码统计信息
+    """
+    encoder = VideoEncoder(output_video_path, fps=fps, codec=codec, queue_size=queue_size)
+    with encoder:
+        for frame in output_video_frames:
+            encoder.write(frame)
+    if encoder.frames == 0:
+        raise ValueError("No frames to save")
+    return encoder.get_stats()
+
+
+def get_sampled_frame_ids(total_frames, max_frame_id, num_samples=10):
+    """
+    在max_frame_id帧的左右各采样, 最多返回9个帧号
+    :param total_frames: 总帧数
     :param max_frame_id: 需要采样的中心帧ID
-    :param num_samples: 每侧采样的帧数
-    :param target_size_kb: 目标文件大小（KB）
+    :param num_samples: 采样间隔
+    :return: 排好序的帧号列表
     """
-    # 采样输出图片
-    total_frames = len(output_video_frames)
     output_frame_id_list = []
 
     # 采样左侧的帧
@@ -52,9 +171,36 @@ def save_video_to_images_with_sampling(output_video_frames, output_video_path, m
     output_frame_id_list = output_frame_id_list[:9]
 
     print(f"output_frame_id_list: {output_frame_id_list}")
+    return sorted(output_frame_id_list)
+
+
+def save_video_to_images_with_sampling(output_video_frames, output_video_path, max_frame_id, num_samples=10,
+                                       target_size_kb=500):
+    """
+    保存视频并在max_frame_id帧的左右各采样输出num_samples张图片，并将这些图片拼接成一个9宫格的图片
+    :param output_video_frames: 视频帧列表
+    :param output_video_path: 输出视频路径
+    :param max_frame_id: 需要采样的中心帧ID
+    :param num_samples: 每侧采样的帧数
+    :param target_size_kb: 目标文件大小（KB）
+    """
+    # 采样输出图片
+    output_frame_id_list = get_sampled_frame_ids(len(output_video_frames), max_frame_id, num_samples)
 
     # 按顺序保存采样的帧
-    sampled_frames = [output_video_frames[i] for i in sorted(output_frame_id_list)]
+    sampled_frames = [output_video_frames[i] for i in output_frame_id_list]
+    return save_frames_to_grid_image(sampled_frames, output_video_path, target_size_kb)
+
+
+def save_frames_to_grid_image(sampled_frames, output_video_path, target_size_kb=500):
+    """
+    将采样的帧拼接成一个9宫格的图片并压缩保存
+    :param sampled_frames: 采样的帧列表, 不足9帧时用最后一帧补齐
+    :param output_video_path: 输出路径前缀
+    :param target_size_kb: 目标文件大小（KB）
+    :return: 九宫格图片路径
+    """
+    sampled_frames = list(sampled_frames)
 
     # 补帧
     if len(sampled_frames) <= 9:
@@ -0,0 +1,232 @@
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+
+import numpy as np
+from .lazy_import import LazyModule
+
+cv2 = LazyModule('cv2')
+
+# 编码方式名称 -> (后端, 编码器)
+VIDEO_CODECS = {
+    'mjpg': ('opencv', 'MJPG'),
+    'mp4v': ('opencv', 'mp4v'),
+    'h264': ('ffmpeg', 'libx264'),
+}
+
+# 未指定编码方式时按输出文件的扩展名选择
+DEFAULT_CODECS = {
+    '.avi': 'mjpg',
+    '.mp4': 'h264',
+    '.mkv': 'h264',
+    '.mov': 'h264',
+}
+
+# ffmpeg不可用时的替代编码方式, 需要与容器兼容
+FALLBACK_CODECS = {
+    'h264': 'mp4v',
+}
+
+# 队列结束标记
+_STOP = object()
+
+
+def get_ffmpeg_path(ffmpeg_path=None):
+    """
+    :param ffmpeg_path: 指定的ffmpeg路径, 为None时在PATH中查找
+    :return: ffmpeg可执行文件路径, 找不到时返回None
+    """
+    return shutil.which(ffmpeg_path or 'ffmpeg')
+
+
+def resolve_codec(output_path, codec=None, ffmpeg_path=None):
+    """
+    确定实际使用的编码方式
+    :param output_path: 输出路径
+    :param codec: VIDEO_CODECS中的名称, 为None时按扩展名选择
+    :param ffmpeg_path: 指定的ffmpeg路径
+    :return: 编码方式名称, 需要ffmpeg但找不到时退回到FALLBACK_CODECS
+    """
+    if codec is None:
+        codec = DEFAULT_CODECS.get(os.path.splitext(output_path)[1].lower(), 'mjpg')
+    if codec not in VIDEO_CODECS:
+        raise ValueError(f"Unknown codec {codec!r}, expected one of {sorted(VIDEO_CODECS)}")
+    if VIDEO_CODECS[codec][0] == 'ffmpeg' and get_ffmpeg_path(ffmpeg_path) is None:
+        fallback = FALLBACK_CODECS[codec]
+        print(f"ffmpeg not found, encoding {output_path} with {fallback} instead of {codec}")
+        codec = fallback
+    return codec
+
+
+class OpenCVVideoSink:
+    """
+    通过cv2.VideoWriter编码
+    """
+    def __init__(self, output_path, fps, frame_size, fourcc):
+        self.writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*fourcc), fps, frame_size)
+        if not self.writer.isOpened():
+            raise IOError(f"Could not open video writer for {output_path} with {fourcc}")
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def close(self):
+        self.writer.release()
+
+
+class FFmpegVideoSink:
+    """
+    把原始BGR帧通过管道交给ffmpeg进程编码
+    """
+    def __init__(self, output_path, fps, frame_size, encoder, ffmpeg_path=None, crf=23, preset='veryfast'):
+        self.output_path = output_path
+        width, height = frame_size
+        command = [
+            get_ffmpeg_path(ffmpeg_path), '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+            # yuv420p要求宽高为偶数
+            '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+            '-an', '-c:v', encoder, '-preset', preset, '-crf', str(crf), '-pix_fmt', 'yuv420p',
+            output_path,
+        ]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        self.process.stdin.write(np.ascontiguousarray(frame).data)
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise IOError(f"ffmpeg exited with code {self.process.returncode} while writing {self.output_path}")
+
+
+class VideoEncoder:
+    """
+    后台线程编码视频
+    write只把帧放入有界队列, 编码在后台线程中进行, 与解码、绘制同时运行; 队列满时write阻塞,
+    内存中等待编码的帧数不超过queue_size. 写入后的帧不能再被修改
+    """
+    def __init__(self, output_path, fps=24, codec=None, queue_size=16, ffmpeg_path=None, crf=23, preset='veryfast'):
+        """
+        :param output_path: 输出路径
+        :param fps: 帧率, 应与原视频一致
+        :param codec: VIDEO_CODECS中的名称, 为None时按扩展名选择(.avi为mjpg, .mp4等为h264)
+        :param queue_size: 等待编码的最大帧数
+        :param ffmpeg_path: ffmpeg路径, 为None时在PATH中查找
+        :param crf: ffmpeg编码的质量参数, 越小质量越高、文件越大
+        :param preset: ffmpeg编码的速度预设
+        """
+        self.output_path = output_path
+        self.fps = fps
+        self.codec = resolve_codec(output_path, codec, ffmpeg_path)
+        self.ffmpeg_path = ffmpeg_path
+        self.crf = crf
+        self.preset = preset
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = None
+        self.sink = None
+        self.error = None
+        self.closed = False
+
+        # 统计信息
+        self.frames = 0
+        self.encode_seconds = 0.0
+        self.blocked_seconds = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+            return
+        # 产生帧的代码已经出错, 关闭时的错误只打印, 不能掩盖原来的错误
+        try:
+            self.close()
+        except Exception as error:
+            print(f"Failed to close video encoder for {self.output_path}: {error!r}")
+
+    def open_sink(self, frame_size):
+        backend, encoder = VIDEO_CODECS[self.codec]
+        if backend == 'ffmpeg':
+            return FFmpegVideoSink(self.output_path, self.fps, frame_size, encoder, self.ffmpeg_path,
+                                   self.crf, self.preset)
+        return OpenCVVideoSink(self.output_path, self.fps, frame_size, encoder)
+
+    def write(self, frame):
+        """
+        提交一帧, 第一帧决定输出视频的尺寸
+        """
+        if self.closed:
+            raise ValueError(f"VideoEncoder for {self.output_path} is closed")
+        if self.thread is None:
+            self.sink = self.open_sink((frame.shape[1], frame.shape[0]))
+            self.thread = threading.Thread(target=self._encode, daemon=True)
+            self.thread.start()
+
+        start_time = time.perf_counter()
+        while True:
+            if self.error is not None:
+                raise self.error
+            try:
+                self.queue.put(frame, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self.blocked_seconds += time.perf_counter() - start_time
+
+    def close(self):
+        """
+        等待队列中的帧全部编码完成并关闭输出文件, 编码线程出错时抛出该错误
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if self.thread is not None:
+            while self.thread.is_alive():
+                try:
+                    self.queue.put(_STOP, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            self.thread.join()
+            try:
+                self.sink.close()
+            except Exception as error:
+                self.error = self.error or error
+        if self.error is not None:
+            raise self.error
+
+    def get_stats(self):
+        """
+        编码的帧数、后台编码耗时和write因队列满而等待的时间; 等待时间长说明编码是最慢的阶段
+        """
+        return {
+            'codec': self.codec,
+            'frames': self.frames,
+            'encode_seconds': self.encode_seconds,
+            'blocked_seconds': self.blocked_seconds,
+        }
+
+    def _encode(self):
+        try:
+            while True:
+                frame = self.queue.get()
+                if frame is _STOP:
+                    break
+                start_time = time.perf_counter()
+                self.sink.write(frame)
+                self.encode_seconds += time.perf_counter() - start_time
+                self.frames += 1
+        except BaseException as error:
+            self.error = error
+            # 丢弃剩余的帧, 让阻塞在write中的调用方尽快看到错误
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
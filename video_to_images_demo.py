@@ -1,12 +1,31 @@
 
-import cv2
+import argparse
 
-from utils import read_video
-from utils import save_video_to_images_with_sampling
+from utils import VideoFrameReader
+from utils import LazyModule
+from utils import get_sampled_frame_ids
+from utils import save_frames_to_grid_image
+from utils import hash_file_or_name
 
-from trackers import PlayerTracker
+from model_registry import registry
 
-from openai.azure_openai import send_image_and_text_to_gpt
+from openai.azure_openai import send_image_and_text_to_gpt, get_default_client
+
+from result_cache import ResultCache
+
+from telemetry import profiler, add_profile_arguments, start_profiling_from_args, finish_profiling_from_args
+
+cv2 = LazyModule('cv2')
+
+PLAYER_MODEL_PATH = 'yolov8x.pt'
+NUM_SAMPLES = 10
+SKIP_FRAMES = 10
+TARGET_SIZE_KB = 800
+REVIEW_PROMPT = "提供了一组网球运动员的动作照片\n" \
+                "***回复格式示例***\n【动作】:xx\n【评分】:1~100分\n【优点】:xx\n【缺点】:xx\n\n" \
+                "\n请根据[照片]，判断图片是哪一个网球动作（正手、单反、双反、正手切削、反手切削等），" \
+                "并给这个网球动作打分, 打分的标准要参考图片动作和职业球员的标准动作的差距来确定, " \
+                "并参考[回复格式示例]生成一份140字内的打分报告, 不要虚构数据和评语"
 
 
 def calculate_area(box: list):
@@ -32,48 +51,50 @@ def calculate_width(box: list):
     return width
 
 
-def find_frame_id_with_max_box(player_detections: list):
+def find_frame_id_with_max_box(player_detections):
     """
     找到bounding box面积最大的帧 (找到box的宽度最大的帧)
-    :param player_detections: 每一帧的bounding box数据，格式为 [{1: [x1, y1, x2, y2]}, ...]
-    :return: 面积最大的帧号
+    :param player_detections: DetectionTable
+    :return: 面积最大的帧号, 没有检测结果时返回-1
     """
-    max_width = 0
-    max_frame_id = -1
-
-    for frame_id, detection in enumerate(player_detections):
-        for player_id, box in detection.items():
-            width = calculate_width(box)
-            # print(f"{frame_id}: {player_id} {width} {detection}")
-            if width > max_width:
-                max_width = width
-                max_frame_id = frame_id
-    return max_frame_id
+    widths = player_detections.bbox[:, 2] - player_detections.bbox[:, 0]
+    if len(widths) == 0 or widths.max() <= 0:
+        return -1
+    # 宽度相同时取最早的帧
+    return int(player_detections.frame[widths.argmax()])
 
 
-def process_video_by_ai(input_video_path: str):
+def render_action_image(input_video_path: str):
     """
-    通过AI处理视频
+    检测球员并把采样的帧拼成一张图片(本地推理部分)
     :param input_video_path:
-    :return:
+    :return: 图片路径
     """
     input_video_name = input_video_path.split('/')[0]
     # read video
-    video_frames = read_video(input_video_path)
-    print(f"video_frames: {len(video_frames)}")
+    video_reader = VideoFrameReader(input_video_path)
+    print(f"video_frames: {len(video_reader)}")
     # Detect players and ball
-    player_tracker = PlayerTracker(model_path='yolov8x.pt')
-    player_detections = player_tracker.detect_frames(video_frames)
-
-    # draw players bounding boxes
-    output_video_frames = player_tracker.draw_bboxes(video_frames=video_frames, player_detections=player_detections)
+    # 模型在进程内只加载一次, 每个任务使用新的跟踪状态
+    with registry.player_tracker(PLAYER_MODEL_PATH) as player_tracker, \
+            profiler.stage("detect_players", len(video_reader)):
+        player_detections = player_tracker.detect_frames(video_reader, batch_size=8)
+    total_frames = player_detections.num_frames
 
     # find_frame_id_with_max_box
-    max_box_frame_id = find_frame_id_with_max_box(player_detections[10:])  # 剔除前面几帧
+    max_box_frame_id = find_frame_id_with_max_box(player_detections.slice_frames(SKIP_FRAMES))  # 剔除前面几帧
     print(f"max_box_frame_id: {max_box_frame_id}")
 
-    # Draw frame number on top left corner
-    for i, frame in enumerate(output_video_frames):
+    # 只重新解码需要采样的帧
+    sampled_frame_ids = [frame_id % total_frames for frame_id in
+                         get_sampled_frame_ids(total_frames, max_box_frame_id, num_samples=NUM_SAMPLES)]
+    with profiler.stage("read_sampled_frames", len(sampled_frame_ids)):
+        sampled_frames = video_reader.read_frames(sampled_frame_ids)
+    for i, frame in sampled_frames.items():
+        # draw players bounding boxes
+        frame = player_tracker.draw_bbox(frame, player_detections.get_frame(i))
+
+        # Draw frame number on top left corner
         cv2.putText(frame, f"Frame: {i}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
         if i >= max_box_frame_id:
             cv2.putText(frame, f"Frame: {i}*", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
@@ -82,25 +103,71 @@ def process_video_by_ai(input_video_path: str):
 
     # Save image
     image_path = f"/tmp/{input_video_name}"
-    output_image_path = save_video_to_images_with_sampling(output_video_frames, image_path,
-                                                           max_box_frame_id, num_samples=10, target_size_kb=800)
+    output_image_path = save_frames_to_grid_image([sampled_frames[i] for i in sampled_frame_ids], image_path,
+                                                  target_size_kb=TARGET_SIZE_KB)
     print("save image successfully")
+    return output_image_path
+
+
+def review_action_image(output_image_path: str):
+    """
+    把图片发给GPT打分(远程接口部分)
+    :param output_image_path: render_action_image 生成的图片
+    :return: 打分报告
+    """
+    with profiler.stage("gpt_review"):
+        response_msg = send_image_and_text_to_gpt(output_image_path, REVIEW_PROMPT)
+    return response_msg
 
-    # send image to gpt
-    text = "提供了一组网球运动员的动作照片\n" \
-           "***回复格式示例***\n【动作】:xx\n【评分】:1~100分\n【优点】:xx\n【缺点】:xx\n\n" \
-           "\n请根据[照片]，判断图片是哪一个网球动作（正手、单反、双反、正手切削、反手切削等），" \
-           "并给这个网球动作打分, 打分的标准要参考图片动作和职业球员的标准动作的差距来确定, " \
-           "并参考[回复格式示例]生成一份140字内的打分报告, 不要虚构数据和评语"
-    response_msg = send_image_and_text_to_gpt(output_image_path, text)
 
+def get_analysis_params():
+    """
+    影响分析结果的参数, 作为结果缓存的键; 修改提示词、模型或采样方式后旧的结果自动失效
+    """
+    return {
+        'player_model': hash_file_or_name(PLAYER_MODEL_PATH),
+        'num_samples': NUM_SAMPLES,
+        'skip_frames': SKIP_FRAMES,
+        'target_size_kb': TARGET_SIZE_KB,
+        'prompt': REVIEW_PROMPT,
+        'gpt': get_default_client().get_settings(),
+    }
+
+
+def create_result_cache(cache_dir='analysis_cache', **cache_params):
+    """
+    :param cache_params: ResultCache的其他参数(max_entries, max_bytes, max_age_seconds)
+    """
+    return ResultCache(cache_dir, get_analysis_params(), **cache_params)
+
+
+def process_video_by_ai(input_video_path: str, result_cache=None):
+    """
+    通过AI处理视频
+    :param input_video_path:
+    :param result_cache: ResultCache, 同一个视频已经分析过时直接返回上次的结果
+    :return: (打分报告, 图片路径)
+    """
+    if result_cache is not None:
+        cached_result = result_cache.get(input_video_path)
+        if cached_result is not None:
+            return cached_result
+    output_image_path = render_action_image(input_video_path)
+    response_msg = review_action_image(output_image_path)
+    if result_cache is not None:
+        return result_cache.put(input_video_path, response_msg, output_image_path)
     return response_msg, output_image_path
 
 
 # test
 if __name__ == "__main__":
-    pass
+    parser = argparse.ArgumentParser()
+    add_profile_arguments(parser)
+    parser.add_argument('--no-cache', action='store_true', help='不使用缓存的结果, 重新分析视频')
+    args = parser.parse_args()
+    start_profiling_from_args(args)
     # input_video_name = "67_1723086456_raw"
     # # Read Video
     input_video_path = f"input_videos/input_video.mp4"
-    process_video_by_ai(input_video_path)
+    process_video_by_ai(input_video_path, None if args.no_cache else create_result_cache())
+    finish_profiling_from_args(args)
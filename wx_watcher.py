@@ -8,7 +8,8 @@
 """
 import os
 import time
-import subprocess
+import asyncio
+import threading
 import datetime
 
 from appium import webdriver
@@ -18,7 +19,10 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions
 from xml.etree import ElementTree
 
-from video_to_images_demo import process_video_by_ai
+from video_to_images_demo import render_action_image, review_action_image, create_result_cache
+from model_registry import registry
+from job_service import JobService, JobStore
+from device_io import AdbDevice, AdbError
 
 FLICK_START_X = 300
 FLICK_START_Y = 300
@@ -70,123 +74,63 @@ def is_video_time_less_than_x_seconds(time_text: str, max_seconds: int = 15) ->
         return False
 
 
-def clear_mp4_files_in_directory(directory_path):
-    """
-    清理指定目录下的所有MP4文件，并触发媒体库更新。
-    :param directory_path: 设备中的目录路径
-    """
-    try:
-        # 列出目录下所有的mp4文件
-        list_command = ['adb', 'shell', 'ls', f'{directory_path}/*.mp4']
-        list_result = subprocess.run(list_command, capture_output=True, text=True)
-
-        if list_result.returncode != 0:
-            print(f"Error listing files: {list_result.stderr}")
-            return
-
-        # 获取文件列表
-        file_list = list_result.stdout.strip().split('\n')
-        if file_list == ['']:
-            print("No MP4 files found.")
-            return
-
-        # 删除每个文件
-        for file in file_list:
-            if file.strip():  # 确保文件名不是空字符串
-                delete_command = ['adb', 'shell', 'rm', f'"{file}"']
-                delete_result = subprocess.run(delete_command, capture_output=True, text=True)
-                if delete_result.returncode == 0:
-                    print(f"Deleted {file}")
-                else:
-                    print(f"Failed to delete {file}: {delete_result.stderr}")
-
-        # 触发媒体扫描更新媒体库
-        scan_command = ['adb', 'shell', 'am', 'broadcast', '-a', 'android.intent.action.MEDIA_SCANNER_SCAN_FILE', '-d', f'file://{directory_path}']
-        scan_result = subprocess.run(scan_command, capture_output=True, text=True)
-        if scan_result.returncode == 0:
-            print("Media scan triggered successfully.")
-        else:
-            print(f"Failed to trigger media scan: {scan_result.stderr}")
-
-    except Exception as e:
-        print(f"An error occurred: {e}")
-
-
-def pull_file_from_device(device_path, local_path):
-    """
-    从设备中拉取文件到本地
-    :param device_path: 设备中的文件路径
-    :param local_path: 本地保存文件的路径
-    """
-    try:
-        # 执行 adb pull 命令
-        result = subprocess.run(['adb', 'pull', device_path, local_path], capture_output=True, text=True)
-
-        # 检查命令是否成功执行
-        if result.returncode == 0:
-            print(f"File pulled successfully from {device_path} to {local_path}")
-        else:
-            print(f"Failed to pull file: {result.stderr}")
-    except Exception as e:
-        print(f"An error occurred: {e}")
-
-
-def push_file_to_device(local_path, device_path):
-    """
-    将本地文件推送到设备中
-    :param local_path: 本地文件路径
-    :param device_path: 设备中的保存路径
-    """
-    try:
-        # 执行 adb push 命令
-        result = subprocess.run(['adb', 'push', local_path, device_path], capture_output=True, text=True)
-
-        # 检查命令是否成功执行
-        if result.returncode == 0:
-            print(f"File pushed successfully from {local_path} to {device_path}")
-            # 触发媒体扫描
-            scan_command = ['adb', 'shell', 'am', 'broadcast', '-a', 'android.intent.action.MEDIA_SCANNER_SCAN_FILE',
-                            '-d', f'file://{device_path}']
-            scan_result = subprocess.run(scan_command, capture_output=True, text=True)
-            if scan_result.returncode == 0:
-                print("Media scan triggered successfully.")
-            else:
-                print(f"Failed to trigger media scan: {scan_result.stderr}")
-        else:
-            print(f"Failed to push file: {result.stderr}")
-
-    except Exception as e:
-        print(f"An error occurred: {e}")
+WX_PACKAGE = 'com.tencent.mm'
 
 
 class WXAppOperator:
-    def __init__(self):
+    def __init__(self, appium_server_url='http://localhost:4723', new_command_timeout=60):
         """
         初始化
+        :param appium_server_url: Appium服务地址
+        :param new_command_timeout: 多少秒没有新命令时Appium关闭会话, 长期保持的会话需要调大
         """
         capabilities = dict(
             platformName='Android',
             automationName='uiautomator2',
             deviceName='BH901V3R9E',
-            appPackage='com.tencent.mm',  # 微信的包名
+            appPackage=WX_PACKAGE,  # 微信的包名
             appActivity='.ui.LauncherUI',  # 微信的启动活动
             noReset=True,  # 不重置应用的状态
             fullReset=False,  # 不完全重置应用
-            forceAppLaunch=True  # 强制重新启动应用
+            forceAppLaunch=True,  # 强制重新启动应用
+            newCommandTimeout=new_command_timeout
 
         )
-        appium_server_url = 'http://localhost:4723'
         print('Loading driver...')
         driver = webdriver.Remote(appium_server_url, options=UiAutomator2Options().load_capabilities(capabilities))
         self.driver = driver
         print('Driver loaded successfully.')
         self.cur_item_name_set = set()
 
+    def is_alive(self):
+        """
+        检查会话是否可用, 微信不在前台时切换回微信
+        :return: 会话已失效(Appium重启、手机断开等)时返回False
+        """
+        try:
+            if self.driver.current_package != WX_PACKAGE:
+                self.driver.activate_app(WX_PACKAGE)
+            return True
+        except Exception as error:
+            print(f"Driver session lost: {error}")
+            return False
+
+    def return_to_chat_list(self, max_back=5):
+        """
+        按返回键回到微信首页的聊天列表, 不重新启动微信; 返回几次仍不在首页时把微信切到前台
+        """
+        for _ in range(max_back):
+            if self.driver.find_elements(AppiumBy.XPATH, '//*[@text="微信"]'):
+                return
+            self.driver.back()
+        self.driver.activate_app(WX_PACKAGE)
+
     def enter_chat_page(self, chat_name: str):
         """
-        进入聊天窗口
+        进入聊天窗口, 当前在其他聊天或页面时先回到聊天列表
         :return:
         """
+        self.return_to_chat_list()
         # 使用显式完全加载
         WebDriverWait(self.driver, 60). \
             until(expected_conditions.presence_of_element_located((AppiumBy.XPATH, '//*[@text="微信"]')))
@@ -307,6 +251,76 @@ class WXAppOperator:
         print('Driver closed.')
 
 
+class WXSessionManager:
+    """
+    长期保持一个Appium会话, 所有任务共用
+    每次创建会话都要重新启动微信(forceAppLaunch), 需要数秒; 复用会话后任务之间只通过返回键切换聊天;
+    每次使用前检查会话是否可用, 失效时自动重新连接
+    """
+    def __init__(self, appium_server_url='http://localhost:4723', new_command_timeout=3600):
+        """
+        :param appium_server_url: Appium服务地址
+        :param new_command_timeout: 会话空闲多少秒后由Appium关闭, 超过后下次使用时重新连接
+        """
+        self.appium_server_url = appium_server_url
+        self.new_command_timeout = new_command_timeout
+        # 只有一台手机, 同一时间只有一个任务操作
+        self.lock = threading.Lock()
+        self.operator = None
+
+        # 统计信息
+        self.connects = 0
+        self.reconnects = 0
+        self.uses = 0
+
+    def get_operator(self):
+        """
+        :return: 可用的WXAppOperator, 没有或已失效时重新连接
+        """
+        if self.operator is not None and not self.operator.is_alive():
+            self.reconnects += 1
+            self._close_operator()
+        if self.operator is None:
+            self.operator = WXAppOperator(self.appium_server_url, new_command_timeout=self.new_command_timeout)
+            self.connects += 1
+        return self.operator
+
+    def run(self, func):
+        """
+        用会话执行一组操作; 出错后检查会话, 是会话中途失效导致的则重新连接并再执行一次
+        :param func: 输入WXAppOperator的函数, 从聊天列表开始操作(enter_chat_page), 可以重新执行;
+                     重新执行时应跳过已经完成的步骤(见WXDevice), 已发出的消息不能再发一次
+        :return: func的返回值
+        """
+        with self.lock:
+            self.uses += 1
+            wx_operator = self.get_operator()
+            try:
+                return func(wx_operator)
+            except Exception:
+                if wx_operator.is_alive():
+                    raise
+                print("Driver session lost during operation, reconnecting...")
+                self.reconnects += 1
+                self._close_operator()
+            return func(self.get_operator())
+
+    def _close_operator(self):
+        try:
+            self.operator.close()
+        except Exception as error:
+            print(error)
+        self.operator = None
+
+    def close(self):
+        with self.lock:
+            if self.operator is not None:
+                self._close_operator()
+
+    def get_stats(self):
+        return {'connects': self.connects, 'reconnects': self.reconnects, 'uses': self.uses}
+
+
 import requests
 import json
 from datetime import datetime, timedelta
@@ -364,66 +378,114 @@ def write_content_to_file(content):
         return {"error": str(e)}
 
 
-if __name__ == '__main__':
-    # 进入等待
-    while True:
-        chat_room_name = get_chat_room_name()
-        if chat_room_name:
-            print(f"{chat_room_name} 触发任务")
-            write_content_to_file(f"{chat_room_name} RUNNING")
-            try:
-                wx_operator = WXAppOperator()
-                wx_operator.enter_chat_page(chat_room_name)
+class HttpTrigger:
+    """
+    触发接口: 用户在微信中发起分析后, 服务器记录聊天名称
+    """
+    def fetch(self):
+        return get_chat_room_name()
+
+    def acknowledge(self, chat_room_name, status):
+        write_content_to_file(f"{chat_room_name} {status}")
+
+    def clear(self):
+        call_clear_content_post()
+
+
+class WXDevice:
+    """
+    通过Appium和adb操作手机上的微信, 所有操作共用WXSessionManager中的会话
+    """
+    def __init__(self, local_video_dir="/Users/xiezengtian/Desktop", sessions=None, adb=None):
+        """
+        :param local_video_dir: 视频拉取到本地的目录
+        :param sessions: WXSessionManager, 默认连接本机的Appium服务
+        :param adb: AdbDevice, 默认使用PATH中的adb
+        """
+        self.local_video_dir = local_video_dir
+        self.sessions = sessions if sessions is not None else WXSessionManager()
+        self.adb = adb if adb is not None else AdbDevice()
+
+    def close(self):
+        self.sessions.close()
+        self.adb.close()
+
+    def fetch_video(self, chat_room_name):
+        """
+        保存聊天中最后一个视频并拉取到本地
+        :return: (视频时长文本, 本地视频路径), 没有视频时返回None
+        """
+        # 会话中途失效时save_video会重新执行, 已完成的步骤记录在这里, 重新执行时跳过
+        done = {}
+
+        def save_video(wx_operator):
+            wx_operator.enter_chat_page(chat_room_name)
+            if 'video' not in done:
                 video_element = wx_operator.find_video_element()
-            except Exception as error:
-                print(error)
-                continue
-            if video_element:
-                try:
-                    video_text = video_element.text
-                    video_path = wx_operator.save_video(video_element)
-                    print(video_path)
-                    video_name = video_path.split('/')[-1]
-                    wx_operator.send_text_msg(f"{video_text} 视频AI分析中...请稍等")
-
-                    local_video_path = f"/Users/xiezengtian/Desktop/{video_name}"
-                    pull_file_from_device(video_path, local_video_path)
-
-                    # 启动AI视频分析
-                    response_msg, output_image_path = process_video_by_ai(local_video_path)
-                    output_image_name = output_image_path.split('/')[-1]
-
-                    # 推送图片到手机上
-                    push_file_to_device(output_image_path, f"/storage/emulated/0/Pictures/WeiXin/{output_image_name}")
-
-                    # 发送消息到手机上
-                    wx_operator = WXAppOperator()
-                    wx_operator.enter_chat_page(chat_room_name)
-                    wx_operator.send_text_msg(response_msg)
-                    wx_operator.send_first_image_msg()
-
-                    # 清理视频缓存
-                    clear_mp4_files_in_directory("/sdcard/DCIM/WeiXin/")
-                except Exception as error:
-                    print(error)
-                    # 完成任务，清理标记
-                    call_clear_content_post()
-                    # 发送消息到手机上
-                    wx_operator = WXAppOperator()
-                    wx_operator.enter_chat_page(chat_room_name)
-                    msg = F"Ops，出错了，晚点再试下😭"
-                    wx_operator.send_text_msg(msg)
-            else:
-                # 未找到视频文件
-                wx_operator = WXAppOperator()
-                wx_operator.enter_chat_page(chat_room_name)
-                msg = F"请发送30秒左右的网球视频"
+                if not video_element:
+                    return None
+                video_text = video_element.text
+                done['video'] = video_text, wx_operator.save_video(video_element)
+                print(done['video'][1])
+            if 'status_sent' not in done:
+                # 发送中途失效时无法确认是否已经发出, 状态消息只是提示, 重新执行时不再发送
+                done['status_sent'] = True
+                wx_operator.send_text_msg(f"{done['video'][0]} 视频AI分析中...请稍等")
+            return done['video']
+
+        video = self.sessions.run(save_video)
+        if video is None:
+            return None
+        video_text, video_path = video
+        video_name = video_path.split('/')[-1]
+        local_video_path = f"{self.local_video_dir}/{video_name}"
+        self.adb.pull(video_path, local_video_path)
+        return video_text, local_video_path
+
+    def send_text(self, chat_room_name, msg):
+        def send(wx_operator):
+            wx_operator.enter_chat_page(chat_room_name)
+            wx_operator.send_text_msg(msg)
+
+        self.sessions.run(send)
+
+    def send_result(self, chat_room_name, msg, image_path):
+        """
+        推送图片到手机上, 发送分析结果和图片, 然后清理视频缓存
+        """
+        image_name = image_path.split('/')[-1]
+        self.adb.push(image_path, f"/storage/emulated/0/Pictures/WeiXin/{image_name}")
+
+        # 会话中途失效重新执行时, 已经发出的文字不再发送
+        done = {}
+
+        def send(wx_operator):
+            wx_operator.enter_chat_page(chat_room_name)
+            if 'text_sent' not in done:
                 wx_operator.send_text_msg(msg)
-            # wx_operator.send_text_msg("msg")
-            wx_operator.close()
+                done['text_sent'] = True
+            wx_operator.send_first_image_msg()
 
-            # 完成任务，清理标记
-            call_clear_content_post()
-        else:
-            print("no task, keeping watching")
-            time.sleep(5)
+        self.sessions.run(send)
+
+        # 清理视频缓存, 结果已经发出, 清理失败不影响任务
+        try:
+            deleted = self.adb.clear_files("/sdcard/DCIM/WeiXin/", '*.mp4')
+            print(f"Deleted {len(deleted)} MP4 files")
+        except AdbError as error:
+            print(error)
+
+if __name__ == '__main__':
+    # 启动时加载并预热模型, 之后每个任务直接开始推理
+    registry.preload(yolo_model_paths=['yolov8x.pt'])
+    # 触发的任务立即排队并回复位置; 手机操作、本地推理和GPT请求各自限制并发, 不同用户的任务可以同时进行
+    # 所有任务共用一个Appium会话, 不再每次操作都重新启动微信
+    device = WXDevice()
+    # 同一个视频被多次转发时直接回复上次的结果
+    service = JobService(HttpTrigger(), device, render_action_image, review_action_image,
+                         store=JobStore('job_queue.json', max_pending=20), poll_interval=5,
+                         result_cache=create_result_cache())
+    try:
+        asyncio.run(service.run())
+    finally:
+        device.close()